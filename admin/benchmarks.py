@@ -0,0 +1,48 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+# Rows per second of the regular (ModelSerializer) and the read-only (ValuesSerializer, look in: serializers.py)
+#   list serializers. Every app has its own command, built on this one:
+#       python manage.py benchmark_user_serializers --rows 10000
+#       python manage.py benchmark_product_serializers --rows 10000
+#       python manage.py benchmark_order_serializers --rows 10000
+# Everything is seeded inside a transaction that is rolled back at the end, nothing stays in the DB.
+
+
+class SerializerBenchmarkCommand(BaseCommand):
+    help = 'Benchmark rows/sec of the model serializers against the values serializers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+
+    # seed that many rows.
+    def seed(self, rows):
+        raise NotImplementedError
+
+    # [(name, model serializer, values serializer, queryset)]
+    def cases(self):
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['rows'])
+
+            self.stdout.write('%10s %14s %14s %8s' % (
+                'serializer', 'model rows/s', 'values rows/s', 'speedup'))
+
+            for name, model_serializer, values_serializer, queryset in self.cases():
+                model_rate = self.rate(
+                    lambda: model_serializer(queryset, many=True).data)
+                values_rate = self.rate(
+                    lambda: values_serializer(values_serializer.values(queryset)).data)
+                self.stdout.write('%10s %14.0f %14.0f %7.1fx' % (
+                    name, model_rate, values_rate, values_rate / model_rate))
+
+            transaction.set_rollback(True)
+
+    def rate(self, serialize):
+        start = time.perf_counter()
+        count = len(serialize())
+        return count / (time.perf_counter() - start)
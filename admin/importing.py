@@ -0,0 +1,43 @@
+import json
+from rest_framework import exceptions
+
+
+# Shared by the bulk imports of users and orders (look in: users/importing.py, orders/importing.py):
+#   the content types of a JSONL body, reading the body line by line, and the ?batch_size parameter.
+
+JSONL_TYPES = ('application/jsonl', 'application/x-ndjson', 'application/json-lines')
+
+MAX_ERRORS = 1000  # <-- beyond that invalid rows are only counted.
+MAX_BATCH_SIZE = 5000
+
+
+# ?batch_size=500 <-- rows per batch, clamped to [1, MAX_BATCH_SIZE].
+def batch_size(request, default):
+    try:
+        size = int(request.GET.get('batch_size', default))
+    except ValueError:
+        raise exceptions.ValidationError({'batch_size': 'must be a number'})
+    return max(1, min(size, MAX_BATCH_SIZE))
+
+
+# the lines of the request body, as bytes.
+# request.data is never touched, so DRF doesn't parse (and buffer) the whole body,
+#   the rows are read from the stream one line at a time.
+def body_lines(request):
+    stream = request.stream
+    return iter(stream.readline, b'') if stream is not None else iter(())
+
+
+# (line number, parsed row) per non blank line, None <-- the line is not valid JSON.
+# offset <-- skip the lines up to (and including) that one, without parsing them.
+def jsonl_rows(lines, offset=0):
+    for number, line in enumerate(lines, start=1):
+        if number <= offset or not line.strip():
+            continue
+
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+
+        yield number, row
@@ -1,10 +1,164 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+import math
+from functools import partial
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections, transaction
+from django.db.models.signals import post_save, post_delete
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework.response import Response
 
 
 DEFAULT_PAGE = 1
 DEFAULT_PAGE_SIZE = 15
 
+# How the total count (last_page) of a page-number list is found:
+#   'exact' <-- SELECT COUNT(*) on every page, what Django does by default.
+#   'cached' <-- the exact count, cached for settings.PAGINATION_COUNT_CACHE_TTL seconds,
+#       and thrown away as soon as a row of that table is saved / deleted.
+#   'estimated' <-- the row count the database keeps in its table statistics (MySQL, PostgreSQL),
+#       only for a whole (unfiltered) table, anything else falls back to 'exact'.
+#       Statistics are often off (InnoDB TABLE_ROWS), so the estimate is only used for last_page,
+#       the page itself is fetched like 'has_next' and never cut short by it.
+#   'has_next' <-- no count at all, fetch one extra row to know if there is a next page.
+COUNT_MODES = ('exact', 'cached', 'estimated', 'has_next')
+
+
+############################################################################################
+##  Counting  ##############################################################################
+############################################################################################
+
+
+def _count_version_key(model):
+    return 'pagination-count-version:' + model._meta.db_table
+
+
+def invalidate_counts(model):
+    key = _count_version_key(model)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:  # <-- evicted meanwhile.
+        cache.set(key, 1, None)
+
+
+# a save / delete of a counted model throws away the cached counts of that table.
+# bulk_create / .update() / .delete() on a queryset don't send signals,
+#   code that uses them calls invalidate_counts(model) itself.
+# The signals come before the commit, a count cached in between would see the old rows,
+#   so the counts are thrown away once the change is committed.
+def _invalidate_counts_receiver(sender, raw=False, using=None, **kwargs):
+    if not raw:
+        transaction.on_commit(partial(invalidate_counts, sender), using=using)
+
+
+# connected per model, the first time that model is counted,
+#   a receiver for every model would stop Django from fast deleting anything.
+def watch_counts(model):
+    uid = 'pagination_invalidate_counts:' + model._meta.label
+    post_save.connect(_invalidate_counts_receiver, sender=model,
+                      dispatch_uid=uid)
+    post_delete.connect(_invalidate_counts_receiver, sender=model,
+                        dispatch_uid=uid)
+
+
+def cached_count(queryset):
+    watch_counts(queryset.model)
+
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except Exception:  # <-- EmptyResultSet and friends, let COUNT deal with it.
+        return queryset.count()
+
+    version = cache.get(_count_version_key(queryset.model), 0)
+    digest = hashlib.md5((sql + repr(params)).encode()).hexdigest()
+    key = 'pagination-count:%s:%s:%s' % (
+        queryset.model._meta.db_table, version, digest)
+
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, getattr(
+            settings, 'PAGINATION_COUNT_CACHE_TTL', 60))
+    return count
+
+
+def estimated_count(queryset):
+    # statistics are per table, a filtered (or combined, UNION) queryset needs a real count.
+    if queryset.query.where or queryset.query.distinct or queryset.query.combinator:
+        return queryset.count()
+
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    estimate = None
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s', [table])
+            row = cursor.fetchone()
+            estimate = row[0] if row else None
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+            row = cursor.fetchone()
+            estimate = row[0] if row else None
+
+    # no statistics (yet), sqlite, ...
+    if estimate is None or estimate < 0:
+        return queryset.count()
+    return estimate
+
+
+class CountingPaginator(DjangoPaginator):
+
+    def __init__(self, *args, count_mode='exact', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_mode = count_mode
+
+    @cached_property
+    def count(self):
+        if self.count_mode == 'cached':
+            return cached_count(self.object_list)
+        return super().count
+
+
+# Cursor (keyset) pagination.
+# Page numbers need a COUNT(*) and an OFFSET, both get slower the deeper the page is.
+# A cursor remembers where the previous page ended: WHERE id > <last id> ORDER BY id LIMIT <page size>,
+#   so every page costs the same, no matter how deep it is.
+# The cursor itself is opaque (base64) and comes ready to use in the 'next' / 'previous' links.
+# Which column to walk over:
+#   view.cursor_ordering = 'id' | '-created_at' | ... (default: 'id').
+class CustomCursorPagination(CursorPagination):
+    page_size = DEFAULT_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    ordering = 'id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', self.ordering)
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'data': data,  # query results, just as many as can fit the page.
+            'meta': {  # page details.
+                'pagination': 'cursor',
+
+                # full urls, that already contain the ?cursor= of the next / previous page (or None).
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link(),
+
+                'page_size': str(self.page_size) + ' results'
+            }
+        })
+
 
 class CustomPagination(PageNumberPagination):
     # page = DEFAULT_PAGE  # <-- This variable name should not be used !
@@ -13,7 +167,75 @@ class CustomPagination(PageNumberPagination):
     # how to name the variable that points at page number.
     page_size_query_param = 'page_size'
 
+    # Page numbers by default, cursor pagination when:
+    #   the view asks for it: pagination_mode = 'cursor',
+    #   or the request does: ?pagination=cursor (or simply comes with a ?cursor=).
+    # ?pagination=page <-- page numbers, even on a view that prefers cursors.
+    cursor_pagination_class = CustomCursorPagination
+    cursor_paginator = None
+
+    # ?count_mode= or view.count_mode or settings.PAGINATION_COUNT_MODE, one of COUNT_MODES (look above).
+    count_mode = None
+    has_next = None
+    estimated_pages = None
+
+    def get_count_mode(self, request, view):
+        mode = request.query_params.get('count_mode') or getattr(view, 'count_mode', None) \
+            or getattr(settings, 'PAGINATION_COUNT_MODE', 'exact')
+        if mode not in COUNT_MODES:
+            raise ValidationError('count_mode must be one of: ' + ', '.join(COUNT_MODES))
+        return mode
+
+    def use_cursor(self, request, view):
+        mode = request.query_params.get('pagination')
+        if mode is None and 'cursor' in request.query_params:
+            mode = 'cursor'
+        if mode is None:
+            mode = getattr(view, 'pagination_mode', 'page')
+        return mode == 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request, view):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+
+        self.cursor_paginator = None
+        self.count_mode = self.get_count_mode(request, view)
+
+        if self.count_mode in ('has_next', 'estimated'):
+            page = self.paginate_without_count(queryset, request)
+            if self.count_mode == 'estimated':
+                self.estimated_pages = math.ceil(estimated_count(queryset) / self.get_page_size(request))
+            return page
+
+        self.django_paginator_class = partial(
+            CountingPaginator, count_mode=self.count_mode)
+        return super().paginate_queryset(queryset, request, view)
+
+    # LIMIT page_size + 1, if that extra row exists - there is a next page.
+    def paginate_without_count(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        try:
+            page_number = int(request.query_params.get(
+                self.page_query_param, DEFAULT_PAGE))
+        except ValueError:
+            raise NotFound('Invalid page.')
+        if page_number < 1:
+            raise NotFound('Invalid page.')
+
+        offset = (page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        if not rows and page_number > 1:
+            raise NotFound('Invalid page.')
+
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
     def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
 
         # Testing:
         # print('LOG: CustomPagination: page=', self.page)
@@ -21,10 +243,33 @@ class CustomPagination(PageNumberPagination):
         # test = self.request.GET.get('page_size')
         # print('LOG: CustomPagination: test=', test)
 
+        if self.count_mode in ('has_next', 'estimated'):
+            page = int(self.request.GET.get('page', DEFAULT_PAGE))
+
+            # unknown, that is the point of 'has_next'.
+            last_page = None
+            if self.count_mode == 'estimated':
+                # the estimate, but never before a page that is known to exist.
+                last_page = max(self.estimated_pages, page + 1 if self.has_next else page)
+
+            return Response({
+                'data': data,
+                'meta': {
+                    'count_mode': self.count_mode,
+                    'last_page': last_page,
+                    'has_next': self.has_next,
+                    'page': page,
+                    'page_size': str(self.get_page_size(self.request)) + ' results'
+                }
+            })
+
         return Response({
             'data': data,  # query results, just as many as can fit the page.
             'meta': {  # page details.
 
+                # which COUNT_MODES was used to find last_page.
+                'count_mode': self.count_mode,
+
                 # how many pages will be.
                 # use the built-in .page function to get the. num_page
                 'last_page': self.page.paginator.num_pages,
@@ -194,3 +194,67 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # Cors validation.
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_CREDENTIALS = True
+
+# JWT.
+# embed the role id and the security stamp of the user in the access token,
+# so authentication skips the per-request user query (look in: users/authentication.py).
+JWT_SELF_CONTAINED_CLAIMS = False
+# seconds a security stamp is trusted before it is fetched again.
+JWT_STAMP_CACHE_TTL = 30
+# how many decoded access tokens to keep, 0 <-- verify the signature on every request.
+JWT_DECODED_TOKEN_CACHE_SIZE = 1024
+
+# Password hashing pool (look in: users/hashing.py).
+# how many passwords are hashed at the same time.
+PASSWORD_HASHING_WORKERS = 4
+# how many more may wait for a free worker, beyond that requests get a 503.
+PASSWORD_HASHING_MAX_PENDING = 32
+# seconds a request waits for its hash.
+PASSWORD_HASHING_TIMEOUT = 30
+
+# Token lifetimes.
+# minutes, after that the client asks for a new access token with the refresh token.
+JWT_ACCESS_TOKEN_LIFETIME = 15
+# days, after that the client has to log in again.
+JWT_REFRESH_TOKEN_LIFETIME = 14
+# also write revoked refresh tokens to the database, so revocations survive a restart.
+JWT_DENYLIST_DB_MIRROR = False
+
+# how many users a bulk import writes per INSERT (look in: users/importing.py).
+USER_IMPORT_BATCH_SIZE = 500
+
+# Pagination (look in: admin/pagination.py).
+# how list endpoints count their rows: 'exact', 'cached', 'estimated' or 'has_next'.
+PAGINATION_COUNT_MODE = 'exact'
+# seconds a 'cached' count is kept (it is also thrown away on any write to the table).
+PAGINATION_COUNT_CACHE_TTL = 60
+
+# how many orders an export reads per query (look in: orders/exports.py).
+EXPORT_CHUNK_SIZE = 2000
+# start a worker process for every export job, turn off when 'manage.py run_export_jobs --loop' runs instead.
+EXPORT_JOBS_SPAWN_WORKER = True
+# hours a finished export job (and its file) is kept, older ones are deleted by the export worker.
+EXPORT_JOBS_RETENTION_HOURS = 24
+# seconds without progress after which a running export job is considered dead, and run again.
+EXPORT_JOBS_STALE_AFTER = 300
+
+# seconds a sales chart is cached (look in: orders/charts.py), it is also thrown away on any order write.
+CHART_CACHE_TTL = 300
+
+# most orders a single POST /api/orders/batch may create (look in: orders/views.py).
+ORDER_BATCH_MAX_SIZE = 1000
+
+# how many orders an import creates per transaction (look in: orders/importing.py).
+ORDER_IMPORT_BATCH_SIZE = 500
+
+# Archiving (look in: orders/archiving.py).
+# orders older than that many days are moved to the archive tables by 'manage.py archive_orders'.
+ORDER_ARCHIVE_AFTER_DAYS = 365
+# how many orders are archived per transaction.
+ORDER_ARCHIVE_BATCH_SIZE = 1000
+
+# Uploads (look in: products/uploads.py).
+# bytes, the biggest file an upload may be, bigger ones are refused (413) before they are read.
+UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+# bytes, an upload is read, hashed and written to disk that much at a time.
+UPLOAD_CHUNK_SIZE = 64 * 1024
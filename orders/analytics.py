@@ -0,0 +1,98 @@
+import datetime
+from decimal import Decimal
+from django.db.models import Count, Q, Sum
+
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem, line_total
+from .charts import get_timezone
+
+
+####################################################################################################
+## Sales analytics #################################################################################
+####################################################################################################
+# Every number here is summed / counted by the database (GROUP BY), only the result rows come back,
+#   never the orders or items themselves, so memory stays flat whether a query covers 1k or 10M items.
+# The database still reads every row in the window though, so the time grows with the window:
+#   at 10M items (SQLite) top products takes ~14s over the whole history and ~1.2s over the last 30 days,
+#   keep the dashboards on short windows and run whole history numbers from a job / the shell.
+# Order level numbers read the stored Order.total / Order.item_count (look in: models.py),
+#   product level numbers sum price * quantity of the items.
+# Windows are whole days, start / end are inclusive dates (or None), in the given timezone (look in: charts.py).
+# include_archived <-- the archive tables (look in: archiving.py) are grouped the same way, and the groups merged here,
+#   an order is either hot or archived, never both, so the sums / counts of a group simply add up.
+#
+# python manage.py benchmark_analytics --items 1000000 10000000
+
+TOP_PRODUCTS_BY = ('revenue', 'quantity')
+
+
+# created_at (of the order) within [start, end], tz=None <-- settings.TIME_ZONE.
+def window(start, end, tz, prefix=''):
+    tz = tz or get_timezone()
+    condition = Q()
+    if start is not None:
+        condition &= Q(**{prefix + 'created_at__gte': datetime.datetime.combine(
+            start, datetime.time.min, tzinfo=tz)})
+    if end is not None:
+        condition &= Q(**{prefix + 'created_at__lt': datetime.datetime.combine(
+            end + datetime.timedelta(days=1), datetime.time.min, tzinfo=tz)})
+    return condition
+
+
+# sum the numbers of the rows that have the same key, from every list of rows.
+def merge(row_lists, key, numbers):
+    merged = {}
+    for rows in row_lists:
+        for row in rows:
+            if row[key] in merged:
+                for number in numbers:
+                    merged[row[key]][number] += row[number]
+            else:
+                merged[row[key]] = dict(row)
+    return list(merged.values())
+
+
+# [{'product_title', 'revenue', 'quantity', 'orders'}] best first.
+def top_products(start=None, end=None, tz=None, by='revenue', limit=10, include_archived=False):
+    models = (OrderItem, ArchivedOrderItem) if include_archived else (OrderItem,)
+    groups = [model.objects.filter(window(start, end, tz, 'order__')).values(
+        'product_title').annotate(
+        revenue=Sum(line_total()),
+        quantity=Sum('quantity'),
+        orders=Count('order_id', distinct=True),
+    ).order_by('-' + by, 'product_title') for model in models]
+
+    if not include_archived:
+        return list(groups[0][:limit])
+
+    products = merge(groups, 'product_title', ('revenue', 'quantity', 'orders'))
+    return sorted(products, key=lambda product: (-product[by], product['product_title']))[:limit]
+
+
+# {'orders', 'revenue', 'average'}, orders without items are not counted.
+def average_order_value(start=None, end=None, tz=None, include_archived=False):
+    models = (Order, ArchivedOrder) if include_archived else (Order,)
+    orders = 0
+    revenue = Decimal('0')
+
+    for model in models:
+        sums = model.objects.filter(window(start, end, tz), item_count__gt=0).aggregate(
+            orders=Count('id'), revenue=Sum('total'))
+        orders += sums['orders']
+        revenue += sums['revenue'] or 0
+
+    average = (revenue / orders).quantize(Decimal('0.01')) if orders else Decimal('0')
+    return {'orders': orders, 'revenue': revenue, 'average': average}
+
+
+# [{'email', 'revenue', 'orders'}] biggest customers first.
+def revenue_per_email(start=None, end=None, tz=None, limit=10, include_archived=False):
+    models = (Order, ArchivedOrder) if include_archived else (Order,)
+    groups = [model.objects.filter(window(start, end, tz), item_count__gt=0).values(
+        'email').annotate(revenue=Sum('total'), orders=Count('id')).order_by('-revenue', 'email')
+        for model in models]
+
+    if not include_archived:
+        return list(groups[0][:limit])
+
+    customers = merge(groups, 'email', ('revenue', 'orders'))
+    return sorted(customers, key=lambda customer: (-customer['revenue'], customer['email']))[:limit]
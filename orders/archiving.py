@@ -0,0 +1,98 @@
+import datetime
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from admin.pagination import invalidate_counts, watch_counts
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+from .rollup import day_of, refresh_days
+from .charts import invalidate_chart
+from .signals import order_deleted, order_item_deleted
+
+
+####################################################################################################
+## Archiving old orders ############################################################################
+####################################################################################################
+# Orders (with their items) older than settings.ORDER_ARCHIVE_AFTER_DAYS move to the archive tables (look in: models.py),
+#   the lists, exports, the chart and analytics read the hot tables only, unless asked for ?include_archived=1.
+# The oldest orders go first, a batch per transaction:
+#   1. the orders of the batch are locked (nothing can add an item to them meanwhile),
+#   2. orders and items are copied to the archive, as they are (same ids),
+#   3. and deleted from the hot tables,
+#   4. the daily sales of those days are re-summed, without them (the rollup holds hot orders only, look in: rollup.py).
+# A batch is archived as a whole or not at all, so a run that stops half way is simply started again.
+#
+# Per month partitions (MySQL PARTITION BY RANGE) would need the foreign key of orders_orderitem dropped,
+#   InnoDB does not partition tables with foreign keys, so plain archive tables are used instead.
+#
+# python manage.py archive_orders --older-than-days 365
+
+ORDER_FIELDS = [field.attname for field in Order._meta.concrete_fields]
+ITEM_FIELDS = [field.attname for field in OrderItem._meta.concrete_fields]
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 365)
+    return timezone.now() - datetime.timedelta(days=days)
+
+
+def archivable(cutoff):
+    return Order.objects.filter(created_at__lt=cutoff)
+
+
+# The post_delete receivers of orders and items, disconnected while a batch is deleted:
+#   they would re-sum the totals of every deleted item, and the day of every deleted order, one at a time,
+#   that is done once for the whole batch instead. With no receivers left Django deletes the batch with a
+#   plain DELETE (orders and their items, 2 queries), instead of loading every row to send its signal.
+# Disconnecting is process wide, archive_orders runs in a process of its own (look in: management/commands),
+#   don't call archive_batch() from a web process, the requests it serves meanwhile would skip those receivers too.
+@contextmanager
+def delete_receivers_disconnected():
+    receivers = [(order_item_deleted, OrderItem), (order_deleted, Order)]
+    disconnected = [(receiver, sender) for receiver, sender in receivers
+                    if post_delete.disconnect(receiver, sender=sender)]
+    # the cached counts receiver (look in: admin/pagination.py), connected once the table was counted.
+    counted = [model for model in (OrderItem, Order) if post_delete.disconnect(
+        sender=model, dispatch_uid='pagination_invalidate_counts:' + model._meta.label)]
+
+    try:
+        yield
+    finally:
+        for receiver, sender in disconnected:
+            post_delete.connect(receiver, sender=sender)
+        for model in counted:
+            watch_counts(model)
+
+
+# archives the oldest batch_size orders created before cutoff, returns how many were archived.
+def archive_batch(cutoff, batch_size=None):
+    batch_size = batch_size or getattr(settings, 'ORDER_ARCHIVE_BATCH_SIZE', 1000)
+    archived_at = timezone.now()
+
+    with transaction.atomic():
+        orders = list(archivable(cutoff).order_by('created_at', 'id').select_for_update()
+                      .values(*ORDER_FIELDS)[:batch_size])
+        if not orders:
+            return 0
+
+        order_ids = [order['id'] for order in orders]
+        items = OrderItem.objects.filter(order_id__in=order_ids).values(*ITEM_FIELDS)
+
+        ArchivedOrder.objects.bulk_create(
+            [ArchivedOrder(archived_at=archived_at, **order) for order in orders])
+        ArchivedOrderItem.objects.bulk_create(
+            (ArchivedOrderItem(**item) for item in items.iterator()), batch_size=1000)
+
+        # the items go along with their orders (on_delete=CASCADE).
+        with delete_receivers_disconnected():
+            Order.objects.filter(id__in=order_ids).delete()
+
+        refresh_days(day_of(order['created_at']) for order in orders)
+
+    invalidate_counts(Order)
+    invalidate_counts(OrderItem)
+    invalidate_chart()
+    return len(orders)
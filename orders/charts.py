@@ -0,0 +1,92 @@
+import datetime
+import zoneinfo
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import DateField, Sum
+from django.db.models.functions import Trunc
+
+from .models import OrderItem, ArchivedOrderItem, DailySales, TOTAL_FIELD, line_total
+
+
+####################################################################################################
+## The sales chart #################################################################################
+####################################################################################################
+# Sum of orders per day / week / month, in the ORM only, so it runs on any database (MySQL, SQLite, ...).
+#   UTC <-- read from the daily sales rollup (look in: rollup.py), a row per day.
+#   any other timezone <-- the rollup days are UTC days, so the items are summed again, grouped in that timezone.
+# A period is named by its first day, weeks start on Monday.
+# Archived orders (look in: archiving.py) are left out, unless include_archived, their items are summed on top then.
+#
+# Results are cached, under a version that every order write bumps (look in: signals.py),
+#   a write makes every cached chart stale at once, without knowing their keys.
+
+GRANULARITIES = ('day', 'week', 'month')
+
+_VERSION_KEY = 'sales-chart-version'
+
+
+def invalidate_chart():
+    cache.add(_VERSION_KEY, 0, None)
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:  # <-- evicted meanwhile.
+        cache.set(_VERSION_KEY, 1, None)
+
+
+# tz=None <-- settings.TIME_ZONE.
+def get_timezone(name=None):
+    return zoneinfo.ZoneInfo(name or settings.TIME_ZONE)
+
+
+# [{'date': 'YYYY-MM-DD', 'sum': Decimal}, ...] ordered by date, start / end are inclusive dates (or None).
+def sales_chart(granularity='day', tz=None, start=None, end=None, include_archived=False):
+    tz = tz or get_timezone()
+    key = 'sales-chart:%s:%s:%s:%s:%s:%d' % (
+        cache.get(_VERSION_KEY, 0), granularity, tz.key, start, end, include_archived)
+
+    data = cache.get(key)
+    if data is None:
+        if tz.key == 'UTC' or not settings.USE_TZ:
+            periods = _from_rollup(granularity, start, end)
+        else:
+            periods = _from_items(granularity, tz, start, end)
+
+        sums = dict(periods)
+        if include_archived:
+            for period, total in _from_items(granularity, tz, start, end, ArchivedOrderItem.objects.all()):
+                sums[period] = sums.get(period, 0) + total
+
+        data = [{'date': period.isoformat(), 'sum': sums[period]} for period in sorted(sums)]
+        cache.set(key, data, getattr(settings, 'CHART_CACHE_TTL', 300))
+
+    return data
+
+
+def _from_rollup(granularity, start, end):
+    days = DailySales.objects.all()
+    if start is not None:
+        days = days.filter(date__gte=start)
+    if end is not None:
+        days = days.filter(date__lte=end)
+
+    if granularity == 'day':
+        return days.order_by('date').values_list('date', 'total')
+
+    return days.annotate(period=Trunc('date', granularity)).values('period').annotate(
+        sum=Sum('total')).order_by('period').values_list('period', 'sum')
+
+
+def _from_items(granularity, tz, start, end, items=None):
+    items = OrderItem.objects.all() if items is None else items
+    if start is not None:
+        items = items.filter(order__created_at__gte=datetime.datetime.combine(
+            start, datetime.time.min, tzinfo=tz))
+    if end is not None:
+        items = items.filter(order__created_at__lt=datetime.datetime.combine(
+            end + datetime.timedelta(days=1), datetime.time.min, tzinfo=tz))
+
+    return items.annotate(
+        period=Trunc('order__created_at', granularity, output_field=DateField(), tzinfo=tz),
+    ).values('period').annotate(
+        sum=Sum(line_total(), output_field=TOTAL_FIELD),
+    ).order_by('period').values_list('period', 'sum')
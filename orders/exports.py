@@ -0,0 +1,172 @@
+import io
+import csv
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+
+try:
+    import pyarrow
+except ImportError:  # <-- optional, the columnar export falls back to JSON batches.
+    pyarrow = None
+
+
+# Exporting orders, without ever holding all of them (or the whole file) in memory:
+#   orders are read in chunks, ordered by id - every chunk starts where the previous one ended (WHERE id > ?),
+#   the items of a whole chunk come with one more query (prefetch_related),
+#   so an export costs 2 queries per chunk, no matter how many orders exist.
+# Every chunk is turned into text and handed out (yield) right away.
+
+CSV_HEADER = ['ID', 'Name', 'Email', 'Product Title', 'Price', 'Quantity']
+
+
+def chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+# yields lists of orders (with their order_items prefetched), chunk by chunk.
+# include_archived <-- the archived orders follow the hot ones (look in: archiving.py).
+def iter_order_chunks(size=None, include_archived=False):
+    size = size or chunk_size()
+    models = [(Order, OrderItem)]
+    if include_archived:
+        models.append((ArchivedOrder, ArchivedOrderItem))
+
+    for order_model, item_model in models:
+        items = Prefetch('order_items', queryset=item_model.objects.order_by('id'))
+        last_id = 0
+
+        while True:
+            orders = list(order_model.objects.filter(id__gt=last_id).order_by(
+                'id').prefetch_related(items)[:size])
+            if not orders:
+                break
+
+            yield orders
+            last_id = orders[-1].id
+
+
+# csv.writer wants a file, this one hands back whatever is written to it.
+class Echo:
+    def write(self, value):
+        return value
+
+
+# an order row, then a row for each of its items.
+def order_csv_rows(order):
+    yield [order.id, order.name, order.email, '', '', '']
+
+    for item in order.order_items.all():
+        yield ['', '', '', item.product_title, item.price, item.quantity]
+
+
+def stream_csv(size=None, include_archived=False):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+
+    for orders in iter_order_chunks(size, include_archived):
+        yield ''.join(writer.writerow(row) for order in orders for row in order_csv_rows(order))
+
+
+####################################################################################################
+## Flat tables (jsonl / columnar) ##################################################################
+####################################################################################################
+# Orders and items as two separate, flat, tables (?table=orders|items), for the analytics jobs.
+# Rows are read the same way, keyset chunks of chunk_size() rows, and each chunk is written as one batch:
+#   jsonl <-- a JSON object per row.
+#   columnar <-- Arrow IPC stream (a record batch per chunk), when pyarrow is installed,
+#       otherwise a JSON object per chunk, {column: [values]}, one per line.
+# Decimals are written as strings in JSON (no float rounding), datetimes in ISO 8601 (UTC).
+
+TABLES = {
+    'orders': (Order, ('id', 'first_name', 'last_name', 'email', 'created_at', 'total', 'item_count')),
+    'items': (OrderItem, ('id', 'order_id', 'product_title', 'price', 'quantity', 'created_at')),
+}
+ARCHIVE_TABLES = {
+    'orders': ArchivedOrder,
+    'items': ArchivedOrderItem,
+}
+
+
+def columnar_format():
+    return 'arrow' if pyarrow is not None else 'json'
+
+
+# yields lists of row tuples (in the order of TABLES[table] columns), chunk by chunk.
+def iter_row_chunks(table, size=None, include_archived=False):
+    size = size or chunk_size()
+    model, columns = TABLES[table]
+    models = [model, ARCHIVE_TABLES[table]] if include_archived else [model]
+
+    for model in models:
+        last_id = 0
+
+        while True:
+            rows = list(model.objects.filter(id__gt=last_id).order_by(
+                'id').values_list(*columns)[:size])
+            if not rows:
+                break
+
+            yield rows
+            last_id = rows[-1][0]
+
+
+def stream_jsonl(table, size=None, include_archived=False):
+    columns = TABLES[table][1]
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+    for rows in iter_row_chunks(table, size, include_archived):
+        yield ''.join(encoder.encode(dict(zip(columns, row))) + '\n' for row in rows)
+
+
+def stream_columnar(table, size=None, include_archived=False):
+    if pyarrow is not None:
+        return _stream_arrow(table, size, include_archived)
+    return _stream_columnar_json(table, size, include_archived)
+
+
+def _stream_columnar_json(table, size, include_archived):
+    columns = TABLES[table][1]
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+    for rows in iter_row_chunks(table, size, include_archived):
+        yield encoder.encode(dict(zip(columns, map(list, zip(*rows))))) + '\n'
+
+
+def arrow_schema(table):
+    types = {
+        'id': pyarrow.int64(),
+        'order_id': pyarrow.int64(),
+        'first_name': pyarrow.string(),
+        'last_name': pyarrow.string(),
+        'email': pyarrow.string(),
+        'product_title': pyarrow.string(),
+        'created_at': pyarrow.timestamp('us', tz='UTC'),
+        'total': pyarrow.decimal128(14, 2),
+        'price': pyarrow.decimal128(10, 2),
+        'item_count': pyarrow.int64(),
+        'quantity': pyarrow.int64(),
+    }
+    return pyarrow.schema([(column, types[column]) for column in TABLES[table][1]])
+
+
+# the IPC stream is written into a buffer, everything written so far is handed out after every batch.
+def _stream_arrow(table, size, include_archived):
+    schema = arrow_schema(table)
+    sink = io.BytesIO()
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        for rows in iter_row_chunks(table, size, include_archived):
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+                schema=schema))
+            yield drain()
+
+    yield drain()  # <-- the end of stream marker.
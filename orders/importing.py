@@ -0,0 +1,112 @@
+import time
+from django.db import DatabaseError
+from rest_framework import serializers
+
+from admin.importing import MAX_ERRORS, jsonl_rows
+from .serializers import OrderImportSerializer
+from .ingest import create_orders
+
+
+# Bulk import of orders from a JSONL body / file, one order (with its items) per line:
+#   {"first_name": ?, "last_name": ?, "email": ?, "created_at": ?, "order_items": [{"product_title": ?, "price": ?, "quantity": ?}]}
+# created_at is optional (now, when missing), history keeps its dates: the chart, analytics and archiving all go by it.
+# Lines are read one at a time, never the whole file, every line is validated on its own (OrderImportSerializer),
+#   valid orders are collected into batches, and each batch is created in one transaction (look in: ingest.py).
+# Memory stays bounded: at most one batch of orders, and MAX_ERRORS error reports, are held at any time.
+#
+# Resuming: 'offset' in the report is the last line that is done (created, or rejected as invalid),
+#   if the import stops half way (a database error, a dropped connection) it is started again from there,
+#   nothing is created twice, the lines up to the offset are skipped without being parsed.
+
+
+class OrderImport:
+
+    def __init__(self, batch_size=500, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress  # <-- called with the report, after every batch.
+        self.created = 0
+        self.failed = 0
+        self.errors = []  # <-- [{'row': ?, 'errors': {field: message}}]
+        self.error = None  # <-- what stopped the import, if anything did.
+        self.offset = 0
+        self._seen = 0  # <-- the last line added (valid or not).
+        self._batch = []  # <-- [validated data]
+        # one serializer validates every line, building its fields per line costs more than the validation itself.
+        self._serializer = OrderImportSerializer()
+        self._started = time.perf_counter()
+
+    ####################
+    ## Reading rows  ###
+    ####################
+
+    jsonl_rows = staticmethod(jsonl_rows)  # <-- look in: admin/importing.py.
+
+    def run(self, rows, offset=0):
+        self.offset = self._seen = offset
+
+        try:
+            for number, row in rows:
+                self.add(number, row)
+            self.flush()
+        except DatabaseError as error:
+            # the batch was rolled back, 'offset' still points at the last batch that made it.
+            self.error = str(error)
+
+        return self
+
+    ####################
+    ## Validation  #####
+    ####################
+
+    def add(self, number, row):
+        self._seen = number
+
+        if not isinstance(row, dict):
+            self.reject(number, {'row': 'Not a valid row.'})
+            return
+
+        try:
+            validated_data = self._serializer.run_validation(row)
+        except serializers.ValidationError as error:
+            self.reject(number, error.detail)
+            return
+
+        self._batch.append(validated_data)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def reject(self, number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'row': number, 'errors': errors})
+
+    ####################
+    ## Writing  ########
+    ####################
+
+    def flush(self):
+        batch, self._batch = self._batch, []
+        if not batch and self.offset == self._seen:
+            return
+
+        if batch:
+            create_orders(batch)
+            self.created += len(batch)
+
+        self.offset = self._seen
+        if self.progress is not None:
+            self.progress(self.report())
+
+    def rows_per_second(self):
+        seconds = time.perf_counter() - self._started
+        return round(self.created / seconds, 1) if seconds > 0 else None
+
+    def report(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'offset': self.offset,
+            'rows_per_second': self.rows_per_second(),
+            'error': self.error,
+            'errors': self.errors,
+        }
@@ -0,0 +1,58 @@
+from django.db import connection, transaction
+
+from admin.pagination import invalidate_counts
+from .models import Order, OrderItem
+from .rollup import day_of, refresh_days
+from .charts import invalidate_chart
+
+
+# Create orders together with their items, from already validated data (look in: serializers.py):
+#   [{'first_name': ?, 'last_name': ?, 'email': ?, 'order_items': [{'product_title': ?, 'price': ?, 'quantity': ?}]}]
+#   'created_at' <-- optional (imports, look in: importing.py), now when missing.
+# All in one transaction, either every order is created or none of them:
+#   1. the orders, with their total / item_count already summed here, one bulk_create
+#       (one INSERT per order on databases that can't return the new ids from a bulk insert, MySQL),
+#   2. the items of all the orders, one bulk_create,
+#   3. the daily sales of the days involved (look in: rollup.py).
+# bulk_create sends no signals (look in: signals.py), so everything those would do is done here.
+
+
+def create_orders(orders_data):
+    orders = []
+    items = []
+    created_at = []  # <-- [(order, given created_at)]
+
+    for data in orders_data:
+        data = dict(data)
+        order_items = data.pop('order_items', [])
+
+        order = Order(**data)
+        if order.created_at is not None:
+            created_at.append((order, order.created_at))
+        order.total = sum((item['price'] * item['quantity'] for item in order_items), 0)
+        order.item_count = len(order_items)
+        orders.append((order, order_items))
+
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Order.objects.bulk_create([order for order, _ in orders])
+        else:
+            for order, _ in orders:
+                order.save()
+
+        # auto_now_add overwrote the given created_at on insert, one UPDATE puts them back.
+        if created_at:
+            for order, value in created_at:
+                order.created_at = value
+            Order.objects.bulk_update([order for order, _ in created_at], ['created_at'], batch_size=1000)
+
+        for order, order_items in orders:
+            items.extend(OrderItem(order=order, **item) for item in order_items)
+        OrderItem.objects.bulk_create(items, batch_size=1000)
+
+        refresh_days(day_of(order.created_at) for order, order_items in orders if order_items)
+
+    invalidate_counts(Order)
+    invalidate_chart()
+
+    return [order for order, _ in orders]
@@ -0,0 +1,183 @@
+import os
+import csv
+import sys
+import glob
+import time
+import uuid
+import datetime
+import subprocess
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Order, ExportJob
+from .exports import CSV_HEADER, Echo, iter_order_chunks, order_csv_rows
+
+
+# Background exports, a big export would tie up a web worker for minutes, instead:
+#   1. POST creates an ExportJob (pending),
+#   2. a local worker process picks it up (python manage.py run_export_jobs <id>), no broker needed,
+#       it writes the file under MEDIA_ROOT/exports/ chunk by chunk, and records the progress on the job,
+#       then it runs every other pending job too, and only exits once none is left (drains the queue),
+#   3. the client polls the job status, and downloads the file once it is done (Range requests supported).
+# The files are NOT public: MEDIA_ROOT is served, except exports/ (look in: products/views.py, serve_media),
+#   they are only downloaded through the job, by an authenticated user.
+#
+# Housekeeping, done by every worker when it starts (and on every round of --loop):
+#   finished jobs older than settings.EXPORT_JOBS_RETENTION_HOURS are deleted, along with their files,
+#   running jobs without a heartbeat for settings.EXPORT_JOBS_STALE_AFTER seconds (the worker died)
+#       go back to pending, and are run again from the start.
+
+
+def create_job():
+    job = ExportJob.objects.create(
+        file='exports/orders-%s.csv' % uuid.uuid4().hex)
+
+    if getattr(settings, 'EXPORT_JOBS_SPAWN_WORKER', True) and not worker_active(job):
+        spawn_worker(job)
+
+    return job
+
+
+# Not a worker per job, N quick POSTs would be N full exports at the same time on the web host.
+# A new job is left to the worker that is already there, one that will drain the queue:
+#   a job is running (with a fresh heartbeat) <-- its worker looks for pending jobs once it is done,
+#       only AFTER it finished, so a job created while it still runs is never left behind,
+#   an older job is pending <-- its worker is still starting up.
+# A job that has been pending for settings.EXPORT_JOBS_STALE_AFTER seconds lost its worker
+#   (it died before claiming anything), that one does not count, a new worker is spawned and drains it too.
+def worker_active(job):
+    stale_after = getattr(settings, 'EXPORT_JOBS_STALE_AFTER', 300)
+    cutoff = timezone.now() - datetime.timedelta(seconds=stale_after)
+
+    return ExportJob.objects.filter(
+        Q(status=ExportJob.RUNNING, heartbeat_at__gte=cutoff)
+        | Q(status=ExportJob.PENDING, id__lt=job.id, created_at__gte=cutoff)).exists()
+
+
+def pending_job_ids():
+    return list(ExportJob.objects.filter(
+        status=ExportJob.PENDING).order_by('id').values_list('id', flat=True))
+
+
+# a separate process, in its own session - it outlives the request (and the web worker) that started it.
+def spawn_worker(job):
+    subprocess.Popen(
+        [sys.executable, str(settings.BASE_DIR / 'manage.py'),
+         'run_export_jobs', str(job.id)],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True)
+
+
+def file_path(job):
+    return os.path.join(settings.MEDIA_ROOT, job.file)
+
+
+# the job was taken away from this worker (look in: requeue_stale_jobs).
+class JobLost(Exception):
+    pass
+
+
+# record the progress, only while this worker still owns the job (started_at is its claim),
+#   False <-- the job was requeued as stale meanwhile, someone else runs it now.
+def save_progress(job, **fields):
+    fields['heartbeat_at'] = timezone.now()
+    return bool(ExportJob.objects.filter(
+        id=job.id, status=ExportJob.RUNNING, started_at=job.started_at).update(**fields))
+
+
+def run_job(job_id):
+    # claim the job, only one worker gets to run it.
+    now = timezone.now()
+    claimed = ExportJob.objects.filter(id=job_id, status=ExportJob.PENDING).update(
+        status=ExportJob.RUNNING, started_at=now, heartbeat_at=now)
+    if not claimed:
+        return None
+
+    job = ExportJob.objects.get(id=job_id)
+    path = file_path(job)
+    # renamed once complete, a download never sees half a file.
+    # the name is per worker, a stale worker that wakes up never writes into its successor's file.
+    partial_path = '%s.%s.part' % (path, uuid.uuid4().hex)
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        job.total_rows = Order.objects.count()
+        if not save_progress(job, total_rows=job.total_rows):
+            raise JobLost()
+
+        writer = csv.writer(Echo())
+        with open(partial_path, 'w', newline='') as f:
+            job.bytes_written = f.write(writer.writerow(CSV_HEADER))
+
+            for orders in iter_order_chunks():
+                chunk = ''.join(writer.writerow(row)
+                                for order in orders for row in order_csv_rows(order))
+                f.write(chunk)
+
+                job.rows_done += len(orders)
+                job.bytes_written = f.tell()
+                if not save_progress(job, rows_done=job.rows_done, bytes_written=job.bytes_written):
+                    raise JobLost()
+
+        os.replace(partial_path, path)
+        job.status = ExportJob.DONE
+    except Exception as error:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        if isinstance(error, JobLost):
+            return None
+
+        job.status = ExportJob.FAILED
+        job.error = str(error)
+
+    job.finished_at = timezone.now()
+    save_progress(job, status=job.status, error=job.error, finished_at=job.finished_at)
+    return job
+
+
+# running jobs whose worker stopped sending heartbeats, back to pending, returns their ids.
+def requeue_stale_jobs():
+    stale_after = getattr(settings, 'EXPORT_JOBS_STALE_AFTER', 300)
+    cutoff = timezone.now() - datetime.timedelta(seconds=stale_after)
+
+    job_ids = list(ExportJob.objects.filter(
+        status=ExportJob.RUNNING, heartbeat_at__lt=cutoff).values_list('id', flat=True))
+    if job_ids:
+        # the same conditions again, a worker that came back to life meanwhile keeps its job.
+        ExportJob.objects.filter(
+            id__in=job_ids, status=ExportJob.RUNNING, heartbeat_at__lt=cutoff,
+        ).update(status=ExportJob.PENDING, started_at=None, heartbeat_at=None,
+                 rows_done=0, bytes_written=0)
+
+    return list(ExportJob.objects.filter(
+        id__in=job_ids, status=ExportJob.PENDING).values_list('id', flat=True))
+
+
+# finished jobs past the retention, and their files. Returns how many jobs were deleted.
+def delete_expired_jobs():
+    retention = getattr(settings, 'EXPORT_JOBS_RETENTION_HOURS', 24)
+    cutoff = timezone.now() - datetime.timedelta(hours=retention)
+
+    expired = list(ExportJob.objects.filter(
+        status__in=[ExportJob.DONE, ExportJob.FAILED], finished_at__lt=cutoff).only('id', 'file'))
+    for job in expired:
+        path = file_path(job)
+        if os.path.exists(path):
+            os.remove(path)
+
+    # half written files left behind by workers that died.
+    stale_after = getattr(settings, 'EXPORT_JOBS_STALE_AFTER', 300)
+    for path in glob.glob(os.path.join(settings.MEDIA_ROOT, 'exports', '*.part')):
+        if os.path.getmtime(path) < time.time() - stale_after:
+            os.remove(path)
+
+    return ExportJob.objects.filter(id__in=[job.id for job in expired]).delete()[0]
+
+
+def rows_per_second(job):
+    if job.started_at is None:
+        return None
+
+    seconds = ((job.finished_at or timezone.now()) - job.started_at).total_seconds()
+    return round(job.rows_done / seconds, 1) if seconds > 0 else None
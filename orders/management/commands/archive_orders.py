@@ -0,0 +1,48 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from orders.archiving import archivable, archive_batch, archive_cutoff
+
+
+# Move old orders to the archive tables (look in: orders/archiving.py), a batch per transaction.
+#   python manage.py archive_orders --older-than-days 365
+#   python manage.py archive_orders --max-batches 10 <-- a bounded run, e.g. from cron every night.
+#   python manage.py archive_orders --dry-run <-- only count.
+# Stopped half way? run it again, it goes on from the oldest order that is still hot.
+
+
+class Command(BaseCommand):
+    help = 'Move orders older than a given age to the archive tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int,
+                            default=getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 365))
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'ORDER_ARCHIVE_BATCH_SIZE', 1000))
+        parser.add_argument('--max-batches', type=int, default=None)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['older_than_days'])
+
+        if options['dry_run']:
+            self.stdout.write('%d orders created before %s would be archived' % (
+                archivable(cutoff).count(), cutoff.isoformat()))
+            return
+
+        archived = 0
+        batches = 0
+        start = time.perf_counter()
+
+        while options['max_batches'] is None or batches < options['max_batches']:
+            count = archive_batch(cutoff, max(1, options['batch_size']))
+            if not count:
+                break
+
+            archived += count
+            batches += 1
+            self.stdout.write('%d orders archived, %.1f rows/sec' % (
+                archived, archived / (time.perf_counter() - start)))
+
+        self.stdout.write('done, %d orders archived in %d batches' % (archived, batches))
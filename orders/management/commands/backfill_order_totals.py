@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.models import Order
+
+
+# Fill in Order.total / Order.item_count (look in: models.py) of the orders that existed before those were stored,
+#   or after items were written around the signals (bulk_create, queryset.update(), raw SQL).
+# Goes over the orders by id, a batch per transaction, so the table is never locked as a whole.
+#
+# python manage.py backfill_order_totals --batch-size 1000
+
+
+class Command(BaseCommand):
+    help = 'Re-calculate the stored total and item count of every order.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        done = 0
+
+        while True:
+            ids = list(Order.objects.filter(id__gt=last_id).order_by(
+                'id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+
+            with transaction.atomic():
+                Order.objects.filter(id__in=ids).refresh_totals()
+
+            last_id = ids[-1]
+            done += len(ids)
+
+        self.stdout.write('%d orders updated' % done)
@@ -0,0 +1,102 @@
+import datetime
+import time
+from collections import defaultdict
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from orders.analytics import average_order_value, revenue_per_email, top_products
+
+
+# How long each sales analytics query takes (look in: analytics.py), at different item counts,
+#   over the whole history and over the last 30 days.
+# --baseline <-- also the same top products, summed in Python over every OrderItem object, for comparison.
+# Everything is seeded inside a transaction that is rolled back at the end, nothing stays in the DB.
+#
+# python manage.py benchmark_analytics --items 1000000 10000000
+#   10M items takes ~20 minutes, nearly all of it seeding, leave out --baseline at that size.
+
+
+ITEMS_PER_ORDER = 5
+PRODUCTS = 500
+EMAILS = 10000
+DAYS = 365
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the sales analytics queries at different item counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', nargs='+', type=int, default=[100000])
+        parser.add_argument('--baseline', action='store_true')
+
+    def handle(self, *args, **options):
+        self.stdout.write('%10s %22s %12s %10s' % ('items', 'query', 'window', 'ms'))
+
+        for items in options['items']:
+            with transaction.atomic():
+                self.seed(items)
+
+                today = timezone.now().date()
+                windows = {
+                    'all': {},
+                    'last 30 days': {'start': today - datetime.timedelta(days=29), 'end': today},
+                }
+                queries = {
+                    'top products': lambda window: top_products(**window),
+                    'top by quantity': lambda window: top_products(by='quantity', **window),
+                    'average order value': lambda window: average_order_value(**window),
+                    'revenue per email': lambda window: revenue_per_email(**window),
+                }
+                if options['baseline']:
+                    queries['top products (python)'] = lambda window: self.baseline()
+
+                for name, query in queries.items():
+                    for window_name, window in windows.items():
+                        start = time.perf_counter()
+                        query(window)
+                        ms = (time.perf_counter() - start) * 1000
+                        self.stdout.write('%10d %22s %12s %10.1f' % (items, name, window_name, ms))
+
+                transaction.set_rollback(True)
+
+    # the orders spread evenly over the last DAYS days.
+    def seed(self, items):
+        orders_count = (items + ITEMS_PER_ORDER - 1) // ITEMS_PER_ORDER
+        batch_size = 5000
+
+        for offset in range(0, orders_count, batch_size):
+            numbers = range(offset, min(offset + batch_size, orders_count))
+            orders = Order.objects.bulk_create([Order(
+                first_name='First %d' % number, last_name='Last %d' % number,
+                email='customer%d@benchmark.com' % (number % EMAILS),
+                total=sum(self.price(number, item) * (item + 1) for item in range(ITEMS_PER_ORDER)),
+                item_count=ITEMS_PER_ORDER) for number in numbers])
+            if orders[0].pk is None:  # <-- MySQL, no ids back from a bulk insert.
+                orders = Order.objects.order_by('-id')[:len(orders)][::-1]
+
+            OrderItem.objects.bulk_create([OrderItem(
+                order=order, product_title='Product %d' % ((number * 7 + item) % PRODUCTS),
+                price=self.price(number, item), quantity=item + 1)
+                for number, order in zip(numbers, orders) for item in range(ITEMS_PER_ORDER)],
+                batch_size=batch_size)
+
+        # auto_now_add sets created_at on insert, spread the orders over the days afterwards, a day per UPDATE.
+        now = timezone.now()
+        last_id = Order.objects.order_by('-id').values_list('id', flat=True).first()
+        per_day = (orders_count + DAYS - 1) // DAYS
+        for day in range(DAYS):
+            Order.objects.filter(
+                id__lte=last_id - day * per_day, id__gt=last_id - (day + 1) * per_day,
+            ).update(created_at=now - datetime.timedelta(days=day))
+
+    def price(self, number, item):
+        return Decimal((number * 7 + item) % PRODUCTS + 100) / 100
+
+    def baseline(self):
+        revenue = defaultdict(Decimal)
+        for item in OrderItem.objects.all().iterator():
+            revenue[item.product_title] += item.price * item.quantity
+        return sorted(revenue.items(), key=lambda product: -product[1])[:10]
@@ -0,0 +1,30 @@
+from decimal import Decimal
+
+from admin.benchmarks import SerializerBenchmarkCommand
+from orders.models import Order, OrderItem
+from orders.serializers import OrderSerializer, OrderValuesSerializer
+
+
+# python manage.py benchmark_order_serializers --rows 10000 (look in: admin/benchmarks.py).
+
+
+class Command(SerializerBenchmarkCommand):
+
+    def seed(self, rows):
+        orders = Order.objects.bulk_create((Order(
+            first_name='First %d' % number, last_name='Last %d' % number,
+            email='order%d@benchmark.com' % number) for number in range(rows)), batch_size=5000)
+        orders = Order.objects.order_by('-id')[:rows] if orders[0].pk is None else orders
+
+        OrderItem.objects.bulk_create((OrderItem(
+            order=order, product_title='Title %d' % item, price=Decimal('9.99'), quantity=item + 1)
+            for order in orders for item in range(2)), batch_size=5000)
+
+        # bulk_create skips the signals that keep the totals (look in: orders/signals.py).
+        Order.objects.filter(id__in=[order.id for order in orders]).refresh_totals()
+
+    def cases(self):
+        return [
+            ('orders', OrderSerializer, OrderValuesSerializer,
+             Order.objects.prefetch_related('order_items').order_by('id')),
+        ]
@@ -0,0 +1,95 @@
+import datetime
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from orders.serializers import OrderValuesSerializer
+from orders.views import OrderGenericAPIView, filter_orders
+
+
+# How long the first page of each orders list filter / sort takes (look in: views.py),
+#   at different table sizes, with the items seeded per order.
+# --explain <-- and the query plan of each, to see which index it uses.
+# Everything is seeded inside a transaction that is rolled back at the end, nothing stays in the DB.
+#
+# python manage.py benchmark_orders --sizes 10000 100000 --explain
+# python manage.py benchmark_orders --sizes 2000000 --items-per-order 5 <-- 10M items.
+
+
+EMAILS = 1000  # <-- how many customers the orders are spread over.
+ORDERS_PER_DAY = 1000
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the orders list filters and sorts at different table sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int,
+                            default=[10000, 100000])
+        parser.add_argument('--items-per-order', type=int, default=2)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--explain', action='store_true')
+
+    def handle(self, *args, **options):
+        self.stdout.write('%10s %10s %60s %8s %10s' % (
+            'orders', 'items', 'filter', 'rows', 'ms'))
+
+        for size in options['sizes']:
+            with transaction.atomic():
+                start = self.seed(size, options['items_per_order'])
+                self.measure_filters(size, size * options['items_per_order'], start, options)
+                transaction.set_rollback(True)
+
+    # ORDERS_PER_DAY orders a day, going back from today, returns the first day.
+    def seed(self, size, items_per_order):
+        batch_size = 5000
+
+        for offset in range(0, size, batch_size):
+            orders = Order.objects.bulk_create([Order(
+                first_name='First %d' % number, last_name='Last %d' % number,
+                email='customer%d@benchmark.com' % (number % EMAILS),
+                total=Decimal('9.99') * items_per_order, item_count=items_per_order)
+                for number in range(offset, min(offset + batch_size, size))])
+            if orders[0].pk is None:  # <-- MySQL, no ids back from a bulk insert.
+                orders = Order.objects.order_by('-id')[:len(orders)]
+
+            OrderItem.objects.bulk_create([OrderItem(
+                order=order, product_title='Title %d' % item, price=Decimal('9.99'), quantity=1)
+                for order in orders for item in range(items_per_order)], batch_size=batch_size)
+
+        # auto_now_add sets created_at on insert, spread the orders over the days afterwards, a day per UPDATE.
+        today = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        last_id = Order.objects.order_by('-id').values_list('id', flat=True).first()
+        days = (size + ORDERS_PER_DAY - 1) // ORDERS_PER_DAY
+        for day in range(days):
+            Order.objects.filter(
+                id__lte=last_id - day * ORDERS_PER_DAY, id__gt=last_id - (day + 1) * ORDERS_PER_DAY,
+            ).update(created_at=today - datetime.timedelta(days=day))
+
+        return today - datetime.timedelta(days=days - 1)
+
+    def measure_filters(self, size, items, start, options):
+        middle = (start + (timezone.now() - start) / 2).date().isoformat()
+        filters = [
+            {},
+            {'created_from': middle},
+            {'created_from': middle, 'created_to': middle},
+            {'email': 'customer%d@benchmark.com' % (EMAILS // 2)},
+            {'email': 'customer%d@benchmark.com' % (EMAILS // 2), 'created_from': middle},
+            {'sort': '-total'},
+        ]
+
+        for params in filters:
+            queryset = OrderValuesSerializer.values(filter_orders(
+                OrderGenericAPIView.queryset.all(), params))[:options['page_size']]
+
+            begin = time.perf_counter()
+            rows = len(OrderValuesSerializer(queryset).data)
+            ms = (time.perf_counter() - begin) * 1000
+
+            self.stdout.write('%10d %10d %60s %8d %10.1f' % (size, items, params, rows, ms))
+            if options['explain']:
+                self.stdout.write(queryset.explain())
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from orders.models import Order, TOTAL_FIELD, line_total
+
+
+# Compare the stored Order.total / Order.item_count (look in: models.py) with the sums of the items.
+#   python manage.py check_order_totals <-- list the orders that are off, fails if there are any.
+#   python manage.py check_order_totals --fix <-- and re-calculate those.
+
+
+class Command(BaseCommand):
+    help = 'Verify the stored total and item count of every order against its items.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.annotate(
+            items_total=Coalesce(Sum(line_total('order_items__')), Value(0), output_field=TOTAL_FIELD),
+            items_count=Count('order_items'),
+        )
+
+        # exclude(a, b) <-- everything but the orders where both match.
+        wrong = list(orders.exclude(total=F('items_total'), item_count=F('items_count'))
+                     .order_by('id').values_list('id', 'total', 'items_total', 'item_count', 'items_count'))
+
+        for order_id, total, items_total, item_count, items_count in wrong:
+            self.stdout.write('order %d: total %s (items %s), item_count %d (items %d)' % (
+                order_id, total, items_total, item_count, items_count))
+
+        if wrong and options['fix']:
+            Order.objects.filter(id__in=[row[0] for row in wrong]).refresh_totals()
+            self.stdout.write('%d orders fixed' % len(wrong))
+        elif wrong:
+            raise CommandError('%d orders have wrong totals' % len(wrong))
+        else:
+            self.stdout.write('all order totals match')
@@ -0,0 +1,41 @@
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.importing import OrderImport
+
+
+# Import orders from a JSONL file (look in: orders/importing.py), '-' <-- read from stdin.
+#   python manage.py import_orders orders.jsonl --batch-size 1000
+#   python manage.py import_orders orders.jsonl --offset 250000 <-- resume, after an import that stopped half way.
+
+
+class Command(BaseCommand):
+    help = 'Import orders, with their items, from a JSONL file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--offset', type=int, default=0)
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'ORDER_IMPORT_BATCH_SIZE', 500))
+
+    def handle(self, *args, **options):
+        order_import = OrderImport(batch_size=max(1, options['batch_size']), progress=self.progress)
+
+        if options['path'] == '-':
+            order_import.run(order_import.jsonl_rows(sys.stdin.buffer, options['offset']), options['offset'])
+        else:
+            with open(options['path'], 'rb') as lines:
+                order_import.run(order_import.jsonl_rows(lines, options['offset']), options['offset'])
+
+        for error in order_import.errors:
+            self.stderr.write('line %d: %s' % (error['row'], error['errors']))
+
+        if order_import.error is not None:
+            raise CommandError('%s, resume with --offset %d' % (order_import.error, order_import.offset))
+
+        self.stdout.write('%d orders created, %d lines failed' % (order_import.created, order_import.failed))
+
+    def progress(self, report):
+        self.stdout.write('offset %d: %d created, %d failed, %s rows/sec' % (
+            report['offset'], report['created'], report['failed'], report['rows_per_second']))
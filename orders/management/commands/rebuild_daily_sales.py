@@ -0,0 +1,21 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from orders.rollup import rebuild
+
+
+# Sum the daily sales (look in: orders/rollup.py) again, from Order.total.
+#   python manage.py rebuild_daily_sales --backfill <-- re-calculate the order totals first (look in: backfill_order_totals.py).
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollup the chart reads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            call_command('backfill_order_totals', stdout=self.stdout)
+
+        self.stdout.write('%d days rebuilt' % rebuild())
@@ -0,0 +1,57 @@
+import time
+from django.core.management.base import BaseCommand
+
+from orders.jobs import run_job, pending_job_ids, requeue_stale_jobs, delete_expired_jobs
+
+
+# The export worker (look in: jobs.py).
+#   python manage.py run_export_jobs 12 <-- run job 12 (that is what the web process spawns).
+#   python manage.py run_export_jobs --loop <-- keep running pending jobs, when spawning is turned off.
+#   python manage.py run_export_jobs <-- the housekeeping, and whatever is pending (cron friendly).
+# Every run first deletes expired jobs, and requeues stale ones,
+#   then runs every pending job (requeued ones too) until none is left, the web process counts on that (look in: jobs.py).
+
+
+class Command(BaseCommand):
+    help = 'Run pending order export jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('job_ids', nargs='*', type=int)
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument('--interval', type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        self.housekeeping()
+
+        for job_id in options['job_ids']:
+            self.run(job_id)
+        self.drain()
+
+        while options['loop']:
+            time.sleep(options['interval'])
+            self.housekeeping()
+            self.drain()
+
+    # pending jobs are looked up again after every round, jobs created meanwhile are run too.
+    def drain(self):
+        job_ids = pending_job_ids()
+        while job_ids:
+            for job_id in job_ids:
+                self.run(job_id)
+            job_ids = pending_job_ids()
+
+    def housekeeping(self):
+        deleted = delete_expired_jobs()
+        if deleted:
+            self.stdout.write('deleted %d expired export jobs' % deleted)
+
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write('requeued %d stale export jobs' % len(requeued))
+        return requeued
+
+    def run(self, job_id):
+        job = run_job(job_id)
+        if job is not None:
+            self.stdout.write('export job %d: %s, %d orders' % (
+                job.id, job.status, job.rows_done))
@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-18 11:08
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+# The orders that already exist get their total / item_count from their items right away,
+#   otherwise they would read 0 until 'manage.py backfill_order_totals' is run.
+# Same UPDATE as OrderQuerySet.refresh_totals (look in: models.py), the historical model has no custom queryset.
+# A batch of orders per UPDATE, by id.
+def refresh_totals(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+
+    total_field = DecimalField(max_digits=14, decimal_places=2)
+    items = OrderItem.objects.filter(order_id=OuterRef('pk')).order_by().values('order_id')
+    total = items.annotate(sum=Sum(ExpressionWrapper(
+        F('price') * F('quantity'), output_field=total_field))).values('sum')
+    count = items.annotate(count=Count('id')).values('count')
+
+    last_id = 0
+    while True:
+        ids = list(Order.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:1000])
+        if not ids:
+            break
+
+        Order.objects.filter(id__in=ids).update(
+            total=Coalesce(Subquery(total), Value(0), output_field=total_field),
+            item_count=Coalesce(Subquery(count), Value(0)))
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(refresh_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-18 11:10
+
+import datetime
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+# Sum the orders that already exist into the new rollup, otherwise the chart would be empty
+#   until 'manage.py rebuild_daily_sales' is run. Same as rollup.rebuild (look in: rollup.py).
+def rebuild_daily_sales(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    DailySales = apps.get_model('orders', 'DailySales')
+
+    days = Order.objects.filter(item_count__gt=0).annotate(
+        day=TruncDate('created_at', tzinfo=datetime.timezone.utc),
+    ).values('day').annotate(total=Sum('total'), order_count=Count('id')).order_by('day')
+
+    DailySales.objects.bulk_create((DailySales(
+        date=row['day'], total=row['total'], order_count=row['order_count'])
+        for row in days.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_total_item_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('order_count', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='orders_created_at_idx'),
+        ),
+        migrations.RunPython(rebuild_daily_sales, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,27 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+class OrderQuerySet(models.QuerySet):
+
+    # re-calculate the stored total / item_count of these orders, from their items,
+    #   a single UPDATE, the sums are done by the database.
+    def refresh_totals(self):
+        items = OrderItem.objects.filter(order_id=OuterRef('pk')).order_by().values('order_id')
+
+        return self.update(
+            total=Coalesce(Subquery(items.annotate(sum=Sum(line_total())).values('sum')),
+                           Value(0), output_field=TOTAL_FIELD),
+            item_count=Coalesce(Subquery(items.annotate(count=Count('id')).values('count')), Value(0)))
+
+
+# price * quantity of a single item, prefix='order_items__' <-- from the order side.
+def line_total(prefix=''):
+    return ExpressionWrapper(F(prefix + 'price') * F(prefix + 'quantity'), output_field=TOTAL_FIELD)
+
+
+TOTAL_FIELD = DecimalField(max_digits=14, decimal_places=2)
 
 
 class Order(models.Model):
@@ -8,10 +31,29 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)  # updated on create
     updated_at = models.DateTimeField(auto_now=True)  # updated on save
 
+    # sum of price * quantity, and how many items, of all the order items.
+    # kept up to date whenever an item is saved / deleted (look in: signals.py),
+    #   'python manage.py backfill_order_totals' fills those in for orders that existed before.
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+
+    objects = OrderQuerySet.as_manager()
+
     @property
     def name(self):
         return self.first_name + ' ' + self.last_name
 
+    class Meta:
+        indexes = [
+            # the orders list (newest first, ?created_from / ?created_to, look in: views.py),
+            #   and the daily sales rollup (look in: rollup.py) that re-sums a single day by created_at range.
+            models.Index(fields=['created_at', 'id'], name='orders_created_at_id_idx'),
+            # ?email=, the orders of a customer come already sorted by date.
+            models.Index(fields=['email', 'created_at', 'id'], name='orders_email_created_at_idx'),
+            # ?sort=total / -total.
+            models.Index(fields=['total', 'id'], name='orders_total_id_idx'),
+        ]
+
 
 class OrderItem(models.Model):
     product_title = models.CharField(max_length=200)
@@ -23,3 +65,83 @@ class OrderItem(models.Model):
         Order, on_delete=models.CASCADE, related_name='order_items')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    # remember the order the item was loaded with, an item that moves changes the totals of both orders.
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_order_id = instance.__dict__.get('order_id')
+        return instance
+
+    # the item and the totals of its order (look in: signals.py) are saved together, or not at all.
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+        self._loaded_order_id = self.order_id
+
+
+# Orders older than settings.ORDER_ARCHIVE_AFTER_DAYS are moved here (look in: archiving.py),
+#   so the hot tables (orders_order / orders_orderitem), and everything that reads them, stay small.
+# Same columns, same ids, an archived order is read back with ?include_archived=1.
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)  # <-- the id it had as an Order.
+    first_name = models.CharField(max_length=200)
+    last_name = models.CharField(max_length=200)
+    email = models.EmailField()
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField()
+
+    @property
+    def name(self):
+        return self.first_name + ' ' + self.last_name
+
+    class Meta:
+        indexes = [
+            # the same filters as the orders list (look in: views.py).
+            models.Index(fields=['created_at', 'id'], name='archived_created_at_id_idx'),
+            models.Index(fields=['email', 'created_at', 'id'], name='archived_email_created_idx'),
+        ]
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)  # <-- the id it had as an OrderItem.
+    product_title = models.CharField(max_length=200)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.IntegerField()
+    order = models.ForeignKey(
+        ArchivedOrder, on_delete=models.CASCADE, related_name='order_items')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+
+# An export that runs in the background (look in: jobs.py), the file is written under MEDIA_ROOT/exports/.
+class ExportJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(PENDING, 'Pending'), (RUNNING, 'Running'),
+                (DONE, 'Done'), (FAILED, 'Failed')]
+
+    status = models.CharField(
+        max_length=20, choices=STATUSES, default=PENDING)
+    file = models.CharField(max_length=200)  # <-- relative to MEDIA_ROOT.
+    rows_done = models.PositiveIntegerField(default=0)  # <-- orders written so far.
+    total_rows = models.PositiveIntegerField(null=True)
+    bytes_written = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    heartbeat_at = models.DateTimeField(null=True)  # <-- the worker is alive, updated on every chunk.
+    finished_at = models.DateTimeField(null=True)
+
+
+# Sum of the orders of every day (UTC), what ChartAPIView (look in: views.py) shows.
+# Only days with orders that have items are there, re-calculated whenever those change (look in: rollup.py).
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    total = models.DecimalField(max_digits=16, decimal_places=2)
+    order_count = models.PositiveIntegerField()
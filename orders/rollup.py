@@ -0,0 +1,98 @@
+import datetime
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, DailySales
+from .charts import invalidate_chart
+
+
+####################################################################################################
+## The daily sales rollup ##########################################################################
+####################################################################################################
+# DailySales holds, for every day, the sum of Order.total of the orders created that day.
+# The chart used to join and group the whole orders / items tables on every load,
+#   now it reads a row per day, however many orders there are.
+#
+# Whenever the total of an order changes (look in: signals.py), only its own day is re-summed,
+#   that is a range query on orders.created_at (indexed), of a single day.
+# Days are in UTC, the same as the dates the old SQL grouped by.
+#
+# Anything written around the signals (bulk_create, queryset.update(), raw SQL) needs:
+#   python manage.py rebuild_daily_sales
+
+
+# the day (UTC) an order was created in.
+def day_of(created_at):
+    if timezone.is_aware(created_at):
+        created_at = created_at.astimezone(datetime.timezone.utc)
+    return created_at.date()
+
+
+# [start, end) of a day.
+def day_range(day):
+    start = datetime.datetime.combine(day, datetime.time.min)
+    if settings.USE_TZ:
+        start = start.replace(tzinfo=datetime.timezone.utc)
+    return start, start + datetime.timedelta(days=1)
+
+
+# lock the row of a day, creating it first when the day is new.
+# Two writers of the same new day both find no row, both INSERT it: the second one hits the
+#   unique date, and then waits for (and locks) the row the first one created.
+def lock_day(day):
+    row = DailySales.objects.select_for_update().filter(date=day).first()
+    if row is None:
+        try:
+            with transaction.atomic():
+                row = DailySales.objects.create(date=day, total=0, order_count=0)
+        except IntegrityError:
+            row = DailySales.objects.select_for_update().get(date=day)
+    return row
+
+
+# re-sum those days, a day that has no orders left is removed.
+# The row of the day is locked BEFORE its orders are summed, so concurrent writers of a day
+#   take turns, and the last one to sum sees every committed order (READ COMMITTED,
+#   Django's default on MySQL and PostgreSQL) - nobody overwrites a newer sum with an older one.
+# Days are locked in order, two writers of the same days can't deadlock each other.
+def refresh_days(days):
+    for day in sorted(set(days)):
+        with transaction.atomic():
+            row = lock_day(day)
+
+            start, end = day_range(day)
+            sums = Order.objects.filter(
+                created_at__gte=start, created_at__lt=end, item_count__gt=0,
+            ).aggregate(total=Sum('total'), order_count=Count('id'))
+
+            if sums['order_count']:
+                row.total, row.order_count = sums['total'], sums['order_count']
+                row.save(update_fields=['total', 'order_count'])
+            else:
+                row.delete()
+
+
+# re-sum the days of those orders.
+def refresh_orders(order_ids):
+    created = Order.objects.filter(id__in=order_ids).values_list('created_at', flat=True)
+    refresh_days(day_of(created_at) for created_at in created)
+
+
+# throw the whole rollup away, and sum it again from the orders.
+def rebuild():
+    days = Order.objects.filter(item_count__gt=0).annotate(
+        day=TruncDate('created_at', tzinfo=datetime.timezone.utc),
+    ).values('day').annotate(total=Sum('total'), order_count=Count('id')).order_by('day')
+
+    with transaction.atomic():
+        DailySales.objects.all().delete()
+        DailySales.objects.bulk_create((DailySales(
+            date=row['day'], total=row['total'], order_count=row['order_count'])
+            for row in days.iterator()), batch_size=1000)
+
+    invalidate_chart()
+
+    return DailySales.objects.count()
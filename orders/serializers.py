@@ -1,23 +1,117 @@
 from rest_framework import serializers
 # from rest_framework import exceptions
 
-from .models import OrderItem, Order
+from admin.serializers import ValuesSerializer
+from .models import OrderItem, Order, ExportJob, ArchivedOrder, ArchivedOrderItem
+from .jobs import rows_per_second
+from .ingest import create_orders
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = '__all__'
+        read_only_fields = ['order']  # <-- items are created through their order.
 
 
+# many=True, all the orders are created together (look in: ingest.py).
+class OrderListSerializer(serializers.ListSerializer):
+
+    def create(self, validated_data):
+        return create_orders(validated_data)
+
+
+# An order is created with its items, in one go: {..., 'order_items': [{'product_title': ?, 'price': ?, 'quantity': ?}]}
 class OrderSerializer(serializers.ModelSerializer):
     order_items = OrderItemSerializer(many=True)
     total = serializers.SerializerMethodField('get_total')
 
+    # stored on the order (look in: models.py), no need to go over its items.
     def get_total(self, order):
-        order_items = OrderItem.objects.all().filter(order_id=order.id)
-        return sum((o.price * o.quantity) for o in order_items)
+        return order.total
+
+    def create(self, validated_data):
+        return create_orders([validated_data])[0]
 
     class Meta:
         model = Order
         fields = '__all__'
+        read_only_fields = ['item_count']
+        list_serializer_class = OrderListSerializer
+
+
+# Imports (look in: importing.py) bring history, created_at is written as given, instead of being read-only (auto_now_add).
+# '2020-1-1' <-- the dates of fixtures/orders.json are accepted too, a date without a time is midnight.
+class OrderImportSerializer(OrderSerializer):
+    created_at = serializers.DateTimeField(required=False, input_formats=['iso-8601', '%Y-%m-%d'])
+
+
+# Same output as OrderItemSerializer / OrderSerializer, for big list pages (look in: admin/serializers.py).
+class OrderItemValuesSerializer(ValuesSerializer):
+    serializer_class = OrderItemSerializer
+
+
+# The items of the whole page come with one query, the totals are read from the order rows.
+class OrderValuesSerializer(ValuesSerializer):
+    serializer_class = OrderSerializer
+    custom_fields = ('order_items', 'total')
+    extra_columns = ('total',)
+    item_models = (OrderItem,)  # <-- where the items of the page are read from, a query each.
+
+    def attach(self, rows):
+        order_items = {row['id']: [] for row in rows}
+
+        items = []
+        for model in self.item_models:
+            items.extend(model.objects.filter(order_id__in=list(order_items)).order_by(
+                'id').values(*OrderItemValuesSerializer.columns()))
+
+        for item, data in zip(items, OrderItemValuesSerializer(items).data):
+            order_items[item['order']].append(data)
+
+        return {
+            'order_items': order_items,
+            'total': {row['id']: row['total'] for row in rows},
+        }
+
+
+# ?include_archived=1 lists, the page is a mix of hot and archived orders (look in: archiving.py).
+class OrderWithArchivedValuesSerializer(OrderValuesSerializer):
+    item_models = (OrderItem, ArchivedOrderItem)
+
+
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedOrderItem
+        fields = '__all__'
+
+
+# An archived order is read only, it looks like an order, plus when it was archived.
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    order_items = ArchivedOrderItemSerializer(many=True, read_only=True)
+    total = serializers.SerializerMethodField('get_total')
+
+    def get_total(self, order):
+        return order.total
+
+    class Meta:
+        model = ArchivedOrder
+        fields = '__all__'
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.SerializerMethodField('get_rows_per_second')
+    download = serializers.SerializerMethodField('get_download')
+
+    def get_rows_per_second(self, job):
+        return rows_per_second(job)
+
+    # where to get the file from, once it is done.
+    def get_download(self, job):
+        if job.status != ExportJob.DONE:
+            return None
+        return '/api/export/jobs/%d/download' % job.id
+
+    class Meta:
+        model = ExportJob
+        exclude = ['file']
@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Order, OrderItem
+from .rollup import day_of, refresh_days, refresh_orders
+from .charts import invalidate_chart
+
+
+# Keep Order.total / Order.item_count (look in: models.py), and the daily sales (look in: rollup.py), up to date,
+#   and throw away the cached charts (look in: charts.py).
+# Those run inside the transaction of the item save / delete,
+#   the charts are thrown away once it is committed, a chart built in between would cache the old rollup rows.
+
+
+@receiver(post_save, sender=OrderItem)
+def order_item_saved(sender, instance, **kwargs):
+    order_ids = {instance.order_id, getattr(
+        instance, '_loaded_order_id', instance.order_id)}
+    Order.objects.filter(id__in=order_ids).refresh_totals()
+    refresh_orders(order_ids)
+    transaction.on_commit(invalidate_chart)
+
+
+@receiver(post_delete, sender=OrderItem)
+def order_item_deleted(sender, instance, origin=None, **kwargs):
+    # the order itself is being deleted (cascade), no point to update it.
+    if isinstance(origin, Order) or (isinstance(origin, QuerySet) and origin.model is Order):
+        return
+
+    Order.objects.filter(id=instance.order_id).refresh_totals()
+    refresh_orders([instance.order_id])
+    transaction.on_commit(invalidate_chart)
+
+
+# the order is gone, its day is re-summed without it.
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    refresh_days([day_of(instance.created_at)])
+    transaction.on_commit(invalidate_chart)
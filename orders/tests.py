@@ -1,3 +1,819 @@
-from django.test import TestCase
+import io
+import csv
+import datetime
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipIf
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection
+from django.db.models.signals import post_delete
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from users.models import Users
+from users.authentication import generate_access_token
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem, DailySales, ExportJob
+from .serializers import OrderSerializer, OrderValuesSerializer
+from .exports import columnar_format, iter_order_chunks, stream_csv
+from .jobs import run_job, file_path, requeue_stale_jobs
+from .ingest import create_orders
+from .rollup import refresh_days
+from .archiving import archive_batch, archive_cutoff
+
+
+class OrderValuesSerializerParityTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com')
+
+        for number in range(3):
+            order = Order.objects.create(
+                first_name='First #%d' % number, last_name='Last #%d' % number,
+                email='order%d@orders.com' % number)
+
+            # the last order has no items, its total is 0.
+            for item in range(2 - number):
+                OrderItem.objects.create(
+                    order=order, product_title='Title #%d' % item,
+                    price=Decimal('10.25') * (item + 1), quantity=item + 2)
+
+    def test_same_json_as_order_serializer(self):
+        queryset = Order.objects.order_by('id')
+
+        expected = JSONRenderer().render(OrderSerializer(queryset, many=True).data)
+        actual = JSONRenderer().render(
+            OrderValuesSerializer(OrderValuesSerializer.values(queryset)).data)
+
+        self.assertEqual(actual, expected)
+
+    def test_same_json_from_the_list_endpoint(self):
+        client = APIClient()
+        client.cookies['jwt'] = generate_access_token(self.user)
+
+        expected = client.get('/api/orders?serializer=model').content
+        actual = client.get('/api/orders').content
+
+        self.assertEqual(actual, expected)
+
+
+class OrderTotalsTest(TestCase):
+
+    def setUp(self):
+        self.order = Order.objects.create(
+            first_name='First', last_name='Last', email='order@orders.com')
+        self.other = Order.objects.create(
+            first_name='Other', last_name='Other', email='other@orders.com')
+
+    def assertTotals(self, order, total, item_count):
+        order.refresh_from_db()
+        self.assertEqual((order.total, order.item_count), (Decimal(total), item_count))
+
+    def test_items_keep_the_totals(self):
+        item = OrderItem.objects.create(
+            order=self.order, product_title='Title', price=Decimal('10.25'), quantity=2)
+        OrderItem.objects.create(
+            order=self.order, product_title='Title', price=Decimal('1.50'), quantity=1)
+        self.assertTotals(self.order, '22.00', 2)
+
+        item.quantity = 4
+        item.save()
+        self.assertTotals(self.order, '42.50', 2)
+
+        # moved to another order, both change.
+        item = OrderItem.objects.get(id=item.id)
+        item.order = self.other
+        item.save()
+        self.assertTotals(self.order, '1.50', 1)
+        self.assertTotals(self.other, '41.00', 1)
+
+        item.delete()
+        self.assertTotals(self.other, '0', 0)
+
+    def test_check_and_backfill_commands(self):
+        OrderItem.objects.bulk_create([OrderItem(
+            order=self.order, product_title='Title', price=Decimal('2.00'), quantity=3)])
+
+        with self.assertRaises(CommandError):
+            call_command('check_order_totals', stdout=StringIO())
+
+        call_command('backfill_order_totals', batch_size=1, stdout=StringIO())
+        self.assertTotals(self.order, '6.00', 1)
+        call_command('check_order_totals', stdout=StringIO())
+
+
+class DailySalesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com'))
+
+    def create_order(self, created_at, price):
+        order = Order.objects.create(
+            first_name='First', last_name='Last', email='order@orders.com')
+        Order.objects.filter(id=order.id).update(
+            created_at=datetime.datetime.fromisoformat(created_at))
+        OrderItem.objects.create(
+            order=order, product_title='Title', price=Decimal(price), quantity=2)
+        return order
+
+    def chart(self, query=''):
+        return self.client.get('/api/chart' + query).json()['data']
+
+    def test_rollup_follows_the_orders(self):
+        first = self.create_order('2021-01-01T10:00:00+00:00', '5.00')
+        self.create_order('2021-01-01T23:59:00+00:00', '1.25')
+        self.create_order('2021-01-03T00:00:00+00:00', '7.00')
+
+        self.assertEqual(self.chart(), [
+            {'date': '2021-01-01', 'sum': 12.5},
+            {'date': '2021-01-03', 'sum': 14.0},
+        ])
+        self.assertEqual(self.chart('?from=2021-01-02&to=2021-01-03'), [
+            {'date': '2021-01-03', 'sum': 14.0},
+        ])
+
+        first.order_items.first().delete()
+        self.assertEqual(self.chart('?to=2021-01-01'), [{'date': '2021-01-01', 'sum': 2.5}])
+
+        Order.objects.filter(created_at__date='2021-01-01').delete()
+        self.assertEqual(self.chart('?to=2021-01-02'), [])
+
+    def test_rebuild_matches_the_rollup(self):
+        self.create_order('2021-01-01T10:00:00+00:00', '5.00')
+        self.create_order('2021-01-02T10:00:00+00:00', '6.00')
+        expected = self.chart()
+
+        call_command('rebuild_daily_sales', stdout=StringIO())
+        self.assertEqual(self.chart(), expected)
+
+    def test_new_day_row_is_created(self):
+        self.create_order('2021-01-05T10:00:00+00:00', '3.00')
+
+        row = DailySales.objects.get(date=datetime.date(2021, 1, 5))
+        self.assertEqual((row.total, row.order_count), (Decimal('6.00'), 1))
+
+    def test_new_day_created_by_another_writer(self):
+        # another writer INSERTs the day between our look up and our own INSERT.
+        self.create_order('2021-01-05T10:00:00+00:00', '3.00')
+        DailySales.objects.filter(date=datetime.date(2021, 1, 5)).update(total=0, order_count=0)
+
+        with mock.patch('django.db.models.query.QuerySet.first', return_value=None):
+            refresh_days([datetime.date(2021, 1, 5)])
+
+        row = DailySales.objects.get(date=datetime.date(2021, 1, 5))
+        self.assertEqual((row.total, row.order_count), (Decimal('6.00'), 1))
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/chart?from=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/chart?granularity=year').status_code, 400)
+        self.assertEqual(self.client.get('/api/chart?tz=Mars/Olympus').status_code, 400)
+
+    def test_granularity_and_timezone(self):
+        self.create_order('2021-01-04T10:00:00+00:00', '1.00')  # <-- Monday.
+        self.create_order('2021-01-10T23:30:00+00:00', '2.00')  # <-- Sunday, Monday in Berlin.
+        self.create_order('2021-02-01T00:30:00+00:00', '4.00')  # <-- January in New York.
+
+        self.assertEqual(self.chart('?granularity=week'), [
+            {'date': '2021-01-04', 'sum': 6.0},
+            {'date': '2021-02-01', 'sum': 8.0},
+        ])
+        self.assertEqual(self.chart('?granularity=week&tz=Europe/Berlin'), [
+            {'date': '2021-01-04', 'sum': 2.0},
+            {'date': '2021-01-11', 'sum': 4.0},
+            {'date': '2021-02-01', 'sum': 8.0},
+        ])
+        self.assertEqual(self.chart('?granularity=month&tz=America/New_York'), [
+            {'date': '2021-01-01', 'sum': 14.0},
+        ])
+        self.assertEqual(self.chart('?tz=Europe/Berlin&from=2021-01-11&to=2021-01-11'), [
+            {'date': '2021-01-11', 'sum': 4.0},
+        ])
+
+    def test_cached_until_an_order_write(self):
+        order = self.create_order('2021-01-01T10:00:00+00:00', '5.00')
+        self.chart()
+
+        with self.assertNumQueries(1):  # <-- the user.
+            self.assertEqual(self.chart(), [{'date': '2021-01-01', 'sum': 10.0}])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderItem.objects.create(
+                order=order, product_title='Title', price=Decimal('1.00'), quantity=1)
+            # not committed yet, a chart built now must not be cached as the new one.
+            self.assertEqual(self.chart(), [{'date': '2021-01-01', 'sum': 10.0}])
+
+        self.assertEqual(self.chart(), [{'date': '2021-01-01', 'sum': 11.0}])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.get(id=order.id).delete()
+        self.assertEqual(self.chart(), [])
+
+
+class OrderCreateTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com'))
+
+    def order(self, number, items=2):
+        return {
+            'first_name': 'First #%d' % number, 'last_name': 'Last', 'email': 'order%d@orders.com' % number,
+            'order_items': [{'product_title': 'Title #%d' % item, 'price': '2.50', 'quantity': item + 1}
+                            for item in range(items)],
+        }
+
+    def test_create_with_items(self):
+        response = self.client.post('/api/orders', self.order(1), format='json')
+        data = response.json()['data']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((data['total'], data['item_count'], len(data['order_items'])), (7.5, 2, 2))
+
+        order = Order.objects.get(id=data['id'])
+        self.assertEqual((order.total, order.item_count), (Decimal('7.50'), 2))
+        self.assertEqual(self.client.get('/api/chart').json()['data'][0]['sum'], 7.5)
+        call_command('check_order_totals', stdout=StringIO())
+
+    def test_batch(self):
+        orders = [self.order(number, items=3) for number in range(20)]
+
+        response = self.client.post('/api/orders/batch', orders, format='json')
+
+        self.assertEqual(response.json()['data']['created'], 20)
+        self.assertEqual(OrderItem.objects.count(), 60)
+        call_command('check_order_totals', stdout=StringIO())
+
+    def test_batch_queries_do_not_grow_with_orders(self):
+        def queries(count):
+            orders = [self.order(number) for number in range(count)]
+            with CaptureQueriesContext(connection) as context:
+                self.client.post('/api/orders/batch', orders, format='json')
+            return len(context)
+
+        if connection.features.can_return_rows_from_bulk_insert:
+            queries(1)  # <-- the user is cached after this one.
+            self.assertEqual(queries(2), queries(30))
+
+    def test_batch_is_validated_as_a_whole(self):
+        orders = [self.order(number) for number in range(3)]
+        orders[2]['order_items'][0]['price'] = 'free'
+
+        response = self.client.post('/api/orders/batch', orders, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 0)
+
+
+class OrderListFilterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com')
+
+        # two orders a day, from the 1st to the 3rd, the second one of each day at the same moment as the first.
+        for day in range(1, 4):
+            for customer in ('a@orders.com', 'b@orders.com'):
+                order = Order.objects.create(first_name='First', last_name='Last', email=customer)
+                Order.objects.filter(id=order.id).update(
+                    created_at=datetime.datetime(2021, 1, day, 12, tzinfo=datetime.timezone.utc),
+                    total=Decimal(day * 10 + len(customer)))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(self.user)
+
+    def ids(self, query=''):
+        response = self.client.get('/api/orders?page_size=100' + query)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [order['id'] for order in response.json()['data']]
+
+    def test_default_ordering_is_stable(self):
+        expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.ids(), expected)
+
+    def test_filters(self):
+        self.assertEqual(len(self.ids('&created_from=2021-01-02')), 4)
+        self.assertEqual(len(self.ids('&created_to=2021-01-02')), 4)
+        self.assertEqual(len(self.ids('&created_from=2021-01-02&created_to=2021-01-02')), 2)
+        self.assertEqual(len(self.ids('&created_to=2021-01-02T11:00:00')), 2)
+        self.assertEqual(len(self.ids('&email=a@orders.com&created_from=2021-01-03')), 1)
+
+    def test_sort(self):
+        expected = list(Order.objects.order_by('total', 'id').values_list('id', flat=True))
+        self.assertEqual(self.ids('&sort=total'), expected)
+
+    def test_cursor_pages_follow_the_sort(self):
+        for sort in ('-created_at', 'total', '-total', 'id'):
+            expected = list(Order.objects.order_by(
+                sort, '-id' if sort.startswith('-') else 'id').values_list('id', flat=True))
+
+            ids, url = [], '/api/orders?pagination=cursor&page_size=4&sort=' + sort
+            while url:
+                page = self.client.get(url).json()
+                ids += [order['id'] for order in page['data']]
+                url = page['meta']['next']
+
+            with self.subTest(sort=sort):
+                self.assertEqual(ids, expected)
+
+    def test_bad_parameters(self):
+        for query in ('?sort=email', '?created_from=yesterday', '?created_to=2021-02-30'):
+            self.assertEqual(self.client.get('/api/orders' + query).status_code, 400)
+
+
+class ExportFormatsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com')
+        for number in range(3):
+            order = Order.objects.create(
+                first_name='First', last_name='Last', email='order%d@orders.com' % number)
+            for item in range(2):
+                OrderItem.objects.create(
+                    order=order, product_title='Title', price=Decimal('1.10'), quantity=item + 1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(self.user)
+
+    def export(self, query, chunk_size=2):
+        with self.settings(EXPORT_CHUNK_SIZE=chunk_size):
+            response = self.client.get('/api/export' + query)
+            self.assertEqual(response.status_code, 200)
+            return b''.join(response.streaming_content)
+
+    def test_jsonl(self):
+        lines = self.export('?format=jsonl').decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+
+        self.assertEqual([row['email'] for row in rows], ['order0@orders.com', 'order1@orders.com', 'order2@orders.com'])
+        self.assertEqual((rows[0]['total'], rows[0]['item_count']), ('3.30', 2))
+
+        items = [json.loads(line) for line in self.export('?format=jsonl&table=items').decode().splitlines()]
+        self.assertEqual(len(items), 6)
+        self.assertEqual(set(items[0]), {'id', 'order_id', 'product_title', 'price', 'quantity', 'created_at'})
+
+    @skipIf(columnar_format() == 'arrow', 'pyarrow is installed')
+    def test_columnar_json_batches(self):
+        batches = [json.loads(line) for line in self.export('?format=columnar&table=items').decode().splitlines()]
+
+        self.assertEqual([len(batch['id']) for batch in batches], [2, 2, 2])
+        self.assertEqual(sum((batch['quantity'] for batch in batches), []), [1, 2, 1, 2, 1, 2])
+
+    @skipIf(columnar_format() != 'arrow', 'pyarrow is not installed')
+    def test_columnar_arrow_batches(self):
+        import pyarrow
+
+        reader = pyarrow.ipc.open_stream(self.export('?format=columnar&table=items'))
+        batches = list(reader)
+
+        self.assertEqual([batch.num_rows for batch in batches], [2, 2, 2])
+        self.assertEqual(reader.schema.names, ['id', 'order_id', 'product_title', 'price', 'quantity', 'created_at'])
+
+    def test_csv_is_the_same_as_before_streaming(self):
+        # what ExportAPIView used to write, a query per order.
+        expected = io.StringIO()
+        writer = csv.writer(expected)
+        writer.writerow(['ID', 'Name', 'Email', 'Product Title', 'Price', 'Quantity'])
+        for order in Order.objects.order_by('id'):
+            writer.writerow([order.id, order.name, order.email, '', '', ''])
+            for item in OrderItem.objects.filter(order_id=order.id).order_by('id'):
+                writer.writerow(['', '', '', item.product_title, item.price, item.quantity])
+
+        self.assertEqual(self.export('').decode(), expected.getvalue())
+
+    def test_csv_queries_per_chunk(self):
+        for number in range(3, 5):  # <-- 5 orders, chunks of 2: 2 + 2 + 1.
+            Order.objects.create(first_name='First', last_name='Last', email='order%d@orders.com' % number)
+
+        # orders and their items per chunk, then one more query that finds no orders left.
+        with self.assertNumQueries(3 * 2 + 1):
+            content = ''.join(stream_csv(size=2))
+
+        self.assertEqual(content.count('@orders.com'), 5)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/export?format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/export?format=jsonl&table=users').status_code, 400)
+
+
+
+@override_settings(EXPORT_JOBS_SPAWN_WORKER=False, EXPORT_CHUNK_SIZE=2)
+class ExportJobTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com')
+        for number in range(3):
+            order = Order.objects.create(
+                first_name='First', last_name='Last', email='order%d@orders.com' % number)
+            OrderItem.objects.create(
+                order=order, product_title='Title', price=Decimal('1.10'), quantity=1)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+
+        patcher = self.settings(MEDIA_ROOT=self.media_root)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(self.user)
+
+    def start(self):
+        response = self.client.post('/api/export/jobs')
+        self.assertEqual(response.status_code, 202)
+        return ExportJob.objects.get(id=response.json()['data']['id'])
+
+    def download(self, job, byte_range=None):
+        headers = {'HTTP_RANGE': byte_range} if byte_range else {}
+        return self.client.get('/api/export/jobs/%d/download' % job.id, **headers)
+
+    def test_run_job(self):
+        job = self.start()
+        self.assertEqual(job.status, ExportJob.PENDING)
+
+        job = run_job(job.id)
+        self.assertEqual((job.status, job.rows_done, job.total_rows), (ExportJob.DONE, 3, 3))
+
+        response = self.download(job)
+        content = b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(content, self.client.get('/api/export').getvalue())
+        self.assertEqual(job.bytes_written, len(content))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'exports')), [os.path.basename(job.file)])
+
+    def test_only_one_worker_claims_a_job(self):
+        job = self.start()
+
+        self.assertIsNotNone(run_job(job.id))
+        self.assertIsNone(run_job(job.id))  # <-- already done.
+        self.assertIsNone(run_job(job.id + 1))  # <-- no such job.
+
+    def test_ranges(self):
+        job = run_job(self.start().id)
+        size = job.bytes_written
+        with open(file_path(job), 'rb') as f:
+            content = f.read()
+
+        for byte_range, (start, end) in [('bytes=0-9', (0, 9)), ('bytes=10-', (10, size - 1)),
+                                          ('bytes=-5', (size - 5, size - 1)), ('bytes=5-100000', (5, size - 1))]:
+            with self.subTest(byte_range=byte_range):
+                response = self.download(job, byte_range)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], 'bytes %d-%d/%d' % (start, end, size))
+                self.assertEqual(b''.join(response.streaming_content), content[start:end + 1])
+
+        for byte_range in ['bytes=%d-' % size, 'bytes=9-5']:
+            with self.subTest(byte_range=byte_range):
+                response = self.download(job, byte_range)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */%d' % size)
+
+        response = self.download(job, 'bytes=0-1,5-6')  # <-- several ranges, the whole file.
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_not_ready(self):
+        job = self.start()
+        self.assertEqual(self.download(job).status_code, 404)
+
+    def test_stale_job_is_requeued(self):
+        job = self.start()
+        ExportJob.objects.filter(id=job.id).update(
+            status=ExportJob.RUNNING, started_at=timezone.now(),
+            heartbeat_at=timezone.now() - datetime.timedelta(minutes=10), rows_done=2)
+        fresh = self.start()
+        ExportJob.objects.filter(id=fresh.id).update(
+            status=ExportJob.RUNNING, started_at=timezone.now(), heartbeat_at=timezone.now())
+
+        self.assertEqual(requeue_stale_jobs(), [job.id])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_done), (ExportJob.PENDING, 0))
+        self.assertEqual(ExportJob.objects.get(id=fresh.id).status, ExportJob.RUNNING)
+
+        self.assertEqual(run_job(job.id).status, ExportJob.DONE)
+
+    def test_requeued_worker_gives_up(self):
+        job = self.start()
+
+        # the job is requeued (and claimed by another worker) while this one writes it.
+        def requeued(*args, **kwargs):
+            ExportJob.objects.filter(id=job.id).update(started_at=timezone.now())
+            return iter_order_chunks(*args, **kwargs)
+
+        with mock.patch('orders.jobs.iter_order_chunks', requeued):
+            self.assertIsNone(run_job(job.id))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'exports')), [])
+
+    @override_settings(EXPORT_JOBS_SPAWN_WORKER=True)
+    def test_one_worker_drains_quick_posts(self):
+        with mock.patch('orders.jobs.spawn_worker') as spawn_worker:
+            jobs = [self.start() for _ in range(3)]
+        spawn_worker.assert_called_once_with(jobs[0])
+
+        call_command('run_export_jobs', str(jobs[0].id), stdout=StringIO())
+        self.assertEqual(set(ExportJob.objects.values_list('status', flat=True)), {ExportJob.DONE})
+
+        # nothing is running or pending anymore, the next job gets a worker again.
+        with mock.patch('orders.jobs.spawn_worker') as spawn_worker:
+            self.start()
+        self.assertEqual(spawn_worker.call_count, 1)
+
+    @override_settings(EXPORT_JOBS_SPAWN_WORKER=True)
+    def test_running_worker_takes_the_new_jobs(self):
+        running = self.start()
+        ExportJob.objects.filter(id=running.id).update(
+            status=ExportJob.RUNNING, started_at=timezone.now(), heartbeat_at=timezone.now())
+
+        with mock.patch('orders.jobs.spawn_worker') as spawn_worker:
+            self.start()
+        spawn_worker.assert_not_called()
+
+        # its heartbeat stopped (and nothing else is pending), a new worker is spawned.
+        ExportJob.objects.exclude(id=running.id).delete()
+        ExportJob.objects.filter(id=running.id).update(
+            heartbeat_at=timezone.now() - datetime.timedelta(minutes=10))
+        with mock.patch('orders.jobs.spawn_worker') as spawn_worker:
+            self.start()
+        self.assertEqual(spawn_worker.call_count, 1)
+
+    @override_settings(EXPORT_JOBS_SPAWN_WORKER=True)
+    def test_pending_job_that_lost_its_worker(self):
+        lost = self.start()
+        ExportJob.objects.filter(id=lost.id).update(
+            created_at=timezone.now() - datetime.timedelta(minutes=10))
+
+        with mock.patch('orders.jobs.spawn_worker') as spawn_worker:
+            job = self.start()
+        spawn_worker.assert_called_once_with(job)
+
+        call_command('run_export_jobs', str(job.id), stdout=StringIO())
+        self.assertEqual(ExportJob.objects.get(id=lost.id).status, ExportJob.DONE)
+
+    def test_expired_jobs_are_deleted(self):
+        old, recent = run_job(self.start().id), run_job(self.start().id)
+        ExportJob.objects.filter(id=old.id).update(
+            finished_at=timezone.now() - datetime.timedelta(hours=25))
+
+        call_command('run_export_jobs', stdout=StringIO())
+
+        self.assertEqual(list(ExportJob.objects.values_list('id', flat=True)), [recent.id])
+        self.assertFalse(os.path.exists(file_path(old)))
+        self.assertTrue(os.path.exists(file_path(recent)))
+
+
+class AnalyticsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com')
+
+        # (day, email, [(product, price, quantity)])
+        orders = [
+            (1, 'a@orders.com', [('Pen', '1.00', 10), ('Book', '20.00', 1)]),
+            (2, 'b@orders.com', [('Book', '20.00', 2)]),
+            (3, 'a@orders.com', [('Pen', '1.00', 5)]),
+            (3, 'c@orders.com', []),
+        ]
+        for day, email, items in orders:
+            order = Order.objects.create(first_name='First', last_name='Last', email=email)
+            Order.objects.filter(id=order.id).update(
+                created_at=datetime.datetime(2021, 1, day, 12, tzinfo=datetime.timezone.utc))
+            for product, price, quantity in items:
+                OrderItem.objects.create(
+                    order=order, product_title=product, price=Decimal(price), quantity=quantity)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(self.user)
+
+    def get(self, path):
+        response = self.client.get('/api/analytics/' + path)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['data']
+
+    def test_top_products(self):
+        self.assertEqual(self.get('top-products'), [
+            {'product_title': 'Book', 'revenue': 60.0, 'quantity': 3, 'orders': 2},
+            {'product_title': 'Pen', 'revenue': 15.0, 'quantity': 15, 'orders': 2},
+        ])
+        self.assertEqual([row['product_title'] for row in self.get('top-products?by=quantity')], ['Pen', 'Book'])
+        self.assertEqual(self.get('top-products?from=2021-01-02&limit=1'), [
+            {'product_title': 'Book', 'revenue': 40.0, 'quantity': 2, 'orders': 1},
+        ])
+
+    def test_average_order_value(self):
+        self.assertEqual(self.get('average-order-value'), {'orders': 3, 'revenue': 75.0, 'average': 25.0})
+        self.assertEqual(self.get('average-order-value?from=2021-01-03'), {'orders': 1, 'revenue': 5.0, 'average': 5.0})
+        self.assertEqual(self.get('average-order-value?to=2020-12-31'), {'orders': 0, 'revenue': 0.0, 'average': 0.0})
+
+    def test_revenue_per_email(self):
+        self.assertEqual(self.get('revenue-per-email'), [
+            {'email': 'b@orders.com', 'revenue': 40.0, 'orders': 1},
+            {'email': 'a@orders.com', 'revenue': 35.0, 'orders': 2},
+        ])
+        self.assertEqual(self.get('revenue-per-email?to=2021-01-01'), [
+            {'email': 'a@orders.com', 'revenue': 30.0, 'orders': 1},
+        ])
+
+    def test_bad_parameters(self):
+        for query in ('top-products?by=price', 'top-products?limit=0', 'revenue-per-email?from=now',
+                      'average-order-value?tz=Nowhere'):
+            self.assertEqual(self.client.get('/api/analytics/' + query).status_code, 400)
+
+
+class OrderImportTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com'))
+
+    def lines(self, count):
+        return [json.dumps({
+            'first_name': 'First', 'last_name': 'Last', 'email': 'order%d@orders.com' % number,
+            'order_items': [{'product_title': 'Title', 'price': '1.50', 'quantity': 2}],
+        }) for number in range(count)]
+
+    def post(self, lines, query=''):
+        return self.client.generic(
+            'POST', '/api/orders/import' + query, '\n'.join(lines) + '\n',
+            content_type='application/x-ndjson').json()['data']
+
+    def test_import(self):
+        lines = self.lines(5)
+        lines[1] = '{not json'
+        lines[3] = json.dumps({'first_name': 'First', 'email': 'bad', 'order_items': []})
+
+        report = self.post(lines, '?batch_size=2')
+
+        self.assertEqual((report['created'], report['failed'], report['offset']), (3, 2, 5))
+        self.assertEqual([error['row'] for error in report['errors']], [2, 4])
+        self.assertEqual(Order.objects.filter(total=Decimal('3.00'), item_count=1).count(), 3)
+
+    def test_history_keeps_its_dates(self):
+        lines = self.lines(4)
+        lines[0] = lines[0].replace('{', '{"created_at": "2020-01-01T10:00:00+00:00", ', 1)
+        lines[1] = lines[1].replace('{', '{"created_at": "2020-2-1", ', 1)  # <-- as in fixtures/orders.json.
+        lines[2] = lines[2].replace('{', '{"created_at": "yesterday", ', 1)
+
+        report = self.post(lines)
+
+        self.assertEqual((report['created'], report['failed']), (3, 1))
+        self.assertEqual(list(report['errors'][0]['errors']), ['created_at'])
+        dates = Order.objects.order_by('email').values_list('created_at', flat=True)
+        self.assertEqual([date.date() for date in dates], [
+            datetime.date(2020, 1, 1), datetime.date(2020, 2, 1), timezone.now().date()])
+        self.assertEqual(sorted(DailySales.objects.values_list('date', 'total')), [
+            (datetime.date(2020, 1, 1), Decimal('3.00')), (datetime.date(2020, 2, 1), Decimal('3.00')),
+            (timezone.now().date(), Decimal('3.00'))])
+
+        # old enough to be archived.
+        self.assertEqual(archive_batch(archive_cutoff(365)), 2)
+
+    def test_resume_from_offset(self):
+        lines = self.lines(5)
+        real_create_orders = create_orders
+
+        # the second batch fails, the first one stays.
+        calls = []
+
+        def failing_create_orders(batch):
+            calls.append(batch)
+            if len(calls) == 2:
+                raise DatabaseError('connection lost')
+            return real_create_orders(batch)
+
+        with mock.patch('orders.importing.create_orders', failing_create_orders):
+            report = self.post(lines, '?batch_size=2')
+
+        self.assertEqual((report['created'], report['offset'], report['error']), (2, 2, 'connection lost'))
+
+        report = self.post(lines, '?batch_size=2&offset=%d' % report['offset'])
+        self.assertEqual((report['created'], report['offset'], report['error']), (3, 5, None))
+        self.assertEqual(sorted(Order.objects.values_list('email', flat=True)),
+                         ['order%d@orders.com' % number for number in range(5)])
+
+    def test_command(self):
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'orders.jsonl')
+            with open(path, 'w') as f:
+                f.write('\n'.join(self.lines(3)))
+
+            call_command('import_orders', path, '--offset', '1', stdout=out)
+
+        self.assertIn('2 orders created', out.getvalue())
+        self.assertIn('rows/sec', out.getvalue())
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class ArchivingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com'))
+
+        now = timezone.now()
+        self.old_ids = []
+        for days, price in ((800, '1.00'), (700, '2.00'), (600, '4.00'), (10, '8.00')):
+            order = Order.objects.create(first_name='First', last_name='Last', email='order@orders.com')
+            Order.objects.filter(id=order.id).update(created_at=now - datetime.timedelta(days=days))
+            for quantity in (1, 2):
+                OrderItem.objects.create(
+                    order=order, product_title='Title', price=Decimal(price), quantity=quantity)
+            if days > 365:
+                self.old_ids.append(order.id)
+        self.new_id = order.id
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command('archive_orders', '--older-than-days', '365', *args, stdout=out)
+        return out.getvalue()
+
+    def get(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['data']
+
+    def test_archive_in_resumable_batches(self):
+        self.assertIn('3 orders created before', self.archive('--dry-run'))
+
+        self.archive('--batch-size', '2', '--max-batches', '1')  # <-- stops half way.
+        self.assertEqual(sorted(ArchivedOrder.objects.values_list('id', flat=True)), self.old_ids[:2])
+
+        self.assertIn('1 orders archived in 1 batches', self.archive('--batch-size', '2'))
+        self.assertEqual(sorted(ArchivedOrder.objects.values_list('id', flat=True)), self.old_ids)
+        self.assertEqual(list(Order.objects.values_list('id', flat=True)), [self.new_id])
+        self.assertEqual(ArchivedOrderItem.objects.count(), 6)
+        self.assertEqual(OrderItem.objects.count(), 2)
+        self.assertEqual(ArchivedOrder.objects.get(id=self.old_ids[2]).total, Decimal('12.00'))
+        call_command('check_order_totals', stdout=StringIO())
+
+    def test_batch_is_deleted_with_plain_deletes(self):
+        tables = (Order._meta.db_table, OrderItem._meta.db_table)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(archive_batch(archive_cutoff(365)), 3)
+
+        # one DELETE for the items and one for the orders, no row by row post_delete receivers.
+        deletes = [query['sql'] for query in queries
+                   if query['sql'].startswith('DELETE') and query['sql'].split('"')[1] in tables]
+        self.assertEqual(len(deletes), 2)
+        self.assertEqual(OrderItem.objects.count(), 2)
+
+        # and the receivers are back for everyone else.
+        self.assertTrue(post_delete.has_listeners(Order))
+        OrderItem.objects.filter(order_id=self.new_id).first().delete()
+        self.assertEqual(Order.objects.get(id=self.new_id).total, Decimal('16.00'))
+
+    def test_read_endpoints_hot_by_default(self):
+        self.archive()
+
+        self.assertEqual([order['id'] for order in self.get('/api/orders')], [self.new_id])
+        orders = self.get('/api/orders?include_archived=1&sort=created_at')
+        self.assertEqual([order['id'] for order in orders], self.old_ids + [self.new_id])
+        self.assertEqual([len(order['order_items']) for order in orders], [2, 2, 2, 2])
+        orders = self.get('/api/orders?include_archived=1&count_mode=estimated&page_size=2&page=2')
+        self.assertEqual([order['id'] for order in orders], [self.old_ids[1], self.old_ids[0]])
+
+        self.assertEqual(self.client.get('/api/orders/%d' % self.old_ids[0]).status_code, 404)
+        order = self.get('/api/orders/%d?include_archived=1' % self.old_ids[0])
+        self.assertEqual((order['total'], len(order['order_items'])), (3.0, 2))
+
+        self.assertEqual(sum(day['sum'] for day in self.get('/api/chart')), 24.0)
+        self.assertEqual(sum(day['sum'] for day in self.get('/api/chart?include_archived=1')), 45.0)
+        self.assertEqual(self.get('/api/analytics/average-order-value')['orders'], 1)
+        self.assertEqual(self.get('/api/analytics/average-order-value?include_archived=1'),
+                         {'orders': 4, 'revenue': 45.0, 'average': 11.25})
+        self.assertEqual(self.get('/api/analytics/top-products?include_archived=1'),
+                         [{'product_title': 'Title', 'revenue': 45.0, 'quantity': 12, 'orders': 4}])
+
+        export = b''.join(self.client.get('/api/export?format=jsonl&include_archived=1').streaming_content)
+        self.assertEqual(len(export.splitlines()), 4)
+        export = b''.join(self.client.get('/api/export').streaming_content)
+        self.assertEqual(export.count(b'order@orders.com'), 1)
@@ -4,7 +4,15 @@ from . import views
 
 urlpatterns = [
     path('orders', views.OrderGenericAPIView.as_view()),
+    path('orders/batch', views.OrderBatchAPIView.as_view()),
+    path('orders/import', views.OrderImportAPIView.as_view()),
     path('orders/<str:pk>', views.OrderGenericAPIView.as_view()),
     path('export', views.ExportAPIView.as_view()),
+    path('export/jobs', views.ExportJobAPIView.as_view()),
+    path('export/jobs/<str:pk>', views.ExportJobAPIView.as_view()),
+    path('export/jobs/<str:pk>/download', views.ExportJobDownloadAPIView.as_view()),
     path('chart', views.ChartAPIView.as_view()),
+    path('analytics/top-products', views.TopProductsAPIView.as_view()),
+    path('analytics/average-order-value', views.AverageOrderValueAPIView.as_view()),
+    path('analytics/revenue-per-email', views.RevenuePerEmailAPIView.as_view()),
 ]
@@ -1,24 +1,102 @@
-from rest_framework.generics import GenericAPIView
+from rest_framework.generics import GenericAPIView, get_object_or_404
 from rest_framework import mixins
-# from rest_framework import exceptions
+from rest_framework import exceptions, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 # from rest_framework.parsers import MultiPartParser
 # from django.core.files.storage import default_storage
-from django.http import HttpResponse
-import csv
-from django.db import connection
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.http import Http404, StreamingHttpResponse, FileResponse, HttpResponse
+import datetime
+import os
+import re
+import zoneinfo
 
+from admin import importing
+from admin.importing import JSONL_TYPES
 from admin.pagination import CustomPagination
+from admin.serializers import ValuesListModelMixin
 from users.authentication import JWTAuthentication
-from .models import Order, OrderItem
-from .serializers import OrderSerializer
+from .models import Order, ExportJob, ArchivedOrder
+from .charts import GRANULARITIES, get_timezone, sales_chart
+from .analytics import TOP_PRODUCTS_BY, average_order_value, revenue_per_email, top_products
+from .exports import TABLES, columnar_format, stream_csv, stream_columnar, stream_jsonl
+from .jobs import create_job, file_path
+from .importing import OrderImport
+from .serializers import OrderSerializer, OrderValuesSerializer, ExportJobSerializer, \
+    ArchivedOrderSerializer, OrderWithArchivedValuesSerializer
+
+
+# Orders list filters, all optional:
+#   ?created_from=2021-01-01 / ?created_to=2021-01-31 <-- a date (the whole day is included) or a datetime.
+#   ?email=customer@mail.com <-- the orders of a single customer.
+#   ?sort=-created_at <-- one of ORDER_SORTS, id breaks the ties, so pages never overlap.
+# Each of those is backed by an index (look in: models.py), the filters and the sort combine on the same index.
+ORDER_SORTS = ('created_at', '-created_at', 'total', '-total', 'id', '-id')
+DEFAULT_ORDER_SORT = '-created_at'
+
+
+# (moment, whole day or not), a date is the start of that day, or with end=True the start of the next one.
+def parse_created(query_params, name, end=False):
+    value = query_params.get(name)
+    if not value:
+        return None, False
+
+    try:
+        day = parse_date(value)
+        moment = parse_datetime(value) if day is None else None
+    except ValueError:  # <-- well formatted, but not a real date (2021-02-30).
+        moment = day = None
+
+    whole_day = day is not None
+    if whole_day:
+        moment = datetime.datetime.combine(day + datetime.timedelta(days=int(end)), datetime.time.min)
+    elif moment is None:
+        raise exceptions.ValidationError({name: 'expected a YYYY-MM-DD date or an ISO 8601 datetime'})
+
+    if settings.USE_TZ and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment, whole_day
+
+
+def filter_orders(queryset, query_params):
+    created_from, _ = parse_created(query_params, 'created_from')
+    if created_from is not None:
+        queryset = queryset.filter(created_at__gte=created_from)
+
+    created_to, whole_day = parse_created(query_params, 'created_to', end=True)
+    if created_to is not None and whole_day:
+        queryset = queryset.filter(created_at__lt=created_to)
+    elif created_to is not None:
+        queryset = queryset.filter(created_at__lte=created_to)
+
+    email = query_params.get('email')
+    if email:
+        queryset = queryset.filter(email=email)
+
+    return queryset.order_by(*order_sort(query_params))
+
+
+# ?sort=, as the columns to order by: (sort, id in the same direction).
+def order_sort(query_params):
+    sort = query_params.get('sort', DEFAULT_ORDER_SORT)
+    if sort not in ORDER_SORTS:
+        raise exceptions.ValidationError({'sort': 'expected one of: ' + ', '.join(ORDER_SORTS)})
+
+    return sort, '-id' if sort.startswith('-') else 'id'
+
+
+# ?include_archived=1 <-- the archived orders too (look in: archiving.py), read endpoints see hot orders only by default.
+def include_archived(query_params):
+    return query_params.get('include_archived') in ('1', 'true')
 
 
 class OrderGenericAPIView(
         GenericAPIView,
-        mixins.ListModelMixin,
+        ValuesListModelMixin,
         mixins.RetrieveModelMixin,
         mixins.CreateModelMixin,
         mixins.UpdateModelMixin,
@@ -27,69 +105,344 @@ class OrderGenericAPIView(
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPagination
-    queryset = Order.objects.all()
+    # newest first, id breaks the ties of orders created at the same moment,
+    #   without a stable order the same order could show up on two pages.
+    queryset = Order.objects.order_by('-created_at', '-id')
     serializer_class = OrderSerializer
+    values_serializer_class = OrderValuesSerializer  # <-- lists use this one, look in: admin/serializers.py
+
+    # called by .list() (and .retrieve()), look above.
+    def filter_queryset(self, queryset):
+        return filter_orders(queryset, self.request.query_params)
+
+    # the columns ?pagination=cursor walks over, the same as the page is sorted by (?sort=).
+    @property
+    def cursor_ordering(self):
+        return order_sort(self.request.query_params)
 
     def get(self, request, pk=None):
         if pk:
+            try:
+                return Response({
+                    'data': self.retrieve(request, pk).data
+                })
+            except Http404:
+                if not include_archived(request.query_params):
+                    raise
+
             return Response({
-                'data': self.retrieve(request, pk).data
+                'data': ArchivedOrderSerializer(get_object_or_404(
+                    ArchivedOrder.objects.prefetch_related('order_items'), pk=pk)).data
             })
 
         return self.list(request)
 
+    # ?include_archived=1 <-- a page of hot and archived orders, one UNION query, sorted and filtered the same way.
+    def list(self, request, *args, **kwargs):
+        if not include_archived(request.query_params):
+            return super().list(request, *args, **kwargs)
+
+        # the cursor filters the queryset, a UNION can only be sorted and sliced.
+        if self.paginator.use_cursor(request, self):
+            raise exceptions.ValidationError(
+                {'include_archived': 'not supported with cursor pagination'})
+
+        hot = self.filter_queryset(self.get_queryset())
+        archived = filter_orders(ArchivedOrder.objects.all(), request.query_params)
+
+        values_serializer_class = OrderWithArchivedValuesSerializer
+        queryset = values_serializer_class.values(hot.order_by()).union(
+            values_serializer_class.values(archived.order_by()), all=True).order_by(*hot.query.order_by)
+
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(values_serializer_class(page).data)
+
+    # the order together with its items (look in: ingest.py).
+    def post(self, request):
+        return Response({
+            'data': self.create(request).data
+        })
+
+
+# Orders from a JSONL body, one order (with its items) per line (look in: importing.py).
+#   ?offset=<line> <-- resume an import that stopped half way, from the 'offset' of its report.
+#   ?batch_size=500 <-- orders per transaction.
+class OrderImportAPIView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        batch_size = importing.batch_size(request, getattr(settings, 'ORDER_IMPORT_BATCH_SIZE', 500))
+        try:
+            offset = int(request.GET.get('offset', 0))
+        except ValueError:
+            raise exceptions.ValidationError({'offset': 'must be a number'})
+
+        if not request.content_type.startswith(JSONL_TYPES):
+            raise exceptions.UnsupportedMediaType(request.content_type)
+
+        lines = importing.body_lines(request)
+
+        order_import = OrderImport(batch_size=batch_size)
+        order_import.run(order_import.jsonl_rows(lines, offset), offset)
+
+        return Response({
+            'data': order_import.report()
+        })
+
+
+# Many orders per request, for the storefront: [{..., 'order_items': [...]}, ...]
+# The whole body is validated first, a single bad order and nothing is created,
+#   then all the orders and their items are created in one transaction (look in: ingest.py).
+class OrderBatchAPIView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = OrderSerializer(
+            data=request.data, many=True, allow_empty=False,
+            max_length=getattr(settings, 'ORDER_BATCH_MAX_SIZE', 1000))
+        serializer.is_valid(raise_exception=True)
+        orders = serializer.save()
+
+        # no need to send all of it back, the storefront only needs the new ids.
+        return Response({
+            'data': {
+                'created': len(orders),
+                'ids': [order.id for order in orders],
+            }
+        })
+
+
+# ?format=csv <-- default, orders with their items under them.
+# ?format=jsonl|columnar&table=orders|items <-- flat tables, for the analytics jobs (look in: exports.py).
+# ?include_archived=1 <-- the archived orders after the hot ones.
+EXPORT_FORMATS = ('csv', 'jsonl', 'columnar')
+
 
 class ExportAPIView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    # ?format= picks the export format here, not one of DRF's renderers, the export is streamed as is anyway.
+    def perform_content_negotiation(self, request, force=False):
+        return super().perform_content_negotiation(request, force=True)
+
+    # the file is written while it is being sent, chunk by chunk (look in: exports.py).
     def get(self, request):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename=orders.csv'
+        export_format = request.query_params.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise exceptions.ValidationError({'format': 'expected one of: ' + ', '.join(EXPORT_FORMATS)})
+
+        archived = include_archived(request.query_params)
+
+        if export_format == 'csv':
+            response = StreamingHttpResponse(stream_csv(include_archived=archived), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename=orders.csv'
+            return response
+
+        table = request.query_params.get('table', 'orders')
+        if table not in TABLES:
+            raise exceptions.ValidationError({'table': 'expected one of: ' + ', '.join(TABLES)})
+
+        if export_format == 'jsonl':
+            content, content_type, extension = stream_jsonl(
+                table, include_archived=archived), 'application/x-ndjson', 'jsonl'
+        elif columnar_format() == 'arrow':
+            content, content_type, extension = stream_columnar(
+                table, include_archived=archived), 'application/vnd.apache.arrow.stream', 'arrows'
+        else:
+            content, content_type, extension = stream_columnar(
+                table, include_archived=archived), 'application/x-ndjson', 'columns.jsonl'
 
-        orders = Order.objects.all()
-        writer = csv.writer(response)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename=%s.%s' % (table, extension)
+        return response
+
+
+# Background exports (look in: jobs.py).
+#   POST /export/jobs <-- start one.
+#   GET /export/jobs/<pk> <-- status, rows done, rows per second.
+#   GET /export/jobs/<pk>/download <-- the file, with Range support (resumable).
+class ExportJobAPIView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk=None):
+        job = ExportJob.objects.filter(id=pk).first()
+        if job is None:
+            raise exceptions.NotFound("pk doesn't exists")
+
+        return Response({
+            'data': ExportJobSerializer(job).data
+        })
+
+    def post(self, request, pk=None):
+        job = create_job()
+        return Response({
+            'data': ExportJobSerializer(job).data
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class ExportJobDownloadAPIView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
 
-        writer.writerow(
-            ['ID', 'Name', 'Email', 'Product Title', 'Price', 'Quantity'])
+    block_size = 64 * 1024
+
+    def get(self, request, pk=None):
+        job = ExportJob.objects.filter(id=pk).first()
+        if job is None or job.status != ExportJob.DONE:
+            raise exceptions.NotFound('export is not ready')
 
-        for order in orders:
+        path = file_path(job)
+        size = os.path.getsize(path)
+        byte_range = self.parse_range(request.META.get('HTTP_RANGE'), size)
 
-            writer.writerow([order.id,  # type: ignore
-                             order.name, order.email, '', '', ''])
-            orderItems = OrderItem.objects.all().filter(order_id=order.id)  # type: ignore
+        # no (usable) Range header, the whole file.
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), as_attachment=True,
+                                    filename='orders.csv', content_type='text/csv')
+            response['Accept-Ranges'] = 'bytes'
+            return response
 
-            for item in orderItems:
-                writer.writerow(
-                    ['', '', '', item.product_title, item.price, item.quantity])
+        if byte_range is False:
+            response = HttpResponse(
+                status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
 
+        start, end = byte_range
+        response = StreamingHttpResponse(self.read(
+            path, start, end), status=status.HTTP_206_PARTIAL_CONTENT, content_type='text/csv')
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Disposition'] = 'attachment; filename=orders.csv'
+        response['Accept-Ranges'] = 'bytes'
         return response
 
+    # 'bytes=100-199' / 'bytes=100-' / 'bytes=-100' --> (start, end), both inclusive.
+    # None <-- no Range, or one we don't handle (several ranges) - send the whole file.
+    # False <-- a range outside the file.
+    @staticmethod
+    def parse_range(header, size):
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', (header or '').strip())
+        if match is None or match.groups() == ('', ''):
+            return None
+
+        first, last = match.groups()
+        if first == '':  # <-- the last N bytes.
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+
+        if start >= size or start > end:
+            return False
+        return start, end
+
+    def read(self, path, start, end):
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                block = f.read(min(self.block_size, remaining))
+                if not block:
+                    return
+                remaining -= len(block)
+                yield block
+
+
+# ?from=2021-01-01&to=2021-01-31 <-- both are optional, and inclusive.
+def parse_day(query_params, name):
+    value = query_params.get(name)
+    if not value:
+        return None
+
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise exceptions.ValidationError({name: 'expected a YYYY-MM-DD date'})
+
+
+# ?tz=Europe/Berlin <-- which timezone days start in, default settings.TIME_ZONE.
+def parse_timezone(query_params):
+    try:
+        return get_timezone(query_params.get('tz'))
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise exceptions.ValidationError({'tz': 'unknown timezone'})
+
 
+# Sum of orders per period (look in: charts.py).
+#   ?granularity=day|week|month <-- default day.
+#   ?tz= <-- look above.
+#   ?include_archived=1 <-- the archived orders too.
 class ChartAPIView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
-    def get(self, _):
-        with connection.cursor() as cursor:
-            # Sum of orders per date
-            cursor.execute(
-                """
-                SELECT
-                    DATE_FORMAT(ord.created_at, '%Y-%m-%d') as date
-                    , SUM(ordi.quantity * ordi.price) as sum
-                FROM orders_order as ord
-                    JOIN orders_orderitem as ordi
-                        ON ord.id = ordi.order_id
-                GROUP BY date
-                """)
-
-            query_results = cursor.fetchall()
-            return_data = [{
-                'date': result[0],
-                'sum': result[1]
-            } for result in query_results]
+    def get(self, request):
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            raise exceptions.ValidationError(
+                {'granularity': 'expected one of: ' + ', '.join(GRANULARITIES)})
+
+        tz = parse_timezone(request.query_params)
+
+        return Response({
+            'data': sales_chart(
+                granularity, tz,
+                parse_day(request.query_params, 'from'),
+                parse_day(request.query_params, 'to'),
+                include_archived(request.query_params))
+        })
+
+
+# Sales analytics (look in: analytics.py), all of them take ?from= / ?to= / ?tz= / ?include_archived= (look above).
+class AnalyticsAPIView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def window(self, request):
+        return {
+            'start': parse_day(request.query_params, 'from'),
+            'end': parse_day(request.query_params, 'to'),
+            'tz': parse_timezone(request.query_params),
+            'include_archived': include_archived(request.query_params),
+        }
+
+    # ?limit=10 <-- up to 100.
+    def limit(self, request):
+        limit = request.query_params.get('limit', '10')
+        if not limit.isdigit() or not 0 < int(limit) <= 100:
+            raise exceptions.ValidationError({'limit': 'expected a number from 1 to 100'})
+        return int(limit)
 
+
+# ?by=revenue|quantity <-- default revenue.
+class TopProductsAPIView(AnalyticsAPIView):
+
+    def get(self, request):
+        by = request.query_params.get('by', 'revenue')
+        if by not in TOP_PRODUCTS_BY:
+            raise exceptions.ValidationError({'by': 'expected one of: ' + ', '.join(TOP_PRODUCTS_BY)})
+
+        return Response({
+            'data': top_products(by=by, limit=self.limit(request), **self.window(request))
+        })
+
+
+class AverageOrderValueAPIView(AnalyticsAPIView):
+
+    def get(self, request):
+        return Response({
+            'data': average_order_value(**self.window(request))
+        })
+
+
+class RevenuePerEmailAPIView(AnalyticsAPIView):
+
+    def get(self, request):
         return Response({
-            'data': return_data
+            'data': revenue_per_email(limit=self.limit(request), **self.window(request))
         })
@@ -0,0 +1,22 @@
+from decimal import Decimal
+
+from admin.benchmarks import SerializerBenchmarkCommand
+from products.models import Product
+from products.serializers import ProductSerializer, ProductValuesSerializer
+
+
+# python manage.py benchmark_product_serializers --rows 10000 (look in: admin/benchmarks.py).
+
+
+class Command(SerializerBenchmarkCommand):
+
+    def seed(self, rows):
+        Product.objects.bulk_create((Product(
+            title='Title %d' % number, description='Description %d' % number,
+            image='image%d.png' % number, price=Decimal('9.99'))
+            for number in range(rows)), batch_size=5000)
+
+    def cases(self):
+        return [
+            ('products', ProductSerializer, ProductValuesSerializer, Product.objects.order_by('id')),
+        ]
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 # from rest_framework import exceptions
 
+from admin.serializers import ValuesSerializer
 from .models import Product
 
 
@@ -8,3 +9,8 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
+
+
+# Same output as ProductSerializer, for big list pages (look in: admin/serializers.py).
+class ProductValuesSerializer(ValuesSerializer):
+    serializer_class = ProductSerializer
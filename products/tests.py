@@ -1,3 +1,173 @@
-from django.test import TestCase
+import os
+import hashlib
+import tempfile
+from decimal import Decimal
+from unittest import mock
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from users.models import Users
+from users.authentication import generate_access_token
+from .models import Product
+from .serializers import ProductSerializer, ProductValuesSerializer
+from .views import serve_media
+
+
+class ProductValuesSerializerParityTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com')
+
+        for number, price in enumerate(['0.50', '10.00', '99999999.99', '3.1']):
+            Product.objects.create(
+                title='Title #%d' % number, description='Description #%d' % number,
+                image='image%d.png' % number, price=Decimal(price))
+
+    def test_same_json_as_product_serializer(self):
+        queryset = Product.objects.order_by('id')
+
+        expected = JSONRenderer().render(ProductSerializer(queryset, many=True).data)
+        actual = JSONRenderer().render(
+            ProductValuesSerializer(ProductValuesSerializer.values(queryset)).data)
+
+        self.assertEqual(actual, expected)
+
+    def test_same_json_from_the_list_endpoint(self):
+        client = APIClient()
+        client.cookies['jwt'] = generate_access_token(self.user)
+
+        expected = client.get('/api/products?serializer=model').content
+        actual = client.get('/api/products').content
+
+        self.assertEqual(actual, expected)
+
+
+class ProductListCursorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com')
+        Product.objects.bulk_create([Product(
+            title='Title #%d' % number, description='Description', image='image.png', price=Decimal('1.00'))
+            for number in range(7)])
+        cls.every_id = list(Product.objects.order_by('id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(self.user)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_next_and_previous_links(self):
+        pages = []
+        data = self.get('/api/products?pagination=cursor&page_size=2')
+        while True:
+            pages.append([product['id'] for product in data['data']])
+            if data['meta']['next'] is None:
+                break
+            data = self.get(data['meta']['next'])
+
+        # every product once, in order, no gaps and no repeats.
+        self.assertEqual(sum(pages, []), self.every_id)
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+
+        back = []
+        while data['meta']['previous'] is not None:
+            data = self.get(data['meta']['previous'])
+            back.append([product['id'] for product in data['data']])
+        self.assertEqual(back, pages[-2::-1])
+
+    def test_page_numbers_override_the_view(self):
+        with mock.patch('products.views.ProductGenericAPIView.pagination_mode', 'cursor', create=True):
+            self.assertEqual(self.get('/api/products')['meta']['pagination'], 'cursor')
+
+            data = self.get('/api/products?pagination=page&page_size=2&page=4')
+            self.assertNotIn('pagination', data['meta'])
+            self.assertEqual((data['meta']['last_page'], len(data['data'])), (4, 1))
+
+
+class FileUploadTest(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com'))
+
+    def upload(self, content, name='My project.PNG'):
+        with self.settings(MEDIA_ROOT=self.media_root, UPLOAD_MAX_SIZE=1024, UPLOAD_CHUNK_SIZE=100):
+            return self.client.post('/api/upload', {'image': SimpleUploadedFile(name, content)})
+
+    def stored_files(self):
+        return [os.path.relpath(os.path.join(root, name), self.media_root)
+                for root, _, names in os.walk(self.media_root) for name in names]
+
+    def test_same_content_is_stored_once(self):
+        content = b'\x89PNG' + bytes(range(256)) * 3
+        digest = hashlib.sha256(content).hexdigest()
+
+        first = self.upload(content).json()
+        second = self.upload(content, name='copy of it.png').json()
+
+        self.assertEqual(first['url'], 'http://localhost:8000/api/media/images/%s/%s.png' % (digest[:2], digest))
+        self.assertEqual((first['sha256'], first['size'], first['duplicate']), (digest, len(content), False))
+        self.assertEqual((second['url'], second['duplicate']), (first['url'], True))
+        self.assertEqual(self.stored_files(), ['images/%s/%s.png' % (digest[:2], digest)])
+
+    def test_same_content_at_the_same_time(self):
+        content = b'\x89PNG' + bytes(range(256))
+        first = self.upload(content).json()
+
+        # the other upload stored it between our exists() and save(), only our own look up misses it.
+        exists = default_storage.exists
+        missed = []
+
+        def racing_exists(name):
+            if not missed:
+                missed.append(name)
+                return False
+            return exists(name)
+
+        with mock.patch.object(default_storage, 'exists', racing_exists):
+            second = self.upload(content).json()
+
+        self.assertEqual((second['url'], second['duplicate']), (first['url'], True))
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_size_limit(self):
+        self.assertEqual(self.upload(b'x' * 1025).status_code, 413)
+        self.assertEqual(self.upload(b'x' * 200 * 1024).status_code, 413)  # <-- refused by Content-Length.
+        self.assertEqual(self.stored_files(), [])
+
+    def test_no_file(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            self.assertEqual(self.client.post('/api/upload', {'title': 'no image'}).status_code, 400)
+
+    def test_exports_are_not_served(self):
+        for directory in ['images', 'exports']:
+            os.makedirs(os.path.join(self.media_root, directory))
+            with open(os.path.join(self.media_root, directory, 'file.csv'), 'w') as f:
+                f.write('secret')
+
+        request = RequestFactory().get('/')
+        with self.settings(MEDIA_ROOT=self.media_root):
+            response = serve_media(request, 'images/file.csv')
+            self.assertEqual(b''.join(response.streaming_content), b'secret')
+            response.close()
+
+            for path in ['exports/file.csv', 'images/../exports/file.csv', '/exports/file.csv']:
+                with self.subTest(path=path), self.assertRaises(Http404):
+                    serve_media(request, path)
@@ -0,0 +1,104 @@
+import os
+import re
+import hashlib
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from rest_framework import exceptions
+
+
+# Image uploads (look in: views.py), used to be read whole and saved under their own name,
+#   so the same image uploaded twice ended up twice: 'My project-1 (6).png', 'My project-1 (6)_Fay4s0S.png'.
+# Now:
+#   1. the body is streamed to a temporary file, chunk by chunk (settings.UPLOAD_CHUNK_SIZE),
+#       and the SHA-256 of the file is computed from those same chunks, no second read,
+#   2. a body / file bigger than settings.UPLOAD_MAX_SIZE is refused (413) before it is read (Content-Length),
+#       or as soon as it goes over while streaming, never after it was buffered,
+#   3. the file is stored under its hash (content addressed): images/<2 first hex>/<sha256><extension>,
+#       the same content is the same name, an upload that already exists is not written again,
+#       a new one is moved (renamed) from the temporary file into place, not copied.
+
+# the multipart boundaries and headers around the file, on top of the file itself.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(exceptions.APIException):
+    status_code = 413
+    default_detail = 'Upload too large.'
+    default_code = 'upload_too_large'
+
+
+def max_size():
+    return getattr(settings, 'UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+
+
+# a Content-Length that is already too big, is refused without reading a byte of the body.
+def check_content_length(request):
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+
+    if content_length > max_size() + MULTIPART_OVERHEAD:
+        raise UploadTooLarge()
+
+
+# Every file of the request goes to a temporary file on disk, its size and SHA-256 are kept up to date per chunk.
+class HashingUploadHandler(FileUploadHandler):
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.chunk_size = getattr(settings, 'UPLOAD_CHUNK_SIZE', 64 * 1024)
+        self.too_large = False
+        self.file = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = TemporaryUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > max_size():
+            # stop reading the body right here, the view answers 413 (look in: views.py).
+            self.too_large = True
+            self.file.close()
+            raise StopUpload(connection_reset=True)
+
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.sha256.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if self.file is not None:
+            self.file.close()  # <-- removes the temporary file.
+
+
+# '.PNG' -> '.png', anything odd is dropped, the name itself never matters.
+def extension(file_name):
+    ext = os.path.splitext(file_name or '')[1].lower()
+    return ext if re.fullmatch(r'\.[a-z0-9]{1,10}', ext) else ''
+
+
+# (name in the storage, already existed or not)
+def store(upload):
+    name = 'images/%s/%s%s' % (upload.sha256[:2], upload.sha256, extension(upload.name))
+    if default_storage.exists(name):
+        return name, True
+
+    # two identical uploads at the same time can both miss above,
+    #   the storage then saves the second one under another name (<sha256>_XXXXXXX.png),
+    #   the same content is already in place, so that copy is thrown away.
+    stored = default_storage.save(name, upload)
+    if stored != name:
+        default_storage.delete(stored)
+        return name, True
+    return stored, False
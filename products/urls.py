@@ -1,6 +1,6 @@
-from django.urls import path
+import re
+from django.urls import path, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 
 from . import views
 
@@ -9,4 +9,11 @@ urlpatterns = [
     path('products/<str:pk>', views.ProductGenericAPIView.as_view()),
     path('upload', views.FileUploadView.as_view())
 
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)  # <-- set up static path.
+]
+
+# set up static path, only while developing - same as django.conf.urls.static.static(),
+#   but without exports/ (look in: views.py, serve_media).
+if settings.DEBUG:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), views.serve_media),
+    ]
@@ -1,21 +1,27 @@
+import posixpath
 from rest_framework.generics import GenericAPIView
 from rest_framework import mixins
-# from rest_framework import exceptions
+from rest_framework import exceptions
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser
+from django.conf import settings
 from django.core.files.storage import default_storage
+from django.http import Http404
+from django.views.static import serve
 
 from admin.pagination import CustomPagination
+from admin.serializers import ValuesListModelMixin
 from users.authentication import JWTAuthentication
 from .models import Product
-from .serializers import ProductSerializer
+from .serializers import ProductSerializer, ProductValuesSerializer
+from .uploads import HashingUploadHandler, UploadTooLarge, check_content_length, store
 
 
 class ProductGenericAPIView(
         GenericAPIView,
-        mixins.ListModelMixin,
+        ValuesListModelMixin,
         mixins.RetrieveModelMixin,
         mixins.CreateModelMixin,
         mixins.UpdateModelMixin,
@@ -25,8 +31,10 @@ class ProductGenericAPIView(
     authentication_classes = [JWTAuthentication]  # <-- is user authenticated.
     permission_classes = [IsAuthenticated]  # <-- does user have permissions.
     pagination_class = CustomPagination
+    cursor_ordering = 'id'  # <-- the column ?pagination=cursor walks over.
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    values_serializer_class = ProductValuesSerializer  # <-- lists use this one, look in: admin/serializers.py
 
     def get(self, request, pk=None):
         if pk:
@@ -56,11 +64,34 @@ class FileUploadView(APIView):
     permission_classes = [IsAuthenticated]
     parser_classes = (MultiPartParser,)
 
+    # streamed to disk, hashed on the way, stored once per content (look in: uploads.py).
     def post(self, request):
-        file = request.FILES['image']
-        file_name = default_storage.save(file.name, file)
+        check_content_length(request)
+
+        handler = HashingUploadHandler(request)
+        request.upload_handlers = [handler]  # <-- before request.FILES is touched, that is when the body is read.
+
+        file = request.FILES.get('image')
+        if handler.too_large:
+            raise UploadTooLarge()
+        if file is None:
+            raise exceptions.ValidationError({'image': 'No file was submitted.'})
+
+        file_name, duplicate = store(file)
         url = default_storage.url(file_name)
 
         return Response({
-            'url': 'http://localhost:8000/api' + url
+            'url': 'http://localhost:8000/api' + url,
+            'sha256': file.sha256,
+            'size': file.size,
+            'duplicate': duplicate,
         })
+
+
+# MEDIA_ROOT is served as is (uploaded images), except exports/:
+#   export files are only downloaded through their job, by an authenticated user (look in: orders/jobs.py).
+# The path is normalized first, 'images/../exports/...' is the same file as 'exports/...'.
+def serve_media(request, path):
+    if posixpath.normpath(path).lstrip('/').split('/')[0] == 'exports':
+        raise Http404()
+    return serve(request, path, document_root=settings.MEDIA_ROOT)
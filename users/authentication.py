@@ -1,10 +1,20 @@
 import jwt
+import uuid
+import time
+import hashlib
 import datetime
+import threading
+from collections import OrderedDict
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from rest_framework.authentication import BaseAuthentication
 from rest_framework import exceptions
 
-from .models import Users
+from .models import Users, RevokedToken
+from .permissions import role_permissions
 
 
 # This .py will use a Json Web Token for user authorization.
@@ -14,17 +24,322 @@ from .models import Users
 # Useful explanation: https://www.youtube.com/watch?v=7Q17ubqLfaM&ab_channel=WebDevSimplified
 # the HS256 algo: https://auth0.com/blog/rs256-vs-hs256-whats-the-difference/
 
+# Self-contained claims (opt-in with settings.JWT_SELF_CONTAINED_CLAIMS):
+#   the token also carries the 'role_id' and the 'stamp' (Users.security_stamp) of the user,
+#   so authentication does not have to query the user on every request,
+#       the permission check only needs the role id (look in: permissions.py),
+#       and the stamp is validated against an in-process cache (see: SecurityStampCache).
+
+
+def self_contained_claims():
+    return getattr(settings, 'JWT_SELF_CONTAINED_CLAIMS', False)
+
+
 # create a session for user that passed log-in.
 #   make user authenticated
 def generate_access_token(user):
+    lifetime = getattr(settings, 'JWT_ACCESS_TOKEN_LIFETIME', 60)
+    payload = {
+        # expire on = now + the access token lifetime (minutes).
+        'user_id': user.id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=lifetime), 'iat': datetime.datetime.utcnow()
+    }
+
+    if self_contained_claims():
+        payload['role_id'] = user.role_id
+        payload['stamp'] = user.security_stamp
+
+    token = jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
+    return token
+
+
+############################################################################################
+##  Refresh tokens  ########################################################################
+############################################################################################
+
+# The access token is short lived, when it expires the client asks for a new one with the refresh token,
+#   instead of logging in again (and paying for the password hash again).
+# A refresh token is used once: refreshing revokes it and hands out a new one (rotation).
+# The refresh token also carries the security stamp, a password / role change revokes all of them.
+
+
+def generate_refresh_token(user):
+    lifetime = getattr(settings, 'JWT_REFRESH_TOKEN_LIFETIME', 14)
     payload = {
-        # expire on = now + the difference between now and 60 minutes from now = expire after 60 minutes.
-        'user_id': user.id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=60), 'iat': datetime.datetime.utcnow()
+        'type': 'refresh', 'jti': uuid.uuid4().hex, 'user_id': user.id, 'stamp': user.security_stamp,
+        # expire on = now + the refresh token lifetime (days).
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(days=lifetime), 'iat': datetime.datetime.utcnow()
     }
 
     token = jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
     return token
 
+
+def decode_refresh_token(token):
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        raise exceptions.AuthenticationFailed('un-authenticated')
+
+    if payload.get('type') != 'refresh' or token_denylist.is_revoked(payload['jti']):
+        raise exceptions.AuthenticationFailed('un-authenticated')
+
+    return payload
+
+
+# Revoked refresh tokens: {jti (16 raw bytes): exp}
+#   a revoked token only has to be remembered until it would have expired anyway.
+# With settings.JWT_DENYLIST_DB_MIRROR every revocation is also written to the RevokedToken table,
+#   and the table is loaded (once) by each process, so revocations survive a restart.
+
+
+class TokenDenylist:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revoked = {}
+        self._loaded = False
+
+    @staticmethod
+    def mirrored():
+        return getattr(settings, 'JWT_DENYLIST_DB_MIRROR', False)
+
+    def _load(self):
+        if self._loaded or not self.mirrored():
+            return
+
+        now = timezone.now()
+        RevokedToken.objects.filter(expires_at__lte=now).delete()
+        rows = RevokedToken.objects.values_list('jti', 'expires_at')
+
+        with self._lock:
+            for jti, expires_at in rows:
+                self._revoked[uuid.UUID(jti).bytes] = expires_at.timestamp()
+            self._loaded = True
+
+    def is_revoked(self, jti):
+        self._load()
+        return uuid.UUID(jti).bytes in self._revoked
+
+    def revoke(self, jti, exp):
+        self.claim(jti, exp)
+
+    # revoke a token, True <-- this call revoked it, False <-- it already was revoked.
+    # Two requests refreshing with the same token at the same time: only one of them gets True,
+    #   in this process that is the check-and-insert under the lock,
+    #   across processes (the DB mirror) it is the INSERT that fails on the unique jti.
+    def claim(self, jti, exp):
+        self._load()
+        key = uuid.UUID(jti).bytes
+        now = time.time()
+
+        with self._lock:
+            if key in self._revoked:
+                return False
+            self._revoked[key] = exp
+
+            # forget tokens that expired meanwhile.
+            for old in [old for old, old_exp in self._revoked.items() if old_exp <= now]:
+                del self._revoked[old]
+
+        if self.mirrored():
+            try:
+                with transaction.atomic():
+                    RevokedToken.objects.create(
+                        jti=jti, expires_at=datetime.datetime.fromtimestamp(exp, tz=datetime.timezone.utc))
+            except IntegrityError:
+                return False  # <-- another process revoked it first.
+
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._revoked.clear()
+            self._loaded = False
+
+
+token_denylist = TokenDenylist()
+
+
+############################################################################################
+##  Loading the user  ######################################################################
+############################################################################################
+
+# Load the user, the role and the permissions of the role all at once:
+#   select_related('role') <-- the role comes with the user row (a JOIN).
+#   prefetch_related('role__permissions') <-- one more query for all the permissions.
+# The result becomes request.user, so everything later in the request (ViewPermissions,
+#   UserSerializer(request.user), ...) reuses it instead of lazy loading role / permissions again.
+# The role version is read BEFORE the permissions are fetched (same as RolePermissionRegistry.get),
+#   a role changed in between is not cached with the names from before the change.
+
+
+def load_user(user_id):
+    user = Users.objects.select_related('role').filter(id=user_id).first()
+    if user is None or user.role is None:
+        return user
+
+    version = role_permissions.version(user.role_id)
+    prefetch_related_objects([user], 'role__permissions')
+
+    # the permissions were fetched anyway, compile them for ViewPermissions.
+    role_permissions.store(
+        user.role_id, [p.name for p in user.role.permissions.all()], version)
+
+    return user
+
+
+############################################################################################
+##  Security stamps  #######################################################################
+############################################################################################
+
+# {user_id: (security_stamp, fetched_at)}
+# an entry is trusted for settings.JWT_STAMP_CACHE_TTL seconds, after that it is fetched again,
+#   that is how a password / role change made by another process reaches this one.
+# changes made by this process update the cache right away (look in: signals.py).
+
+
+class SecurityStampCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stamps = {}
+
+    def get(self, user_id):
+        ttl = getattr(settings, 'JWT_STAMP_CACHE_TTL', 30)
+        entry = self._stamps.get(user_id)
+        if entry is not None and time.monotonic() - entry[1] < ttl:
+            return entry[0]
+
+        # None <-- the user does not exist (anymore).
+        stamp = Users.objects.filter(id=user_id).values_list(
+            'security_stamp', flat=True).first()
+        self.set(user_id, stamp)
+        return stamp
+
+    def set(self, user_id, stamp):
+        with self._lock:
+            self._stamps[user_id] = (stamp, time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._stamps.clear()
+
+
+security_stamps = SecurityStampCache()
+
+
+############################################################################################
+##  Decoded tokens  ########################################################################
+############################################################################################
+
+# A dashboard sends the same cookie hundreds of times, there is no point to verify the HS256 signature every time.
+# This is a bounded LRU cache: {sha256(token): (payload, exp)}
+#   only tokens that were verified by jwt.decode get in,
+#   an entry is dropped at the token 'exp', so the cache never extends the life of a token,
+#   when the cache is full, the least recently used token is dropped.
+
+
+class DecodedTokenCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token):
+        if isinstance(token, str):
+            token = token.encode()
+        return hashlib.sha256(token).digest()
+
+    def maxsize(self):
+        return getattr(settings, 'JWT_DECODED_TOKEN_CACHE_SIZE', 1024)
+
+    def get(self, token):
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            # expired, let jwt.decode say so.
+            if entry is not None:
+                del self._entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, token, payload):
+        maxsize = self.maxsize()
+        if maxsize <= 0 or 'exp' not in payload:
+            return
+
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = (payload, payload['exp'])
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize(),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+decoded_tokens = DecodedTokenCache()
+
+
+def decode_access_token(token):
+    payload = decoded_tokens.get(token)
+
+    if payload is None:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
+        decoded_tokens.put(token, payload)
+
+    return payload
+
+
+############################################################################################
+##  Lazy principal  ########################################################################
+############################################################################################
+
+# What request.user is, when the token carries self-contained claims.
+# id, pk and role_id are known from the token itself, that is enough for authentication and permissions.
+# The actual Users row is loaded only when a view touches any other attribute (first_name, save(), ...).
+
+
+class TokenPrincipal(SimpleLazyObject):
+
+    def __init__(self, user_id, role_id):
+        super().__init__(lambda: load_user(user_id))
+
+        # plain attributes are found before LazyObject.__getattr__ kicks in, so these never hit the DB.
+        self.__dict__['id'] = user_id
+        self.__dict__['pk'] = user_id
+        self.__dict__['role_id'] = role_id
+        self.__dict__['is_authenticated'] = True
+        self.__dict__['is_anonymous'] = False
+
+    # IsAuthenticated does bool(request.user), that must not load the user.
+    def __bool__(self):
+        return True
+
+
 # authenticate incoming user
 #   check if user authenticated
 
@@ -39,16 +354,29 @@ class JWTAuthentication(BaseAuthentication):
             return None
 
         try:
-            payload = jwt.decode(
-                token, settings.SECRET_KEY, algorithms=['HS256'])
+            payload = decode_access_token(token)
         except jwt.ExpiredSignatureError:
             raise exceptions.AuthenticationFailed('un-authenticated')
 
-        # Notice there is a difference between:
-        # Users.objects.filter(id=payload['user_id']) <-- a Whole query set, that can contain one result
-        # Users.objects.filter(id=payload['user_id']).first() <-- a Result of a Query Set !
+        # a refresh token is not an access token.
+        if payload.get('type') == 'refresh':
+            raise exceptions.AuthenticationFailed('un-authenticated')
+
+        # tokens that were generated with self-contained claims, skip the user query.
+        if self_contained_claims() and 'stamp' in payload:
+            stamp = security_stamps.get(payload['user_id'])
+
+            if stamp is None:
+                raise exceptions.AuthenticationFailed('user not found')
+
+            # password or role changed after this token was generated.
+            if stamp != payload['stamp']:
+                raise exceptions.AuthenticationFailed('un-authenticated')
+
+            return (TokenPrincipal(payload['user_id'], payload['role_id']), None)
 
-        user = Users.objects.filter(id=payload['user_id']).first()
+        # the user, the role and the permissions of the role (look above).
+        user = load_user(payload['user_id'])
 
         if user is None:
             raise exceptions.AuthenticationFailed('user not found')
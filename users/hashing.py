@@ -0,0 +1,146 @@
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import exceptions
+
+
+# Hashing a password (PBKDF2) is slow on purpose, and it used to run on the request thread,
+#   a burst of logins would block every other request on the same worker.
+# This .py runs the hashing on a small, bounded, pool of threads:
+#   settings.PASSWORD_HASHING_WORKERS <-- how many hashes run at the same time.
+#   settings.PASSWORD_HASHING_MAX_PENDING <-- how many more may wait in the queue,
+#       anything beyond that is rejected with a 503 instead of piling up.
+# hashlib releases the GIL while hashing, so threads are enough here.
+# A request that waits longer than settings.PASSWORD_HASHING_TIMEOUT gets the same 503.
+# Only pure hashing runs on the pool, anything that touches the database stays on the request thread.
+
+
+class PasswordHashingBusy(exceptions.APIException):
+    status_code = 503
+    default_detail = 'Too many password operations, try again later.'
+    default_code = 'password_hashing_busy'
+
+
+class PasswordHashingPool:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self.queued = 0  # <-- submitted, waiting for a worker.
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def workers(self):
+        return getattr(settings, 'PASSWORD_HASHING_WORKERS', 4)
+
+    def max_pending(self):
+        return getattr(settings, 'PASSWORD_HASHING_MAX_PENDING', 32)
+
+    def _setup(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers(), thread_name_prefix='password-hashing')
+                self._slots = threading.BoundedSemaphore(
+                    self.workers() + self.max_pending())
+
+    def _count(self, name, delta):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    # block=False <-- a request that finds the queue full is rejected right away,
+    # block=True <-- bulk work (imports) waits for a free slot instead.
+    def submit(self, fn, *args, block=False):
+        self._setup()
+
+        if not self._slots.acquire(blocking=block):
+            self._count('rejected', 1)
+            raise PasswordHashingBusy()
+
+        def task():
+            self._count('queued', -1)
+            self._count('running', 1)
+            try:
+                return fn(*args)
+            finally:
+                self._count('running', -1)
+                self._count('completed', 1)
+                self._slots.release()
+
+        # a task cancelled while still in the queue never runs, give its slot back here.
+        def cancelled(future):
+            if future.cancelled():
+                self._count('queued', -1)
+                self._slots.release()
+
+        self._count('queued', 1)
+        future = self._executor.submit(task)
+        future.add_done_callback(cancelled)
+        return future
+
+    # wait on the request thread (WSGI, plain DRF views).
+    def run(self, fn, *args):
+        timeout = getattr(settings, 'PASSWORD_HASHING_TIMEOUT', 30)
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # still queued <-- dropped, already hashing <-- finishes, nobody waits for it.
+            future.cancel()
+            self._count('rejected', 1)
+            raise PasswordHashingBusy()
+
+    # hash many at once, in parallel, results are in the same order.
+    # At most workers() of them hold a slot at any time, the rest of the slots stay free for
+    #   logins / registers (run() never waits for a slot), so an import never gets them rejected.
+    def map(self, fn, items):
+        window = collections.deque()
+        results = []
+        for item in items:
+            if len(window) >= self.workers():
+                results.append(window.popleft().result())
+            window.append(self.submit(fn, item, block=True))
+        results.extend(future.result() for future in window)
+        return results
+
+    def stats(self):
+        return {
+            'workers': self.workers(),
+            'max_pending': self.max_pending(),
+            'queue_depth': self.queued,
+            'running': self.running,
+            'completed': self.completed,
+            'rejected': self.rejected,
+        }
+
+
+hashing_pool = PasswordHashingPool()
+
+
+# same as Django's check_password / must_update, but without the 'setter',
+#   the setter saves the user and that must not happen on a pool thread.
+def needs_rehash(encoded):
+    preferred = hashers.get_hasher('default')
+    hasher = hashers.identify_hasher(encoded)
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def set_password(user, raw_password):
+    # Users.set_password only hashes and sets attributes, nothing is saved yet.
+    hashing_pool.run(user.set_password, raw_password)
+
+
+def check_password(user, raw_password):
+    if not hashing_pool.run(hashers.check_password, raw_password, user.password):
+        return False
+
+    # the password was hashed with older settings, upgrade it now that we know it.
+    if needs_rehash(user.password):
+        set_password(user, raw_password)
+        user.save(update_fields=['password'])
+
+    return True
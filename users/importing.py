@@ -0,0 +1,176 @@
+import csv
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from admin.importing import MAX_ERRORS, jsonl_rows
+from admin.pagination import invalidate_counts
+from .models import Users, Role
+from .hashing import hashing_pool
+
+
+# Bulk import of users from a CSV or JSONL body, one user per row:
+#   {"first_name": ?, "last_name": ?, "email": ?, "password": ?, "role_id": ?}
+# The body is read row by row, never as a whole, valid rows are collected into batches and each batch:
+#   1. checks which emails already exist (one query),
+#   2. hashes all the passwords in parallel (look in: hashing.py),
+#   3. writes all the users with a single bulk_create.
+# The result is a report, how many users were created and what was wrong with every row that was not
+#   (the first MAX_ERRORS of them, the rest are only counted).
+
+# Same as UserGenericAPIView.post, users should change it upon login.
+INITIAL_PASSWORD = '1234'
+
+CSV_TYPES = ('text/csv',)
+
+
+class UserImport:
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self.created = 0
+        self.failed = 0
+        self.errors = []  # <-- [{'row': ?, 'errors': {field: message}}]
+        self._batch = []  # <-- [(row number, Users)]
+        self._seen_emails = set()
+
+        # every role is resolved from this map, by id or by name.
+        self._roles = {}
+        for role_id, name in Role.objects.values_list('id', 'name'):
+            self._roles[str(role_id)] = role_id
+            self._roles[name.lower()] = role_id
+
+    ####################
+    ## Reading rows  ###
+    ####################
+
+    # a line that is not UTF-8 does not stop the import, the row it belongs to is rejected.
+    @staticmethod
+    def csv_rows(lines):
+        bad_lines = set()
+
+        def decoded():
+            for line_number, line in enumerate(lines, start=1):
+                try:
+                    yield line.decode('utf-8')
+                except UnicodeDecodeError:
+                    bad_lines.add(line_number)
+                    yield line.decode('utf-8', errors='replace')
+
+        reader = csv.DictReader(decoded())
+        last_line = reader.line_num
+        for number, row in enumerate(reader, start=1):
+            # a quoted value may span lines, the row is made of every line read since the last one.
+            if bad_lines.intersection(range(last_line + 1, reader.line_num + 1)):
+                row = None
+            last_line = reader.line_num
+            yield number, row
+
+    jsonl_rows = staticmethod(jsonl_rows)  # <-- look in: admin/importing.py.
+
+    def run(self, rows):
+        for number, row in rows:
+            self.add(number, row)
+        self.flush()
+        return self
+
+    ####################
+    ## Validation  #####
+    ####################
+
+    def validate(self, row):
+        if not isinstance(row, dict):
+            return None, {'row': 'Not a valid row.'}
+
+        errors = {}
+        values = {}
+
+        for field in ('first_name', 'last_name', 'email'):
+            value = (row.get(field) or '').strip()
+            if not value:
+                errors[field] = 'This field is required.'
+            elif len(value) > 200:
+                errors[field] = 'Ensure this field has no more than 200 characters.'
+            values[field] = value
+
+        if 'email' not in errors:
+            try:
+                validate_email(values['email'])
+            except ValidationError:
+                errors['email'] = 'Enter a valid email address.'
+
+            if values['email'].lower() in self._seen_emails:
+                errors['email'] = 'Duplicate email in this import.'
+
+        role = str(row.get('role_id', row.get('role')) or '').strip().lower()
+        values['role_id'] = self._roles.get(role)
+        if values['role_id'] is None:
+            errors['role_id'] = 'Unknown role.'
+
+        values['password'] = str(row.get('password') or INITIAL_PASSWORD)
+
+        return values, errors
+
+    def add(self, number, row):
+        values, errors = self.validate(row)
+
+        if errors:
+            self.reject(number, errors)
+            return
+
+        self._seen_emails.add(values['email'].lower())
+        self._batch.append((number, Users(**values)))
+
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def reject(self, number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'row': number, 'errors': errors})
+
+    ####################
+    ## Writing  ########
+    ####################
+
+    def flush(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+
+        # one query for the whole batch, instead of the serializer 'unique' check per user.
+        existing = set(email.lower() for email in Users.objects.filter(
+            email__in=[user.email for _, user in batch]).values_list('email', flat=True))
+
+        rows = []
+        for number, user in batch:
+            if user.email.lower() in existing:
+                self.reject(number, {'email': 'users with this email already exists.'})
+            else:
+                rows.append((number, user))
+
+        passwords = hashing_pool.map(
+            make_password, [user.password for _, user in rows])
+        for (_, user), password in zip(rows, passwords):
+            user.password = password
+
+        try:
+            with transaction.atomic():
+                Users.objects.bulk_create([user for _, user in rows])
+        except IntegrityError:
+            # someone else created one of those emails meanwhile.
+            for number, _ in rows:
+                self.reject(number, {'row': 'Could not be saved.'})
+            return
+
+        # bulk_create sends no post_save, the cached user counts are stale now.
+        invalidate_counts(Users)
+        self.created += len(rows)
+
+    def report(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+        }
@@ -0,0 +1,24 @@
+from admin.benchmarks import SerializerBenchmarkCommand
+from users.models import Users, Role
+from users.serializers import UserSerializer, UserValuesSerializer
+
+
+# python manage.py benchmark_user_serializers --rows 10000 (look in: admin/benchmarks.py).
+
+
+class Command(SerializerBenchmarkCommand):
+
+    def seed(self, rows):
+        role = Role.objects.create(name='benchmark')
+
+        # '!' <-- an unusable password, hashing is not what is measured here.
+        Users.objects.bulk_create((Users(
+            first_name='First %d' % number, last_name='Last %d' % number,
+            email='benchmark%d@benchmark.com' % number, password='!', role=role)
+            for number in range(rows)), batch_size=5000)
+
+    def cases(self):
+        return [
+            ('users', UserSerializer, UserValuesSerializer,
+             Users.objects.select_related('role').prefetch_related('role__permissions').order_by('id')),
+        ]
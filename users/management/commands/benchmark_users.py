@@ -0,0 +1,106 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from users.models import Users, Permission, Role
+from users.serializers import UserSerializer, UserValuesSerializer
+from users.views import UserGenericAPIView, filter_users
+
+
+# How many queries, and how long, it takes to serialize a page of users,
+#   'lazy' <-- Users.objects.all(), every user lazy loads its role and the role permissions.
+#   'prefetched' <-- the queryset UserGenericAPIView uses.
+# --filters <-- also how long the first page of each users list filter takes (look in: views.py).
+# --explain <-- and the query plan of each filter, to see which index it uses.
+# Everything is seeded inside a transaction that is rolled back at the end, nothing stays in the DB.
+#
+# python manage.py benchmark_users --sizes 1000 10000 100000 --page-size 100
+# python manage.py benchmark_users --sizes 1000000 --filters --explain
+
+
+FIRST_NAMES = ['Alice', 'Bob', 'Carol', 'Dave', 'Eve', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark query count and latency of the users list at different table sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int,
+                            default=[1000, 10000, 100000])
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--roles', type=int, default=5)
+        parser.add_argument('--filters', action='store_true')
+        parser.add_argument('--explain', action='store_true')
+
+    def handle(self, *args, **options):
+        self.stdout.write('%10s %12s %10s %8s %10s' % (
+            'users', 'queryset', 'page', 'queries', 'ms'))
+
+        for size in options['sizes']:
+            with transaction.atomic():
+                self.seed(size, options['roles'])
+
+                querysets = {
+                    'lazy': Users.objects.all().order_by('id'),
+                    'prefetched': UserGenericAPIView.queryset.all(),
+                }
+
+                for name, queryset in querysets.items():
+                    for page, offset in (('first', 0), ('last', max(size - options['page_size'], 0))):
+                        queries, ms = self.measure(
+                            queryset[offset:offset + options['page_size']])
+                        self.stdout.write('%10d %12s %10s %8d %10.1f' % (
+                            size, name, page, queries, ms))
+
+                if options['filters']:
+                    self.measure_filters(size, options)
+
+                transaction.set_rollback(True)
+
+    def seed(self, size, roles):
+        permissions = Permission.objects.bulk_create(
+            [Permission(name='benchmark_%d' % number) for number in range(8)])
+
+        seeded_roles = []
+        for number in range(roles):
+            role = Role.objects.create(name='benchmark %d' % number)
+            role.permissions.add(*permissions[:number + 1])
+            seeded_roles.append(role)
+
+        # '!' <-- an unusable password, hashing 100k passwords is not what is measured here.
+        Users.objects.bulk_create((Users(
+            first_name=FIRST_NAMES[number % len(FIRST_NAMES)], last_name='Last%07d' % number,
+            email='benchmark%d@benchmark.com' % number, password='!',
+            role=seeded_roles[number % roles]) for number in range(size)), batch_size=5000)
+
+    def measure(self, queryset):
+        # the seeding filled the (capped) queries log, start counting from an empty one.
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            UserSerializer(queryset, many=True).data
+            ms = (time.perf_counter() - start) * 1000
+
+        return len(queries), ms
+
+    def measure_filters(self, size, options):
+        filters = [
+            {'search': 'Last%07d' % (size // 2)},
+            {'search': 'Grace Last000'},
+            {'role': str(Role.objects.filter(name='benchmark 1').values_list('id', flat=True).first())},
+            {'email_prefix': 'benchmark%d' % (size // 3)},
+        ]
+
+        self.stdout.write('%10s %40s %8s %10s' % ('users', 'filter', 'rows', 'ms'))
+        for params in filters:
+            queryset = UserValuesSerializer.values(filter_users(
+                UserGenericAPIView.queryset.all(), params))[:options['page_size']]
+
+            start = time.perf_counter()
+            rows = len(UserValuesSerializer(queryset).data)
+            ms = (time.perf_counter() - start) * 1000
+
+            self.stdout.write('%10d %40s %8d %10.1f' % (size, params, rows, ms))
+            if options['explain']:
+                self.stdout.write(queryset.explain())
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_permission_alter_users_id_role_users_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='users',
+            name='security_stamp',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -21,9 +21,54 @@ class Users(AbstractUser):
 
     role = models.ForeignKey(Role, on_delete=models.SET_NULL, null=True)
 
+    # bumped whenever the password or the role of the user changes,
+    # tokens that carry an older stamp are no longer accepted (look in: authentication.py).
+    security_stamp = models.PositiveIntegerField(default=0)
+
     # set default field to None, in order to log in with password instead of username.
     # specify what will be used instead of the default username.
     username = None
     USERNAME_FIELD = 'email'
 
     REQUIRED_FIELDS = []
+
+    class Meta(AbstractUser.Meta):
+        # the users list can be filtered by name and by role (look in: views.py),
+        #   email is unique - so it already has an index of its own.
+        # role_id + id <-- a role filter comes back already sorted by id.
+        indexes = [
+            models.Index(fields=['first_name'], name='users_first_name_idx'),
+            models.Index(fields=['last_name'], name='users_last_name_idx'),
+            models.Index(fields=['role', 'id'], name='users_role_id_idx'),
+        ]
+
+    # remember the role the user was loaded with, so save() can tell if it changed.
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_role_id = instance.__dict__.get('role_id')
+        return instance
+
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        self.security_stamp += 1
+
+    def save(self, *args, **kwargs):
+        loaded_role_id = getattr(self, '_loaded_role_id', self.role_id)
+        if self.pk is not None and self.role_id != loaded_role_id:
+            self.security_stamp += 1
+
+        # check_password() re-hashes outdated passwords with save(update_fields=['password']),
+        #   the bumped stamp has to be saved along with it.
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'password' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'security_stamp'}
+
+        super().save(*args, **kwargs)
+        self._loaded_role_id = self.role_id
+
+
+# Revoked refresh tokens, a mirror of the in-memory denylist (look in: authentication.py).
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=32, unique=True)
+    expires_at = models.DateTimeField()
@@ -1,46 +1,110 @@
+import threading
+
 from rest_framework import permissions
 
 # This will enforce permissions for every action!
 
-from .serializers import UserSerializer
+from .models import Permission
+
+
+############################################################################################
+##  Role permissions registry  #############################################################
+############################################################################################
+
+# Every request used to serialize the whole user (role + all of its permissions)
+#   just to check a single permission name, that is a few queries on EVERY request.
+# Instead, the registry keeps a compiled frozenset of permission names per role:
+#   {role_id: (role_version, frozenset({'view_users', 'edit_users', ...}))}
+# A role version is bumped whenever the role or its permissions change (look in: signals.py),
+#   so an entry compiled for an older version is never used again.
+# Notice: the registry lives in the memory of a single process.
+
+
+class RolePermissionRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}  # <-- {role_id: version}
+        self._entries = {}  # <-- {role_id: (version, frozenset of names)}
+
+    def version(self, role_id):
+        return self._versions.get(role_id, 0)
+
+    # get the compiled permission names of a role, compile them once if needed.
+    def get(self, role_id):
+        if role_id is None:
+            return frozenset()
+
+        version = self.version(role_id)
+        entry = self._entries.get(role_id)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        names = frozenset(Permission.objects.filter(
+            role__id=role_id).values_list('name', flat=True))
+        return self.store(role_id, names, version)
+
+    # store already loaded names, useful when the permissions were prefetched anyway.
+    def store(self, role_id, names, version=None):
+        with self._lock:
+            if version is None:
+                version = self.version(role_id)
+
+            # the role changed while we were compiling, don't cache stale names.
+            if version == self.version(role_id):
+                self._entries[role_id] = (version, frozenset(names))
+
+        return frozenset(names)
+
+    # bump the role version, the next lookup will re-compile the permissions.
+    def invalidate(self, role_id):
+        with self._lock:
+            self._versions[role_id] = self.version(role_id) + 1
+            self._entries.pop(role_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+            self._entries.clear()
+
+
+role_permissions = RolePermissionRegistry()
+
+
+############################################################################################
+##  View Permissions  ######################################################################
+############################################################################################
 
 
 class ViewPermissions(permissions.BasePermission):
 
     # default class.
     def has_permission(self, request, view):
-        user_data = UserSerializer(request.user).data
-
-        # Testing.
-        # print('@@@ @@@ @@@ @@@ user_data=', user_data)
-        # print('### ### ### ### permission_object=', view.permission_object)
 
         """
         all the available permissions: view_users, edit_users, view_roles, edit_roles, ...
             go look at user_permission table if you are board,
-                all those can be found under: user_data['role']['permissions']
-        
+                all those are compiled per role by the 'role_permissions' registry.
+
         1.
-        for p in user_data['role']['permissions'] <-- for each role iterate all permissions.
-        
+        role_permissions.get(request.user.role_id) <-- the permission names of the user's role,
+            compiled once per role (and role version), so this costs no queries after the first time.
+
         2.
         'view_' + view.permission_object <-- some object that this function gets, lets assume 'users' for example,
             and we concatenate the view_,
                 so the result should be something like: view_users,
                     notice that this is a possible permission that actually exist in the user_permission table!
-        
+
         3.
-        p['name'] == 'view_' + view.permission_object <-- check if in p from 1. there is a 'name'
-            that equals to a 'view_Users' from 2.
-                meaning: check if a name of SOME role.permission is view_Users
-                    and of so, or if no, remember it into view_access.
-        
+        'view_' + view.permission_object in names <-- a frozenset lookup, O(1).
+
         the same goes for 'edit_access'.
         """
-        view_access = any(
-            p['name'] == 'view_' + view.permission_object for p in user_data['role']['permissions'])
-        edit_access = any(
-            p['name'] == 'edit_' + view.permission_object for p in user_data['role']['permissions'])
+        names = role_permissions.get(getattr(request.user, 'role_id', None))
+
+        view_access = 'view_' + view.permission_object in names
+        edit_access = 'edit_' + view.permission_object in names
 
         # for GET - a True from editing or viewing, both will work.
         if request.method == 'GET':
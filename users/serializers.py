@@ -1,7 +1,13 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Q
 from rest_framework import serializers
 from rest_framework import exceptions
 
+from admin.serializers import ValuesSerializer
 from .models import Users, Permission, Role
+from .hashing import set_password
+from .permissions import role_permissions
 
 
 ############################################################################################
@@ -11,9 +17,17 @@ from .models import Users, Permission, Role
 class RoleRelatedField(serializers.RelatedField):
 
     # from Users model outwards
+    # a page of users shares just a few roles, serialize each role once per page (not once per user),
+    #   together with prefetch_related('role__permissions') that makes a whole page cost no role queries.
     def to_representation(self, instance):
         # print('LOG: RoleRelatedField --> to_representation')
-        return RoleSerializer(instance).data
+        if not hasattr(self, '_represented_roles'):
+            self._represented_roles = {}
+
+        if instance.pk not in self._represented_roles:
+            self._represented_roles[instance.pk] = RoleSerializer(instance).data
+
+        return self._represented_roles[instance.pk]
 
     # into Users model
     def to_internal_value(self, data):
@@ -52,7 +66,8 @@ class UserSerializer(serializers.ModelSerializer):
         if Incoming_password is not None:
             # add the hashed password,
             # it should be hashed because of '.set_password', to the 'save to db' object.
-            instance.set_password(Incoming_password)
+            # the hashing itself runs on the password hashing pool (look in: hashing.py).
+            set_password(instance, Incoming_password)
 
         # send instance to the data base.
         instance.save()
@@ -68,7 +83,7 @@ class UserSerializer(serializers.ModelSerializer):
         password = validated_data.pop('password', None)
 
         if password is not None:
-            model_instance.set_password(password)
+            set_password(model_instance, password)
         model_instance.save()
 
         return super(UserSerializer, self).update(model_instance, validated_data)
@@ -143,3 +158,125 @@ class RoleSerializer(serializers.ModelSerializer):
             raise exceptions.APIException('Unacceptable permissions')
         instance.save()  # update the entry - with permissions.
         return instance
+
+    # only what changed is written: one bulk insert for the new permissions, one delete for the removed ones.
+    def update(self, instance, validated_data):
+        permissions = validated_data.pop('permissions', None)
+
+        with transaction.atomic():
+            instance = super(RoleSerializer, self).update(
+                instance, validated_data)
+
+            if permissions is not None:
+                update_role_permissions(
+                    {instance.pk: {'permissions': permissions}})
+
+        return instance
+
+
+############################################################################################
+##  Role permissions changes  ##############################################################
+############################################################################################
+
+# Change the permissions of many roles at once, changes = {role_id: change}, a change is one of:
+#   {'permissions': [ids]} <-- exactly those permissions, or
+#   {'add': [ids], 'remove': [ids]} <-- on top of what the role already has.
+# Writes straight to the role <--> permission (through) table:
+#   1 query for what all those roles have now,
+#   1 bulk insert for everything that was added,
+#   1 delete for everything that was removed.
+# Call it inside a transaction.
+
+
+def update_role_permissions(changes):
+    through = Role.permissions.through
+
+    try:
+        changes = {int(role_id): {key: set(int(permission_id) for permission_id in change.get(key) or ())
+                                  if change.get(key) is not None else None
+                                  for key in ('permissions', 'add', 'remove')}
+                   for role_id, change in changes.items()}
+    except (TypeError, ValueError):
+        raise exceptions.ValidationError('Unacceptable permissions')
+
+    wanted_ids = set()
+    for change in changes.values():
+        for key in ('permissions', 'add'):
+            wanted_ids |= change[key] or set()
+
+    if wanted_ids and Permission.objects.filter(id__in=wanted_ids).count() != len(wanted_ids):
+        raise exceptions.ValidationError('Unacceptable permissions')
+
+    current = defaultdict(set)
+    for role_id, permission_id in through.objects.filter(
+            role_id__in=list(changes)).values_list('role_id', 'permission_id'):
+        current[role_id].add(permission_id)
+
+    added = []
+    removed = Q()
+    changed_roles = set()
+
+    for role_id, change in changes.items():
+        if change['permissions'] is not None:
+            wanted = change['permissions']
+        else:
+            wanted = (current[role_id] | (change['add'] or set())) - (change['remove'] or set())
+
+        for permission_id in wanted - current[role_id]:
+            added.append(through(role_id=role_id, permission_id=permission_id))
+            changed_roles.add(role_id)
+
+        if current[role_id] - wanted:
+            removed |= Q(role_id=role_id, permission_id__in=current[role_id] - wanted)
+            changed_roles.add(role_id)
+
+    if added:
+        through.objects.bulk_create(added)
+    if removed:
+        through.objects.filter(removed).delete()
+
+    # writing to the through table directly sends no m2m_changed (look in: signals.py),
+    #   the changed roles are re-compiled once the changes are committed.
+    transaction.on_commit(lambda: [role_permissions.invalidate(role_id)
+                                   for role_id in changed_roles])
+
+    return changed_roles
+
+
+# a single change for update_role_permissions, as it comes from the bulk endpoint.
+class RolePermissionsChangeSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    permissions = serializers.ListField(
+        child=serializers.IntegerField(), required=False)
+    add = serializers.ListField(
+        child=serializers.IntegerField(), required=False)
+    remove = serializers.ListField(
+        child=serializers.IntegerField(), required=False)
+
+
+############################################################################################
+##  Read-only (list) Serializers  ##########################################################
+############################################################################################
+
+# Same output as UserSerializer, for big list pages (look in: admin/serializers.py).
+# A page of users shares just a few roles, each one is serialized once with the RoleSerializer.
+class UserValuesSerializer(ValuesSerializer):
+    serializer_class = UserSerializer
+    custom_fields = ('role',)
+    extra_columns = ('role',)  # <-- values('role') is the role id.
+
+    # every role of the page with its permissions in ONE query (role LEFT JOIN permissions),
+    #   the same dicts RoleSerializer makes ('id', 'permissions', 'name'), without a prefetch query.
+    def attach(self, rows):
+        role_ids = set(row['role'] for row in rows if row['role'] is not None)
+        roles = {}
+        for role_id, name, permission_id, permission_name in Role.objects.filter(
+                id__in=role_ids).order_by('id', 'permissions__id').values_list(
+                'id', 'name', 'permissions__id', 'permissions__name'):
+            role = roles.setdefault(role_id, {'id': role_id, 'permissions': [], 'name': name})
+            if permission_id is not None:
+                role['permissions'].append({'id': permission_id, 'name': permission_name})
+
+        return {
+            'role': {row['id']: roles.get(row['role']) for row in rows}
+        }
@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Permission, Role, Users
+from .authentication import security_stamps
+from .permissions import role_permissions
+
+
+# Keep the 'role_permissions' registry (look in: permissions.py) honest,
+#   any change to a role or to the permissions of a role bumps that role version.
+# The signals are sent inside the transaction, before the change is committed,
+#   bumping right away would let a concurrent request compile the OLD permissions under the NEW version,
+#   and that entry would never expire, so every bump waits for the commit (transaction.on_commit).
+
+
+@receiver(m2m_changed, sender=Role.permissions.through)
+def role_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    # role.permissions.add(...) <-- instance is a Role.
+    if not reverse:
+        invalidate_roles([instance.pk])
+        return
+
+    # permission.role_set.add(...) <-- instance is a Permission, pk_set holds role ids.
+    # on 'post_clear' pk_set is None, so there is no telling which roles lost it.
+    if pk_set is None:
+        transaction.on_commit(role_permissions.clear)
+        return
+
+    invalidate_roles(pk_set)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def role_changed(sender, instance, **kwargs):
+    invalidate_roles([instance.pk])
+
+
+# a renamed or deleted permission may belong to any role.
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def permission_changed(sender, instance, **kwargs):
+    transaction.on_commit(role_permissions.clear)
+
+
+def invalidate_roles(role_ids):
+    role_ids = list(role_ids)
+    transaction.on_commit(lambda: [role_permissions.invalidate(role_id) for role_id in role_ids])
+
+
+# a password / role change of a user bumps the security stamp (look in: models.py),
+#   tokens generated with the old stamp are rejected right away by this process.
+@receiver(post_save, sender=Users)
+def user_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        security_stamps.set(instance.pk, instance.security_stamp)
+
+
+@receiver(post_delete, sender=Users)
+def user_deleted(sender, instance, **kwargs):
+    security_stamps.set(instance.pk, None)
@@ -1,3 +1,913 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+import jwt
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import prefetch_related_objects
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from .models import Users, Permission, Role, RevokedToken
+from .hashing import PasswordHashingBusy, PasswordHashingPool
+from .authentication import generate_access_token, security_stamps, decoded_tokens, \
+    decode_refresh_token, decode_access_token, token_denylist, load_user, TokenPrincipal
+from .permissions import role_permissions, ViewPermissions
+from .serializers import UserSerializer, UserValuesSerializer, update_role_permissions
+
+
+class AuthenticatedQueryCountTest(TestCase):
+
+    # how many queries a single authenticated request is allowed to issue,
+    # if one of these goes up - something started lazy loading again.
+    expected_queries = {
+        '/api/user': 2,
+        '/api/users': 5,
+        '/api/users/{user_id}': 4,
+        '/api/roles': 4,
+        '/api/roles/{role_id}': 4,
+        '/api/permissions': 3,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        names = ['view_users', 'edit_users', 'view_roles', 'edit_roles']
+        permissions = [Permission.objects.create(name=name) for name in names]
+
+        cls.role = Role.objects.create(name='Admin')
+        cls.role.permissions.add(*permissions)
+        Role.objects.create(name='Viewer').permissions.add(permissions[0])
+
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com', role=cls.role)
+
+    def setUp(self):
+        # start every test from cold, process wide, caches.
+        role_permissions.clear()
+        security_stamps.clear()
+        decoded_tokens.clear()
+
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(self.user)
+
+    def test_query_count_per_endpoint(self):
+        for url, expected in self.expected_queries.items():
+            url = url.format(user_id=self.user.id, role_id=self.role.id)
+
+            with self.subTest(url=url), self.assertNumQueries(expected):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_authenticated_user_reuses_loaded_permissions(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/user')
+
+        self.assertEqual(
+            sorted(response.data['data']['permissions']),
+            ['edit_roles', 'edit_users', 'view_roles', 'view_users'])
+
+    def test_role_changed_while_loading_is_not_cached(self):
+        from . import authentication
+
+        def changed_meanwhile(*args):
+            prefetch_related_objects(*args)
+            role_permissions.invalidate(self.role.id)
+
+        with mock.patch.object(authentication, 'prefetch_related_objects', changed_meanwhile):
+            authentication.load_user(self.user.id)
+
+        self.assertNotIn(self.role.id, role_permissions._entries)
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        viewer = Role.objects.get(name='Viewer')
+        for number in range(10):
+            Users.objects.create(
+                first_name='User', last_name=str(number), email='user%d@admin.com' % number,
+                role=viewer if number % 2 else self.role)
+            Role.objects.create(name='Role %d' % number)
+
+        with self.assertNumQueries(self.expected_queries['/api/users']):
+            self.client.get('/api/users')
+
+        with self.assertNumQueries(self.expected_queries['/api/roles']):
+            self.client.get('/api/roles')
+
+
+@override_settings(JWT_SELF_CONTAINED_CLAIMS=True)
+class SelfContainedTokenTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Role.objects.create(name='Admin')
+        cls.admin.permissions.add(Permission.objects.create(name='view_roles'))
+        cls.viewer = Role.objects.create(name='Viewer')
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com', role=cls.admin)
+
+    def setUp(self):
+        role_permissions.clear()
+        security_stamps.clear()
+        decoded_tokens.clear()
+
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(self.user)
+
+    def user_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query for query in queries if '"%s"' % Users._meta.db_table in query['sql']]
+
+    def test_no_user_query(self):
+        self.assertEqual(len(self.user_queries('/api/roles')), 1)  # <-- the stamp, cached from now on.
+        self.assertEqual(self.user_queries('/api/roles'), [])
+
+    def test_permission_check_issues_no_query(self):
+        principal = TokenPrincipal(self.user.id, self.admin.id)
+        request = SimpleNamespace(user=principal, method='GET')
+        role_permissions.get(self.admin.id)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(principal and principal.is_authenticated)
+            self.assertEqual((principal.pk, principal.role_id), (self.user.id, self.admin.id))
+            self.assertTrue(ViewPermissions().has_permission(request, SimpleNamespace(permission_object='roles')))
+            self.assertFalse(ViewPermissions().has_permission(request, SimpleNamespace(permission_object='users')))
+
+        # anything else loads the user.
+        with self.assertNumQueries(2):
+            self.assertEqual(principal.email, 'admin@admin.com')
+
+    def test_password_change_rejects_the_token(self):
+        self.assertEqual(self.client.get('/api/roles').status_code, 200)
+
+        self.user.set_password('new secret')
+        self.user.save()
+        self.assertEqual(self.client.get('/api/roles').status_code, 403)
+
+    def test_role_change_rejects_the_token(self):
+        self.assertEqual(self.client.get('/api/roles').status_code, 200)
+
+        user = Users.objects.get(id=self.user.id)
+        user.role = self.viewer
+        user.save()
+        self.assertEqual(self.client.get('/api/roles').status_code, 403)
+
+    @override_settings(JWT_STAMP_CACHE_TTL=0)
+    def test_stamp_changed_by_another_process(self):
+        self.assertEqual(self.client.get('/api/roles').status_code, 200)
+
+        Users.objects.filter(id=self.user.id).update(security_stamp=self.user.security_stamp + 1)
+        self.assertEqual(self.client.get('/api/roles').status_code, 403)
+
+    def test_deleted_user_is_rejected(self):
+        self.assertEqual(self.client.get('/api/roles').status_code, 200)
+
+        Users.objects.get(id=self.user.id).delete()
+        self.assertEqual(self.client.get('/api/roles').status_code, 403)
+
+    def test_tokens_without_claims_load_the_user(self):
+        with override_settings(JWT_SELF_CONTAINED_CLAIMS=False):
+            self.client.cookies['jwt'] = generate_access_token(self.user)
+
+        with mock.patch('users.authentication.load_user', wraps=load_user) as loading:
+            self.assertEqual(self.client.get('/api/roles').status_code, 200)
+        loading.assert_called_once_with(self.user.id)
+
+    def test_claims_are_ignored_when_turned_off(self):
+        with override_settings(JWT_SELF_CONTAINED_CLAIMS=False), \
+                mock.patch('users.authentication.load_user', wraps=load_user) as loading:
+            self.assertEqual(self.client.get('/api/roles').status_code, 200)
+        loading.assert_called_once_with(self.user.id)
+
+
+class DecodedTokenCacheTest(TestCase):
+
+    def setUp(self):
+        decoded_tokens.clear()
+        self.addCleanup(decoded_tokens.clear)
+
+    def token(self, user_id=1, seconds=60):
+        return jwt.encode({'user_id': user_id, 'exp': int(time.time()) + seconds}, settings.SECRET_KEY,
+                          algorithm='HS256')
+
+    def test_hits_and_misses(self):
+        token = self.token()
+
+        with mock.patch('users.authentication.jwt.decode', wraps=jwt.decode) as decoding:
+            for _ in range(3):
+                self.assertEqual(decode_access_token(token)['user_id'], 1)
+
+        self.assertEqual(decoding.call_count, 1)
+        self.assertEqual(decoded_tokens.stats(), {'hits': 2, 'misses': 1, 'size': 1, 'maxsize': 1024})
+
+    @override_settings(JWT_DECODED_TOKEN_CACHE_SIZE=2)
+    def test_least_recently_used_is_evicted(self):
+        first, second, third = self.token(1), self.token(2), self.token(3)
+        decode_access_token(first)
+        decode_access_token(second)
+        decode_access_token(first)  # <-- second is the least recently used now.
+        decode_access_token(third)
+
+        self.assertEqual(decoded_tokens.stats()['size'], 2)
+        self.assertIsNone(decoded_tokens.get(second))
+        self.assertEqual(decoded_tokens.get(first)['user_id'], 1)
+        self.assertEqual(decoded_tokens.get(third)['user_id'], 3)
+
+    def test_evicted_at_exp(self):
+        token = self.token(seconds=10)
+        decode_access_token(token)
+
+        with mock.patch('users.authentication.time.time', return_value=time.time() + 11):
+            self.assertIsNone(decoded_tokens.get(token))
+        self.assertEqual(decoded_tokens.stats()['size'], 0)
+
+        # and an expired token is not cached in the first place, jwt.decode rejects it.
+        with self.assertRaises(jwt.ExpiredSignatureError):
+            decode_access_token(self.token(seconds=-1))
+        self.assertEqual(decoded_tokens.stats()['size'], 0)
+
+    @override_settings(JWT_DECODED_TOKEN_CACHE_SIZE=0)
+    def test_turned_off(self):
+        token = self.token()
+        decode_access_token(token)
+        decode_access_token(token)
+
+        self.assertEqual(decoded_tokens.stats(), {'hits': 0, 'misses': 2, 'size': 0, 'maxsize': 0})
+
+    def test_tampered_token_is_never_served(self):
+        token = self.token()
+        decode_access_token(token)
+
+        header, payload, signature = token.split('.')
+        forged_payload = jwt.utils.base64url_encode(json.dumps(
+            {'user_id': 2, 'exp': int(time.time()) + 60}).encode()).decode()
+        for tampered in ('.'.join([header, forged_payload, signature]),
+                         '.'.join([header, payload, signature[:-2] + ('AA' if signature[-2:] != 'AA' else 'BB')])):
+            with self.assertRaises(jwt.InvalidTokenError):
+                decode_access_token(tampered)
+
+        self.assertEqual(decoded_tokens.stats()['size'], 1)
+        self.assertEqual(decode_access_token(token)['user_id'], 1)
+
+
+class UserValuesSerializerParityTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        permissions = [Permission.objects.create(name=name)
+                       for name in ['view_users', 'edit_users']]
+        admin = Role.objects.create(name='Admin')
+        admin.permissions.add(*permissions)
+        viewer = Role.objects.create(name='Viewer')
+        viewer.permissions.add(permissions[0])
+
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com', role=admin)
+        Users.objects.create(first_name='Viewer', last_name='Viewer',
+                             email='viewer@admin.com', role=viewer)
+        Users.objects.create(first_name='Nobody', last_name='',
+                             email='nobody@admin.com', role=None)
+        Users.objects.create(first_name='Guest', last_name='Guest', email='guest@admin.com',
+                             role=Role.objects.create(name='Guest'))  # <-- a role without permissions.
+
+    def test_same_json_as_user_serializer(self):
+        queryset = Users.objects.order_by('id')
+
+        expected = JSONRenderer().render(UserSerializer(queryset, many=True).data)
+        actual = JSONRenderer().render(
+            UserValuesSerializer(UserValuesSerializer.values(queryset)).data)
+
+        self.assertEqual(actual, expected)
+
+    def test_same_json_from_the_list_endpoint(self):
+        client = APIClient()
+        client.cookies['jwt'] = generate_access_token(self.user)
+
+        expected = client.get('/api/users?serializer=model').content
+        actual = client.get('/api/users').content
+
+        self.assertEqual(actual, expected)
+
+
+class UserListFilterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = Role.objects.create(name='Admin')
+        admin.permissions.add(Permission.objects.create(name='view_users'))
+        cls.viewer = Role.objects.create(name='Viewer')
+
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com', role=admin)
+        Users.objects.create(first_name='Liz', last_name='Smith',
+                             email='liz@example.com', role=cls.viewer)
+        Users.objects.create(first_name='John', last_name='Smith',
+                             email='user9@example.com', role=cls.viewer)
+        Users.objects.create(first_name='Joanna', last_name='Lizard',
+                             email='user10@example.com', role=None)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(self.user)
+
+    def emails(self, query_params):
+        response = self.client.get('/api/users', query_params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(user['email'] for user in response.data['data'])
+
+    def test_search(self):
+        self.assertEqual(self.emails({'search': 'Liz'}),
+                         ['liz@example.com', 'user10@example.com'])
+        # case insensitive, and every word has to match.
+        self.assertEqual(self.emails({'search': 'liz SMI'}), ['liz@example.com'])
+        self.assertEqual(self.emails({'search': 'jo smith'}), ['user9@example.com'])
+
+    def test_search_with_the_last_code_point(self):
+        self.assertEqual(self.emails({'search': '\U0010ffff'}), [])
+        self.assertEqual(self.emails({'search': 'Liz\U0010ffff'}), [])
+
+    def test_role(self):
+        self.assertEqual(self.emails({'role': self.viewer.id}),
+                         ['liz@example.com', 'user9@example.com'])
+
+    def test_role_has_to_be_an_id(self):
+        response = self.client.get('/api/users', {'role': 'Viewer'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_email_prefix(self):
+        self.assertEqual(self.emails({'email_prefix': 'user9'}), ['user9@example.com'])
+        self.assertEqual(self.emails({'email_prefix': 'USER1'}), ['user10@example.com'])
+        self.assertEqual(self.emails({'email_prefix': 'user'}),
+                         ['user10@example.com', 'user9@example.com'])
+
+
+class UserListCountModeTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = Role.objects.create(name='Admin')
+        admin.permissions.add(Permission.objects.create(name='view_users'))
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com', role=admin)
+        Users.objects.bulk_create([Users(
+            first_name='User', last_name=str(number), email='user%d@example.com' % number)
+            for number in range(20)])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(self.user)
+
+    def get(self, query_params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users', dict({'page_size': 10}, **query_params))
+        self.assertEqual(response.status_code, 200)
+        counts = [query for query in queries if 'COUNT(' in query['sql']]
+        return response.data, len(counts)
+
+    def ids(self, data):
+        return [user['id'] for user in data['data']]
+
+    def test_exact(self):
+        data, counts = self.get({'page': 3})
+        self.assertEqual(data['meta']['count_mode'], 'exact')
+        self.assertEqual((data['meta']['last_page'], len(data['data']), counts), (3, 1, 1))
+
+    def test_cached_until_a_write_is_committed(self):
+        data, counts = self.get({'count_mode': 'cached'})
+        self.assertEqual((data['meta']['count_mode'], data['meta']['last_page'], counts), ('cached', 3, 1))
+        self.assertEqual(self.get({'count_mode': 'cached'})[1], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Users.objects.create(first_name='New', last_name='User', email='new@example.com')
+            # not committed yet, the cached count stays.
+            self.assertEqual(self.get({'count_mode': 'cached'})[1], 0)
+
+        data, counts = self.get({'count_mode': 'cached', 'page_size': 21})
+        self.assertEqual((data['meta']['last_page'], counts), (2, 1))
+        self.assertEqual(self.get({'count_mode': 'cached', 'page_size': 21})[1], 0)
+
+    def test_estimated_only_sets_last_page(self):
+        every_id = list(Users.objects.order_by('id').values_list('id', flat=True))
+
+        # statistics 4 rows short, page 2 and 3 still come whole.
+        with mock.patch('admin.pagination.estimated_count', return_value=17):
+            data, _ = self.get({'count_mode': 'estimated', 'page': 2})
+            self.assertEqual(self.ids(data), every_id[10:20])
+            self.assertEqual((data['meta']['last_page'], data['meta']['has_next']), (3, True))
+            data, _ = self.get({'count_mode': 'estimated', 'page': 3})
+            self.assertEqual(self.ids(data), every_id[20:])
+            self.assertEqual(data['meta']['last_page'], 3)
+
+        # way too short, last_page is never before a page that exists.
+        with mock.patch('admin.pagination.estimated_count', return_value=5):
+            data, _ = self.get({'count_mode': 'estimated', 'page': 2})
+            self.assertEqual((len(data['data']), data['meta']['last_page']), (10, 3))
+
+        # too many, the pages beyond the last row don't exist.
+        with mock.patch('admin.pagination.estimated_count', return_value=100):
+            data, _ = self.get({'count_mode': 'estimated'})
+            self.assertEqual(data['meta']['last_page'], 10)
+            response = self.client.get('/api/users', {'count_mode': 'estimated', 'page_size': 10, 'page': 5})
+            self.assertEqual(response.status_code, 404)
+
+    def test_has_next(self):
+        data, counts = self.get({'count_mode': 'has_next', 'page': 2})
+        self.assertEqual((data['meta']['last_page'], data['meta']['has_next'], counts), (None, True, 0))
+        data, _ = self.get({'count_mode': 'has_next', 'page': 3})
+        self.assertEqual((len(data['data']), data['meta']['has_next']), (1, False))
+
+    def test_view_and_settings_default(self):
+        with mock.patch('users.views.UserGenericAPIView.count_mode', 'has_next', create=True):
+            self.assertEqual(self.get({})[0]['meta']['count_mode'], 'has_next')
+        with override_settings(PAGINATION_COUNT_MODE='cached'):
+            self.assertEqual(self.get({})[0]['meta']['count_mode'], 'cached')
+        self.assertEqual(self.get({'count_mode': 'exact'})[0]['meta']['count_mode'], 'exact')
+
+    def test_unknown_count_mode(self):
+        response = self.client.get('/api/users', {'count_mode': 'guess'})
+        self.assertEqual(response.status_code, 400)
+
+
+class UserListCursorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = Role.objects.create(name='Admin')
+        admin.permissions.add(Permission.objects.create(name='view_users'))
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com', role=admin)
+        Users.objects.bulk_create([Users(
+            first_name='User', last_name=str(number), email='user%d@example.com' % number)
+            for number in range(10)])
+        cls.every_id = list(Users.objects.order_by('id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(self.user)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_next_and_previous_links(self):
+        pages = []
+        data = self.get('/api/users?pagination=cursor&page_size=3')
+        self.assertEqual((data['meta']['pagination'], data['meta']['previous']), ('cursor', None))
+        while True:
+            pages.append([user['id'] for user in data['data']])
+            if data['meta']['next'] is None:
+                break
+            data = self.get(data['meta']['next'])
+
+        # every user once, in order, no gaps and no repeats.
+        self.assertEqual(sum(pages, []), self.every_id)
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+
+        # and back again, from the last page.
+        back = []
+        while data['meta']['previous'] is not None:
+            data = self.get(data['meta']['previous'])
+            back.append([user['id'] for user in data['data']])
+        self.assertEqual(back, pages[-2::-1])
+
+    def test_page_numbers_override_the_view(self):
+        with mock.patch('users.views.UserGenericAPIView.pagination_mode', 'cursor', create=True):
+            self.assertEqual(self.get('/api/users')['meta']['pagination'], 'cursor')
+
+            data = self.get('/api/users?pagination=page&page_size=3&page=2')
+            self.assertNotIn('pagination', data['meta'])
+            self.assertEqual((data['meta']['last_page'], len(data['data'])), (4, 3))
+
+        # a ?cursor= alone is enough.
+        cursor = self.get('/api/users?pagination=cursor&page_size=3')['meta']['next'].split('?')[1]
+        self.assertEqual(self.get('/api/users?' + cursor)['meta']['pagination'], 'cursor')
+
+
+@override_settings(PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHING_MAX_PENDING=1)
+class PasswordHashingPoolTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com')
+        cls.user.set_password('secret')
+        cls.user.save()
+
+    def setUp(self):
+        # a pool of its own: 1 worker, 1 more may wait.
+        self.pool = PasswordHashingPool()
+        patcher = mock.patch('users.hashing.hashing_pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def block(self):
+        self.release.wait(5)
+
+    def login(self):
+        return APIClient().post(
+            '/api/login', {'email': 'admin@admin.com', 'password': 'secret'}, format='json')
+
+    def test_queue_depth_and_rejection(self):
+        running = self.pool.submit(self.block)
+        queued = self.pool.submit(self.block)
+
+        stats = self.pool.stats()
+        self.assertEqual((stats['running'] + stats['queue_depth'], stats['rejected']), (2, 0))
+
+        with self.assertRaises(PasswordHashingBusy):
+            self.pool.submit(self.block)
+        self.assertEqual(self.pool.stats()['rejected'], 1)
+
+        # a full pool rejects logins with a 503, instead of queueing them.
+        self.assertEqual(self.login().status_code, 503)
+
+        self.release.set()
+        running.result(), queued.result()
+        stats = self.pool.stats()
+        self.assertEqual((stats['running'], stats['queue_depth'], stats['completed']), (0, 0, 2))
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_login_during_an_import(self):
+        def hash_slowly(password):
+            self.block()
+            return password
+
+        imported = []
+        importing = threading.Thread(
+            target=lambda: imported.extend(self.pool.map(hash_slowly, ['a', 'b', 'c'])))
+        importing.start()
+        self.addCleanup(importing.join)
+        while self.pool.stats()['running'] == 0:
+            self.release.wait(0.01)
+
+        # the import holds 1 of the 2 slots, the login queues behind the hash that is running.
+        threading.Timer(0.1, self.release.set).start()
+        self.assertEqual(self.login().status_code, 200)
+
+        importing.join()
+        self.assertEqual(imported, ['a', 'b', 'c'])
+        self.assertEqual(self.pool.stats()['rejected'], 0)
+
+    @override_settings(PASSWORD_HASHING_TIMEOUT=0.05)
+    def test_timeout_is_a_503(self):
+        self.pool.submit(self.block)
+
+        self.assertEqual(self.login().status_code, 503)
+        # the timed out hash was dropped from the queue, its slot is free again.
+        self.assertEqual(self.pool.stats()['queue_depth'], 0)
+        self.pool.submit(self.block)
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher'])
+    def test_outdated_hash_is_upgraded_on_login(self):
+        Users.objects.filter(id=self.user.id).update(
+            password=hashers.make_password('secret', hasher='pbkdf2_sha256'))
+
+        self.assertEqual(self.login().status_code, 200)
+
+        password = Users.objects.get(id=self.user.id).password
+        self.assertTrue(password.startswith('md5$'))
+        self.assertTrue(hashers.check_password('secret', password))
+
+
+class RefreshTokenTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(name='Admin')
+        role.permissions.add(Permission.objects.create(name='view_users'))
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com', role=role)
+        cls.user.set_password('secret')
+        cls.user.save()
+
+    def setUp(self):
+        token_denylist.clear()
+        security_stamps.clear()
+        decoded_tokens.clear()
+
+        self.client = APIClient()
+        response = self.client.post(
+            '/api/login', {'email': 'admin@admin.com', 'password': 'secret'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def refresh(self, refresh_token=None):
+        if refresh_token is not None:
+            self.client.cookies['jwt_refresh'] = refresh_token
+        return self.client.post('/api/refresh')
+
+    def test_rotation(self):
+        first = self.client.cookies['jwt_refresh'].value
+
+        response = self.refresh()
+        self.assertEqual(response.status_code, 200)
+        second = self.client.cookies['jwt_refresh'].value
+        self.assertNotEqual(second, first)
+
+        # the new access token works, and so does the new refresh token - once.
+        self.assertEqual(self.client.get('/api/user').status_code, 200)
+        self.assertEqual(self.refresh().status_code, 200)
+
+    def test_reuse_is_rejected(self):
+        first = self.client.cookies['jwt_refresh'].value
+
+        self.assertEqual(self.refresh().status_code, 200)
+        self.assertEqual(self.refresh(first).status_code, 403)
+
+    def test_concurrent_reuse_gets_one_claim(self):
+        payload = decode_refresh_token(self.client.cookies['jwt_refresh'].value)
+
+        self.assertTrue(token_denylist.claim(payload['jti'], payload['exp']))
+        self.assertFalse(token_denylist.claim(payload['jti'], payload['exp']))
+
+    @override_settings(JWT_DENYLIST_DB_MIRROR=True)
+    def test_claim_across_processes(self):
+        payload = decode_refresh_token(self.client.cookies['jwt_refresh'].value)
+        token_denylist._load()
+        self.addCleanup(setattr, token_denylist, '_loaded', False)
+
+        # another process (its own in-memory denylist) claimed it first.
+        RevokedToken.objects.create(jti=payload['jti'], expires_at=timezone.now())
+
+        self.assertEqual(self.refresh().status_code, 403)
+
+    def test_refresh_cookie(self):
+        cookie = self.client.cookies['jwt_refresh']
+
+        self.assertEqual((cookie['path'], cookie['max-age'], cookie['httponly']), ('/api/refresh', 14 * 86400, True))
+        self.assertEqual(self.client.cookies['jwt']['path'], '/')
+
+        with override_settings(JWT_REFRESH_TOKEN_LIFETIME=1):
+            self.refresh()
+        self.assertEqual(self.client.cookies['jwt_refresh']['max-age'], 86400)
+
+    def test_logout_revokes_the_refresh_token(self):
+        refresh_token = self.client.cookies['jwt_refresh'].value
+
+        # where the browser sends the refresh cookie.
+        response = self.client.post('/api/refresh/logout')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.cookies['jwt_refresh']['path'], response.cookies['jwt_refresh']['max-age']),
+                         ('/api/refresh', 0))
+        self.assertEqual(self.refresh(refresh_token).status_code, 403)
+
+    def test_logout_clears_the_refresh_cookie(self):
+        response = self.client.post('/api/logout')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies['jwt_refresh']['path'], '/api/refresh')
+        self.assertEqual(response.cookies['jwt']['max-age'], 0)
+
+    def test_access_and_refresh_tokens_are_not_interchangeable(self):
+        access_token = self.client.cookies['jwt'].value
+        refresh_token = self.client.cookies['jwt_refresh'].value
+
+        self.assertEqual(self.refresh(access_token).status_code, 403)
+
+        self.client.cookies['jwt'] = refresh_token
+        self.assertEqual(self.client.get('/api/user').status_code, 403)
+
+
+class UserImportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        permissions = [Permission.objects.create(name=name) for name in ['view_users', 'edit_users']]
+        cls.role = Role.objects.create(name='Admin')
+        cls.role.permissions.add(*permissions)
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com', role=cls.role)
+
+    def setUp(self):
+        role_permissions.clear()
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(self.user)
+
+    def post(self, body, content_type='text/csv', batch_size=2):
+        response = self.client.generic(
+            'POST', '/api/users/import?batch_size=%d' % batch_size, body, content_type=content_type)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_per_row_errors(self):
+        report = self.post(
+            b'first_name,last_name,email,role\n'
+            b'Liz,Smith,liz@example.com,admin\n'
+            b',Smith,no-name@example.com,admin\n'
+            b'John,Smith,not-an-email,admin\n'
+            b'Jo\xff,Smith,latin1@example.com,admin\n'
+            b'Ann,Smith,ann@example.com,nobody\n'
+            b'"Multi\nLine",Smith,multi@example.com,%d\n' % self.role.id)
+
+        self.assertEqual((report['created'], report['failed']), (2, 4))
+        self.assertEqual(report['errors'], [
+            {'row': 2, 'errors': {'first_name': 'This field is required.'}},
+            {'row': 3, 'errors': {'email': 'Enter a valid email address.'}},
+            {'row': 4, 'errors': {'row': 'Not a valid row.'}},  # <-- not UTF-8.
+            {'row': 5, 'errors': {'role_id': 'Unknown role.'}},
+        ])
+        self.assertEqual(Users.objects.get(email='multi@example.com').first_name, 'Multi\nLine')
+
+    def test_duplicate_emails(self):
+        report = self.post(
+            b'{"first_name": "Liz", "last_name": "Smith", "email": "liz@example.com", "role": "Admin"}\n'
+            b'{"first_name": "Liz", "last_name": "Again", "email": "LIZ@example.com", "role": "Admin"}\n'
+            b'{"first_name": "Admin", "last_name": "Again", "email": "admin@admin.com", "role": "Admin"}\n'
+            b'not json\n', content_type='application/jsonl')
+
+        self.assertEqual((report['created'], report['failed']), (1, 3))
+        self.assertEqual(report['errors'], [
+            {'row': 2, 'errors': {'email': 'Duplicate email in this import.'}},
+            {'row': 3, 'errors': {'email': 'users with this email already exists.'}},
+            {'row': 4, 'errors': {'row': 'Not a valid row.'}},
+        ])
+
+    def test_batches(self):
+        body = b'first_name,last_name,email,role\n' + b''.join(
+            b'User,%d,user%d@example.com,admin\n' % (number, number) for number in range(5))
+
+        with CaptureQueriesContext(connection) as queries:
+            report = self.post(body, batch_size=2)
+
+        self.assertEqual((report['created'], report['failed']), (5, 0))
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT INTO "%s"' % Users._meta.db_table)]
+        self.assertEqual(len(inserts), 3)  # <-- 2 + 2 + 1.
+        self.assertTrue(Users.objects.get(email='user4@example.com').check_password('1234'))
+
+    def test_errors_are_capped(self):
+        body = b'first_name,last_name,email,role\n' + b'User,Last,bad,admin\n' * 5
+
+        with mock.patch('users.importing.MAX_ERRORS', 2):
+            report = self.post(body)
+
+        self.assertEqual((report['failed'], len(report['errors'])), (5, 2))
+
+    def test_unsupported_body(self):
+        response = self.client.generic('POST', '/api/users/import', b'{}', content_type='application/json')
+        self.assertEqual(response.status_code, 415)
+
+    def test_bad_batch_size(self):
+        response = self.client.generic(
+            'POST', '/api/users/import?batch_size=many', b'', content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+
+
+class RolePermissionRegistryTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.view_users = Permission.objects.create(name='view_users')
+        cls.edit_users = Permission.objects.create(name='edit_users')
+        cls.admin = Role.objects.create(name='Admin')
+        cls.admin.permissions.add(cls.view_users, cls.edit_users)
+        cls.viewer = Role.objects.create(name='Viewer')
+        cls.viewer.permissions.add(cls.view_users)
+
+    def setUp(self):
+        role_permissions.clear()
+        # compiled before every change below.
+        self.assertEqual(role_permissions.get(self.admin.id), {'view_users', 'edit_users'})
+        self.assertEqual(role_permissions.get(self.viewer.id), {'view_users'})
+
+    def test_add(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.viewer.permissions.add(self.edit_users)
+        self.assertEqual(role_permissions.get(self.viewer.id), {'view_users', 'edit_users'})
+
+    def test_remove(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.permissions.remove(self.edit_users)
+        self.assertEqual(role_permissions.get(self.admin.id), {'view_users'})
+
+    def test_clear(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.permissions.clear()
+        self.assertEqual(role_permissions.get(self.admin.id), frozenset())
+        self.assertEqual(role_permissions.get(self.viewer.id), {'view_users'})
+
+    def test_reverse_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.edit_users.role_set.add(self.viewer)
+        self.assertEqual(role_permissions.get(self.viewer.id), {'view_users', 'edit_users'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.edit_users.role_set.remove(self.admin)
+        self.assertEqual(role_permissions.get(self.admin.id), {'view_users'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.view_users.role_set.clear()
+        self.assertEqual(role_permissions.get(self.admin.id), frozenset())
+        self.assertEqual(role_permissions.get(self.viewer.id), {'edit_users'})
+
+    def test_permission_renamed_and_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.edit_users.name = 'edit_roles'
+            self.edit_users.save()
+        self.assertEqual(role_permissions.get(self.admin.id), {'view_users', 'edit_roles'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.edit_users.delete()
+        self.assertEqual(role_permissions.get(self.admin.id), {'view_users'})
+
+    def test_old_permissions_compiled_before_the_commit_are_not_kept(self):
+        version = role_permissions.version(self.admin.id)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.admin.permissions.remove(self.edit_users)
+            # not committed yet <-- the version is untouched, whatever a concurrent request
+            #   compiles now is stored under the old version.
+            self.assertEqual(role_permissions.version(self.admin.id), version)
+            role_permissions.store(self.admin.id, {'view_users', 'edit_users'}, version)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(role_permissions.get(self.admin.id), {'view_users'})
+
+
+class RoleBulkUpdateTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.permissions = [Permission.objects.create(name=name) for name in [
+            'view_users', 'edit_users', 'view_roles', 'edit_roles']]
+        cls.admin = Role.objects.create(name='Admin')
+        cls.admin.permissions.add(*cls.permissions)
+        cls.viewer = Role.objects.create(name='Viewer')
+        cls.viewer.permissions.add(cls.permissions[0])
+        cls.user = Users.objects.create(
+            first_name='Admin', last_name='Admin', email='admin@admin.com', role=cls.admin)
+
+    def setUp(self):
+        role_permissions.clear()
+        self.client = APIClient()
+        self.client.cookies['jwt'] = generate_access_token(self.user)
+
+    def put(self, changes):
+        return self.client.put('/api/roles/bulk', changes, format='json')
+
+    def names(self, role):
+        return sorted(role.permissions.values_list('name', flat=True))
+
+    def test_one_insert_and_one_delete(self):
+        view_users, edit_users, view_roles, edit_roles = [p.id for p in self.permissions]
+        changes = {
+            self.viewer.id: {'add': [edit_users, view_roles], 'remove': [view_users]},
+            self.admin.id: {'permissions': [view_users, edit_users, view_roles, edit_roles]},  # <-- no change.
+        }
+        table = Role.permissions.through._meta.db_table
+
+        # permissions exist, what the roles have now, the insert, the delete.
+        with self.assertNumQueries(4), CaptureQueriesContext(connection) as queries:
+            update_role_permissions(changes)
+
+        writes = [query['sql'].split(' ')[0] for query in queries if table in query['sql']
+                  and not query['sql'].startswith('SELECT')]
+        self.assertEqual(writes, ['INSERT', 'DELETE'])
+        self.assertEqual(self.names(self.viewer), ['edit_users', 'view_roles'])
+
+    def test_bad_permission_rolls_back_the_whole_batch(self):
+        response = self.put([
+            {'id': self.viewer.id, 'add': [self.permissions[1].id]},
+            {'id': self.admin.id, 'remove': [self.permissions[0].id], 'add': [999]},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.names(self.viewer), ['view_users'])
+        self.assertEqual(len(self.names(self.admin)), 4)
+
+    def test_duplicate_roles_are_rejected(self):
+        response = self.put([
+            {'id': self.viewer.id, 'add': [self.permissions[1].id]},
+            {'id': self.viewer.id, 'remove': [self.permissions[0].id]},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.names(self.viewer), ['view_users'])
+
+    def test_registry_is_invalidated_after_commit(self):
+        self.assertEqual(role_permissions.get(self.viewer.id), {'view_users'})
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.put([{'id': self.viewer.id, 'permissions': [self.permissions[2].id]}])
+            self.assertEqual(response.status_code, 202)
+            # not committed yet, the compiled permissions are still the old ones.
+            self.assertEqual(role_permissions.get(self.viewer.id), {'view_users'})
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(role_permissions.get(self.viewer.id), {'view_roles'})
+        self.assertEqual(response.json()['data'], [{
+            'id': self.viewer.id, 'permissions': [{'id': self.permissions[2].id, 'name': 'view_roles'}],
+            'name': 'Viewer'}])
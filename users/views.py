@@ -5,20 +5,33 @@ from rest_framework import exceptions, viewsets, status
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import GenericAPIView
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 
 from .models import Users, Permission, Role
-from .serializers import UserSerializer, PermissionSerializer, RoleSerializer
-from .authentication import JWTAuthentication, generate_access_token
+from .serializers import UserSerializer, UserValuesSerializer, PermissionSerializer, RoleSerializer, \
+    RolePermissionsChangeSerializer, update_role_permissions
+from .authentication import JWTAuthentication, generate_access_token, generate_refresh_token, decode_refresh_token, \
+    decoded_tokens, token_denylist
+from .hashing import check_password, hashing_pool
+from .importing import UserImport, CSV_TYPES
+from admin import importing
+from admin.importing import JSONL_TYPES
 from admin.pagination import CustomPagination
+from admin.serializers import ValuesListModelMixin
 from .permissions import ViewPermissions
 
 # Views on this .py will enables endpoint users to:
 # Register new user into the DB.
 # Login a user and jet a JWT cookie.
+# Refresh the JWT cookie, without logging in again.
 # Display all known users.
+# Search users by name / email prefix, filter them by role.
 # Display specific user.
 # Update specific user.
 # Delete specific user.
+# Import many users at once from a CSV / JSONL body.
 # Logout a user: endpoint user looses the JWT cookie.
 # Display all existing permissions.
 # Display all existing roles.
@@ -26,6 +39,8 @@ from .permissions import ViewPermissions
 # Create specific role.
 # Update specific role.
 # Delete specific role.
+# Change the permissions of many roles at once.
+# Display process metrics: password hashing queue, decoded token cache.
 
 
 ############################################################################################
@@ -75,16 +90,13 @@ def login(request):
 
     # check if a known user provided correct password.
     # remember that we hold the hashed version, so we can'r compare directly.
-    if not user.check_password(incoming_password):
+    # the hashing runs on the password hashing pool (look in: hashing.py).
+    if not check_password(user, incoming_password):
         raise exceptions.AuthenticationFailed('Incorrect password!')
 
     # create new access authorization
-    token = generate_access_token(user)
-
-    # set new cookie with encrypted access authorization
-    # it doesn't work as a single line.
     response = Response()
-    response.set_cookie(key='jwt', value=token, httponly=True)
+    token = set_token_cookies(response, user)
     print(response)
 
     # add some data for the response, could be a simple 'status': 'success'.
@@ -95,6 +107,58 @@ def login(request):
     return response
 
 
+# the refresh cookie is only sent where it is needed, not with every /api/* request (look in: urls.py).
+REFRESH_COOKIE_PATH = '/api/refresh'
+
+
+# set new cookies with encrypted access authorization, and the refresh token that renews it.
+# max_age <-- the refresh cookie lives as long as the token, a session cookie would be gone with the browser.
+def set_token_cookies(response, user):
+    token = generate_access_token(user)
+    response.set_cookie(key='jwt', value=token, httponly=True)
+    response.set_cookie(
+        key='jwt_refresh', value=generate_refresh_token(user), httponly=True,
+        max_age=getattr(settings, 'JWT_REFRESH_TOKEN_LIFETIME', 14) * 24 * 60 * 60, path=REFRESH_COOKIE_PATH)
+    return token
+
+
+############################################################################################
+##  Refresh  ###############################################################################
+############################################################################################
+
+
+@api_view(['POST'])
+def refresh(request):
+    incoming_token = request.COOKIES.get('jwt_refresh')
+
+    if not incoming_token:
+        raise exceptions.AuthenticationFailed('un-authenticated')
+
+    # checks the signature, expiration and the denylist - no queries.
+    payload = decode_refresh_token(incoming_token)
+
+    # the only query: a single primary key lookup, no password hashing.
+    user = Users.objects.only('id', 'role_id', 'security_stamp').filter(
+        id=payload['user_id']).first()
+
+    # password or role changed after this refresh token was generated.
+    if user is None or user.security_stamp != payload['stamp']:
+        raise exceptions.AuthenticationFailed('un-authenticated')
+
+    # rotation: this refresh token can not be used again.
+    # claimed atomically, of two requests racing with the same token only one gets new tokens.
+    if not token_denylist.claim(payload['jti'], payload['exp']):
+        raise exceptions.AuthenticationFailed('un-authenticated')
+
+    response = Response()
+    token = set_token_cookies(response, user)
+    response.data = {  # type: ignore
+        'data': token
+    }
+
+    return response
+
+
 ############################################################################################
 ##  Get Users  #############################################################################
 ############################################################################################
@@ -141,9 +205,21 @@ class AuthenticatedUser(APIView):
 
 
 @api_view(['POST'])
-def logout(_):
+def logout(request):
+    incoming_token = request.COOKIES.get('jwt_refresh')
+
+    # the refresh token could outlive the cookie (if it was copied), revoke it.
+    # the browser only sends it to /api/refresh/logout (REFRESH_COOKIE_PATH), /api/logout only clears the cookies.
+    if incoming_token:
+        try:
+            payload = decode_refresh_token(incoming_token)
+            token_denylist.revoke(payload['jti'], payload['exp'])
+        except exceptions.AuthenticationFailed:
+            pass
+
     response = Response()
     response.delete_cookie(key='jwt')
+    response.delete_cookie(key='jwt_refresh', path=REFRESH_COOKIE_PATH)
     response.data = {
         'data': 'logged out'
     }
@@ -188,8 +264,10 @@ class RoleViewSet(viewsets.ViewSet):
     permission_object = 'roles'  # <-- a permission from users_permissions table
 
     # get a list of objects
+    # prefetch_related('permissions') <-- all the permissions of all the roles, in one query.
     def list(self, request):
-        serializer = RoleSerializer(Role.objects.all(), many=True)
+        serializer = RoleSerializer(
+            Role.objects.prefetch_related('permissions'), many=True)
         return Response({
             'data': serializer.data
         })
@@ -205,7 +283,7 @@ class RoleViewSet(viewsets.ViewSet):
 
     # get single object
     def retrieve(self, request, pk=None):
-        role = Role.objects.filter(id=pk).first()
+        role = Role.objects.prefetch_related('permissions').filter(id=pk).first()
         if role is not None:
             serializer = RoleSerializer(role)
             return Response({
@@ -237,18 +315,73 @@ class RoleViewSet(viewsets.ViewSet):
 
         raise exceptions.APIException("pk doesn't exists")
 
+    # change the permissions of many roles, in a single transaction.
+    # [{"id": 1, "permissions": [1, 2]}, {"id": 2, "add": [3], "remove": [4]}, ...]
+    def bulk_update(self, request):
+        serializer = RolePermissionsChangeSerializer(
+            data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        # a role twice in the same request, which change wins is anybody's guess - refuse it.
+        role_ids = [change['id'] for change in serializer.validated_data]
+        if len(set(role_ids)) != len(role_ids):
+            raise exceptions.ValidationError({'id': 'every role may appear only once'})
+
+        changes = {change['id']: change for change in serializer.validated_data}
+        roles = Role.objects.filter(id__in=list(changes))
+        if roles.count() != len(changes):
+            raise exceptions.APIException("pk doesn't exists")
+
+        with transaction.atomic():
+            update_role_permissions(changes)
+
+        return Response({
+            'data': RoleSerializer(roles.prefetch_related('permissions'), many=True).data
+        }, status=status.HTTP_202_ACCEPTED)
+
 
 ############################################################################################
 ##  Users  #################################################################################
 ############################################################################################
 
+# Filters of the users list:
+#   ?search=jo sm <-- every word has to be the beginning of the first name, last name or email.
+#   ?role=2 <-- users of that role.
+#   ?email_prefix=jo <-- emails that start with 'jo'.
+# A prefix is matched as LIKE 'jo%' (istartswith), never as LIKE '%jo%',
+#   so the indexes on first_name / last_name / email can be used (look in: models.py).
+# istartswith is case insensitive on every database, and unlike a hand made range
+#   it does not depend on the collation or on what comes after the last character.
+def prefix_filter(field, prefix):
+    return Q(**{field + '__istartswith': prefix})
+
+
+def filter_users(queryset, query_params):
+    search = query_params.get('search', '').split()
+    for word in search:
+        queryset = queryset.filter(prefix_filter('first_name', word) | prefix_filter(
+            'last_name', word) | prefix_filter('email', word))
+
+    role = query_params.get('role')
+    if role:
+        if not role.isdigit():
+            raise exceptions.ValidationError('role must be a role id')
+        queryset = queryset.filter(role_id=int(role))
+
+    email_prefix = query_params.get('email_prefix')
+    if email_prefix:
+        queryset = queryset.filter(prefix_filter('email', email_prefix))
+
+    return queryset
+
+
 # TODO: The password management here is lazy and illogical, but
 # This is what the Udemy instructor implemented.
 # change this later!
 
 class UserGenericAPIView(
         GenericAPIView,
-        mixins.ListModelMixin,
+        ValuesListModelMixin,
         mixins.RetrieveModelMixin,
         mixins.CreateModelMixin,
         mixins.UpdateModelMixin,
@@ -260,12 +393,21 @@ class UserGenericAPIView(
     permission_classes = [IsAuthenticated & ViewPermissions]
     permission_object = 'users'  # <-- a permission from users_permissions table
     pagination_class = CustomPagination
+    cursor_ordering = 'id'  # <-- the column ?pagination=cursor walks over.
 
     # link to the DB, map all users to this object.
     # .order_by('id') <-- without order, pagination MAY not work:
     #   https://stackoverflow.com/questions/44033670/python-django-rest-framework-unorderedobjectlistwarning
-    queryset = Users.objects.all().order_by('id')
+    # select_related / prefetch_related <-- the roles and their permissions of a whole page,
+    #   come with 2 queries, instead of 2 queries per user.
+    queryset = Users.objects.select_related('role').prefetch_related(
+        'role__permissions').order_by('id')
     serializer_class = UserSerializer  # <-- this is used to serialize users.
+    values_serializer_class = UserValuesSerializer  # <-- lists use this one, look in: admin/serializers.py
+
+    # called by .list() (and .retrieve()), look above.
+    def filter_queryset(self, queryset):
+        return filter_users(queryset, self.request.query_params)
 
     def get(self, request, pk=None):
         # if primary key isn't None - get specific user.
@@ -334,6 +476,37 @@ class UserGenericAPIView(
         self.destroy(request, pk).data
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+############################################################################################
+##  Users Import  ##########################################################################
+############################################################################################
+
+# POST a CSV (Content-Type: text/csv) or JSONL (Content-Type: application/jsonl) body,
+#   ?batch_size= <-- how many users are written per INSERT, look in: importing.py
+
+
+class UserImportAPIView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated & ViewPermissions]
+    permission_object = 'users'  # <-- a permission from users_permissions table
+
+    def post(self, request):
+        batch_size = importing.batch_size(request, getattr(settings, 'USER_IMPORT_BATCH_SIZE', 500))
+        lines = importing.body_lines(request)
+
+        user_import = UserImport(batch_size=batch_size)
+
+        if request.content_type.startswith(CSV_TYPES):
+            user_import.run(user_import.csv_rows(lines))
+        elif request.content_type.startswith(JSONL_TYPES):
+            user_import.run(user_import.jsonl_rows(lines))
+        else:
+            raise exceptions.UnsupportedMediaType(request.content_type)
+
+        return Response({
+            'data': user_import.report()
+        })
+
+
 ############################################################################################
 ##  Profile  ###############################################################################
 ############################################################################################
@@ -383,3 +556,24 @@ class ProfilePasswordAPIView(APIView):
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(serializer.data)
+
+
+############################################################################################
+##  Metrics  ###############################################################################
+############################################################################################
+
+# What this process is busy with, how deep the password hashing queue is, how well the token cache does.
+
+
+class MetricsAPIView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated & ViewPermissions]
+    permission_object = 'users'  # <-- a permission from users_permissions table
+
+    def get(self, request):
+        return Response({
+            'data': {
+                'password_hashing': hashing_pool.stats(),
+                'decoded_tokens': decoded_tokens.stats(),
+            }
+        })